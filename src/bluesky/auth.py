@@ -1,6 +1,10 @@
+import os
+import time
+import asyncio
 import logging
+from datetime import timedelta
 from typing import Optional
-from atproto_client import Client, Session, SessionEvent
+from atproto_client import AsyncClient, Client, Session, SessionEvent
 
 # Configure logging
 logging.basicConfig(
@@ -13,48 +17,95 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def get_session() -> Optional[str]:
+# Sessions whose access token expires sooner than this are refreshed
+# before use; atproto itself refreshes this far ahead of expiry
+REFRESH_MARGIN = timedelta(minutes=15)
+
+# XRPC base URL of the PDS to log in to, e.g. a mock PDS
+# (src/scripts/mock_pds.py); atproto's default, bsky.social, when unset
+PDS_URL = os.getenv('BLUESKY_PDS_URL')
+
+SESSION_FRESH = 'fresh'
+SESSION_STALE = 'stale'
+SESSION_EXPIRED = 'expired'
+
+def session_file(username: Optional[str] = None) -> str:
+    """Path of the saved session, one file per account when a username is given"""
+    return f'session_{username}.txt' if username else 'session.txt'
+
+def get_session(username: Optional[str] = None) -> Optional[str]:
     """Retrieve saved session from file if it exists"""
     try:
-        with open('session.txt', encoding='UTF-8') as f:
+        with open(session_file(username), encoding='UTF-8') as f:
             return f.read()
     except FileNotFoundError:
         return None
 
-def save_session(session_string: str) -> None:
+def save_session(session_string: str, username: Optional[str] = None) -> None:
     """Save session string to file"""
-    with open('session.txt', 'w', encoding='UTF-8') as f:
+    with open(session_file(username), 'w', encoding='UTF-8') as f:
         f.write(session_string)
 
-def on_session_change(event: SessionEvent, session: Session) -> None:
+def on_session_change(event: SessionEvent, session: Session, username: Optional[str] = None) -> None:
     """Handle session change events"""
     logger.info(f'Session changed: {event}, {session.handle}')
     if event in (SessionEvent.CREATE, SessionEvent.REFRESH):
         logger.info('Saving changed session')
-        save_session(session.export())
+        if username:
+            save_session(session.export(), username)
+        else:
+            save_session(session.export())
+
+def session_status(session_string: str, now: Optional[float] = None) -> Optional[str]:
+    """
+    Classify a saved session by the expiry of its tokens: fresh if the
+    access token is good for more than REFRESH_MARGIN, stale if only the
+    refresh token is still valid, expired if neither is. Returns None if
+    the session string cannot be read.
+    """
+    try:
+        session = Session.decode(session_string)
+        access_exp = session.access_jwt_payload.exp
+        refresh_exp = session.refresh_jwt_payload.exp
+    except Exception:
+        return None
+    now = time.time() if now is None else now
+    if access_exp and access_exp - REFRESH_MARGIN.total_seconds() > now:
+        return SESSION_FRESH
+    if refresh_exp and refresh_exp > now:
+        return SESSION_STALE
+    return SESSION_EXPIRED
 
 def authenticate(username: str, password: str) -> Client:
     """
-    Authenticate with Bluesky using session reuse if available
-    
+    Authenticate with Bluesky, reusing the account's saved session if
+    available. A fresh session is imported without any request, a stale
+    one is refreshed from its refresh token, and createSession is only
+    called when neither works.
+
     Args:
         username: Bluesky username
         password: Bluesky password from environment variable
-    
+
     Returns:
         Client: Authenticated Bluesky client
     """
     logger.info(f"authenticate: Starting for {username}")
     try:
-        client = Client()
+        client = Client(PDS_URL)
         logger.info("authenticate: Client created")
-        client.on_session_change(on_session_change)
+        client.on_session_change(lambda event, session: on_session_change(event, session, username))
 
-        session_string = get_session()
-        if session_string:
+        session_string = get_session(username)
+        status = session_status(session_string) if session_string else SESSION_EXPIRED
+        if status != SESSION_EXPIRED:
             logger.info('Reusing existing session')
             try:
-                client.login(session_string=session_string)
+                if status == SESSION_FRESH:
+                    client.login(session_string=session_string, fetch_bsky_profile=False)
+                else:
+                    # The first request after the import refreshes the access token
+                    client.login(session_string=session_string)
             except Exception as e:
                 logger.info(f'Session reuse failed: {e}. Creating new session.')
                 client.login(username, password)
@@ -65,4 +116,106 @@ def authenticate(username: str, password: str) -> Client:
         return client
     except Exception as e:
         logger.error(f"authenticate: Failed: {e}")
-        raise
\ No newline at end of file
+        raise
+
+async def authenticate_async(username: str, password: str) -> AsyncClient:
+    """
+    Authenticate an async client the same way as authenticate. Each
+    account keeps its own session file, so several accounts can be logged
+    in at the same time.
+
+    Args:
+        username: Bluesky username
+        password: Bluesky password from environment variable
+
+    Returns:
+        AsyncClient: Authenticated async Bluesky client
+    """
+    logger.info(f"authenticate_async: Starting for {username}")
+    try:
+        client = AsyncClient(PDS_URL)
+        client.on_session_change(lambda event, session: on_session_change(event, session, username))
+
+        session_string = get_session(username)
+        status = session_status(session_string) if session_string else SESSION_EXPIRED
+        if status != SESSION_EXPIRED:
+            logger.info(f'Reusing existing session for {username}')
+            try:
+                if status == SESSION_FRESH:
+                    await client.login(session_string=session_string, fetch_bsky_profile=False)
+                else:
+                    # The first request after the import refreshes the access token
+                    await client.login(session_string=session_string)
+            except Exception as e:
+                logger.info(f'Session reuse failed: {e}. Creating new session.')
+                await client.login(username, password)
+        else:
+            logger.info(f'Creating new session for {username}')
+            await client.login(username, password)
+
+        return client
+    except Exception as e:
+        logger.error(f"authenticate_async: Failed: {e}")
+        raise
+
+def session_did(client) -> Optional[str]:
+    """DID of the account a client is logged in as, if it can be read"""
+    try:
+        return Session.decode(client.export_session_string()).did
+    except Exception:
+        return None
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+class SessionPool:
+    """
+    Authenticated clients of all accounts, keyed by username and DID, so
+    each account logs in once per process and never gets another
+    account's client. Sessions are saved per account whenever atproto
+    creates or refreshes them.
+
+    An async client's connections belong to the event loop that first used
+    it, and asyncio.run closes its loop when it returns, so async clients
+    are only reused within the loop they were made in. Another loop gets a
+    new client from the saved session, without a request while it is fresh.
+    """
+
+    def __init__(self):
+        self.clients = {}
+        self.async_clients = {}  # username -> (event loop, client)
+        self.dids = {}
+
+    def _add(self, username, client):
+        did = session_did(client)
+        if did:
+            self.dids[did] = username
+        return client
+
+    def get(self, account: str, is_async: bool = False):
+        """Return the pooled client for a username or DID, or None; async clients only in their own loop"""
+        username = self.dids.get(account, account)
+        if not is_async:
+            return self.clients.get(username)
+        loop, client = self.async_clients.get(username, (None, None))
+        return client if loop is not None and loop is _running_loop() else None
+
+    def client(self, username: str, password: str) -> Client:
+        """Return the account's client, logging in on first use"""
+        if username not in self.clients:
+            self.clients[username] = self._add(username, authenticate(username, password))
+        return self.clients[username]
+
+    async def async_client(self, username: str, password: str) -> AsyncClient:
+        """Return the account's async client for the running event loop, logging in on first use in it"""
+        client = self.get(username, is_async=True)
+        if client is None:
+            client = self._add(username, await authenticate_async(username, password))
+            # A client of a loop that has finished is dropped; it can no longer be closed
+            self.async_clients[username] = (asyncio.get_running_loop(), client)
+        return client
+
+session_pool = SessionPool()
@@ -0,0 +1,132 @@
+import logging
+from typing import List, NamedTuple
+from src.bluesky.outbox import next_tid, post_record, post_uri, record_cid
+from src.bluesky.templates import PostTemplate, compile_template, facet_models, fits
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bluesky-event-sync.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Defaults of a website's "digest" settings in config.json. A run with at
+# least min_events due events of the site posts them as a digest: a root
+# post and replies listing one event per line, each title linking to its
+# event page.
+DIGEST_MIN_EVENTS = 4
+DIGEST_HEADING = 'Coming up: {count} events'
+DIGEST_LINE_TEMPLATE = '{title} ({start:%a %b %d, %I:%M %p})'
+
+class DigestPost(NamedTuple):
+    text: str
+    facets: list
+    events: list
+
+class DigestSettings(NamedTuple):
+    min_events: int
+    heading: str
+    line_template: PostTemplate
+    thread: bool
+
+def digest_settings(website):
+    """The website's digest settings, or None if it posts every event on its own"""
+    settings = website.get('digest')
+    if not settings:
+        return None
+    if settings is True:
+        settings = {}
+    return DigestSettings(
+        min_events=int(settings.get('min_events', DIGEST_MIN_EVENTS)),
+        heading=settings.get('heading', DIGEST_HEADING),
+        line_template=compile_template(settings.get('line_template', DIGEST_LINE_TEMPLATE)),
+        # Without a thread the posts are separate top-level posts
+        thread=bool(settings.get('thread', True))
+    )
+
+def digest_sites(config):
+    """DigestSettings of the config's websites that post digests, by site name"""
+    sites = {}
+    for website in config['websites']:
+        settings = digest_settings(website)
+        if settings:
+            sites[website['name']] = settings
+    return sites
+
+def split_digests(events, digests):
+    """
+    Separate the events that go out in digests from those posted one by
+    one. digests maps site names to their DigestSettings.
+
+    Returns:
+        tuple: (groups, singles) where groups is a list of (settings,
+        events) with one entry per site that has enough due events, and
+        singles lists the other events in their original order.
+    """
+    by_site = {}
+    for event in events:
+        if event.config_name in digests:
+            by_site.setdefault(event.config_name, []).append(event)
+    groups = [
+        (digests[site], site_events) for site, site_events in by_site.items()
+        if len(site_events) >= digests[site].min_events
+    ]
+    digested = {site_events[0].config_name for _, site_events in groups}
+    return groups, [event for event in events if event.config_name not in digested]
+
+def _shifted(facets, offset):
+    return [
+        dict(facet, index={
+            'byteStart': facet['index']['byteStart'] + offset, 'byteEnd': facet['index']['byteEnd'] + offset
+        })
+        for facet in facets
+    ]
+
+def plan_digest(events, settings) -> List[DigestPost]:
+    """
+    Lay events out as digest posts: the heading and as many event lines as
+    fit in the first post, then the rest of the lines packed into as few
+    further posts as Bluesky's limits allow.
+    """
+    posts = []
+    text = settings.heading.format(count=len(events))
+    facets, listed = [], []
+    for event in events:
+        line = settings.line_template.render(event)
+        if text and not fits(f'{text}\n{line.text}'):
+            posts.append(DigestPost(text, facets, listed))
+            text, facets, listed = '', [], []
+        if text:
+            text += '\n'
+        facets = facets + _shifted(line.facets, len(text.encode('utf-8')))
+        text += line.text
+        listed.append(event)
+    posts.append(DigestPost(text, facets, listed))
+    logger.info(f"plan_digest: {len(events)} events in {len(posts)} posts")
+    return posts
+
+def digest_records(posts, repo, thread=True):
+    """
+    The post records of a digest, each with a new record key. With thread,
+    every post after the first replies to the one before it; the CIDs the
+    replies reference are computed here, so the whole thread can be created
+    in one applyWrites call.
+
+    Returns:
+        list: (rkey, record, (uri, cid)) for each post.
+    """
+    records = []
+    root = parent = None
+    for post in posts:
+        rkey = next_tid()
+        reply = (root, parent) if thread and root else None
+        record = post_record(post.text, facet_models(post.facets), reply=reply)
+        ref = (post_uri(repo, rkey), record_cid(record))
+        root = root or ref
+        parent = ref
+        records.append((rkey, record, ref))
+    return records
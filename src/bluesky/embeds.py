@@ -0,0 +1,101 @@
+import io
+import hashlib
+import logging
+from typing import NamedTuple, Optional
+from atproto import models
+from atproto_client.models.blob_ref import BlobRef
+from src.database.db_manager import get_cached_thumbnail, get_thumbnail_blob, save_thumbnail
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it only images that already fit are used
+    Image = None
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bluesky-event-sync.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Bluesky rejects link card thumbnails larger than this
+MAX_THUMBNAIL_BYTES = 1000000
+# Link cards are shown at most this wide, so larger images are scaled down
+MAX_THUMBNAIL_SIZE = (1200, 1200)
+JPEG_QUALITIES = (85, 75, 65, 50, 35)
+THUMBNAIL_MIME_TYPES = {'image/jpeg', 'image/png', 'image/webp'}
+
+DOWNLOAD_TIMEOUT = 15
+MAX_CARD_DESCRIPTION = 300
+
+class Thumbnail(NamedTuple):
+    data: bytes
+    mime_type: str
+    content_hash: str
+
+def prepare_thumbnail(data, mime_type=None) -> Optional[Thumbnail]:
+    """
+    Scale an image down to MAX_THUMBNAIL_SIZE and compress it as JPEG until
+    it fits MAX_THUMBNAIL_BYTES. Returns None if it cannot be made to fit.
+    """
+    mime_type = (mime_type or '').split(';')[0].strip().lower()
+    if Image is None:
+        if mime_type in THUMBNAIL_MIME_TYPES and len(data) <= MAX_THUMBNAIL_BYTES:
+            return Thumbnail(data, mime_type, hashlib.sha256(data).hexdigest())
+        logger.warning("prepare_thumbnail: Pillow is not installed and the image does not fit as is")
+        return None
+
+    image = Image.open(io.BytesIO(data))
+    image.thumbnail(MAX_THUMBNAIL_SIZE)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    for quality in JPEG_QUALITIES:
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=quality, optimize=True)
+        compressed = output.getvalue()
+        if len(compressed) <= MAX_THUMBNAIL_BYTES:
+            return Thumbnail(compressed, 'image/jpeg', hashlib.sha256(compressed).hexdigest())
+    logger.warning(f"prepare_thumbnail: Image is still over {MAX_THUMBNAIL_BYTES} bytes at the lowest quality")
+    return None
+
+def cached_blob(connection, image_url, account_username) -> Optional[BlobRef]:
+    """Return the blob the account already uploaded for an image URL, or None"""
+    cached = get_cached_thumbnail(connection, image_url)
+    if not cached:
+        return None
+    blob_ref = get_thumbnail_blob(connection, cached[0], account_username)
+    return BlobRef.model_validate_json(blob_ref) if blob_ref else None
+
+def cached_thumbnail(connection, image_url) -> Optional[Thumbnail]:
+    """Return the thumbnail already downloaded and prepared for an image URL, or None"""
+    cached = get_cached_thumbnail(connection, image_url)
+    if not cached or cached[2] is None:
+        return None
+    return Thumbnail(cached[2], cached[1], cached[0])
+
+def store_blob(connection, image_url, thumbnail, account_username, blob, commit=True):
+    """Cache a thumbnail by its image URL and its uploaded blob under its content hash"""
+    save_thumbnail(
+        connection, image_url, thumbnail.content_hash, thumbnail.mime_type, thumbnail.data,
+        account_username, blob.model_dump_json(by_alias=True), commit=commit
+    )
+
+def reuse_blob(connection, thumbnail, account_username) -> Optional[BlobRef]:
+    """Return the blob the account uploaded for the same image bytes under another URL, or None"""
+    blob_ref = get_thumbnail_blob(connection, thumbnail.content_hash, account_username)
+    return BlobRef.model_validate_json(blob_ref) if blob_ref else None
+
+def link_card(event_data, thumb=None):
+    """External embed that shows an event as a link card"""
+    description = event_data.description or ''
+    if len(description) > MAX_CARD_DESCRIPTION:
+        description = description[:MAX_CARD_DESCRIPTION - 3] + "..."
+    return models.AppBskyEmbedExternal.Main(
+        external=models.AppBskyEmbedExternal.External(
+            uri=event_data.url, title=event_data.title, description=description, thumb=thumb
+        )
+    )
@@ -0,0 +1,402 @@
+import os
+import asyncio
+import logging
+import httpx
+from collections import deque
+from atproto_client.exceptions import RateLimitExceededError
+from src.bluesky.auth import session_pool
+from src.bluesky.embeds import (
+    DOWNLOAD_TIMEOUT, prepare_thumbnail, cached_blob, cached_thumbnail, reuse_blob, store_blob, link_card
+)
+from src.bluesky.digest import split_digests, plan_digest, digest_records
+from src.bluesky.metrics import collect_accounts_metrics
+from src.bluesky.outbox import (
+    APPLY_WRITES_LIMIT, POST_COLLECTION, next_tid, post_record, repo_did, is_ambiguous, reconcile_post_intents
+)
+from src.bluesky.templates import post_content
+from src.bluesky.rate_limiter import RateLimiter, RateLimitDeferred, CREATE_COST, MAX_RETRIES, retry_delay
+from src.database.db_manager import (
+    claim_scheduled_post, add_post_intent, complete_post_intent, discard_post_intent, get_pending_intents
+)
+from src.database.timestamps import now_epoch
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bluesky-event-sync.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Posts of one account that may be waiting on the network at the same time
+POSTS_IN_FLIGHT = int(os.getenv('POSTS_IN_FLIGHT', '1'))
+
+# Completions are committed together, once this many writes are waiting or
+# this many milliseconds after the first of them
+GROUP_COMMIT_SIZE = int(os.getenv('GROUP_COMMIT_SIZE', '20'))
+GROUP_COMMIT_MS = int(os.getenv('GROUP_COMMIT_MS', '200'))
+
+def _claim(connection, event, rkey):
+    # The claim and the intent share one transaction, committed before the post is sent
+    now = now_epoch()
+    if not claim_scheduled_post(connection, event.schedule_id, now, commit=False):
+        return None
+    return add_post_intent(connection, event, rkey, now, commit=False)
+
+def _claim_digest(connection, events, settings, repo):
+    # Claims first, so the digest only lists the events this run got
+    now = now_epoch()
+    claimed = [event for event in events if claim_scheduled_post(connection, event.schedule_id, now, commit=False)]
+    if not claimed:
+        return [], len(events)
+    posts = plan_digest(claimed, settings)
+    records = digest_records(posts, repo, settings.thread)
+    intents = [
+        [add_post_intent(connection, event, rkey, now, commit=False) for event in post.events]
+        for post, (rkey, _, _) in zip(posts, records)
+    ]
+    return list(zip(records, intents)), len(events) - len(claimed)
+
+def _complete(connection, intent_id, uri, cid):
+    # Completions and discards are left to the group commit; one lost in a
+    # crash is recovered from its intent
+    complete_post_intent(connection, intent_id, uri, cid, commit=False)
+
+def _discard(connection, intent_id):
+    discard_post_intent(connection, intent_id, commit=False)
+
+def _store_blob(connection, image_url, thumbnail, account_username, blob):
+    # Left to the group commit; a row lost in a crash only costs another upload
+    store_blob(connection, image_url, thumbnail, account_username, blob, commit=False)
+
+class PostingEngine:
+    """
+    Posts due events with one asyncio worker per account, so accounts post
+    concurrently and a run takes as long as its slowest account.
+
+    Within an account, events are sent in the order given and up to
+    max_in_flight sends wait on the network at once. Each record's
+    createdAt is stamped as it is sent, so records follow queue order, and
+    results are written back in that order. Every database claim, release
+    and completion goes through a single writer coroutine that owns the
+    connection.
+
+    Each post is claimed together with an outbox intent holding the record
+    key it will be created under. Claims wait for their commit, and claims
+    queued at the same time share it. Completions are not waited for and
+    are committed in groups, see GROUP_COMMIT_SIZE: one lost in a crash is
+    recovered from its intent. Before posting, each worker looks up the
+    account's intents left pending by earlier runs among its records and
+    completes or releases them, so no post is sent twice.
+
+    Sites with digest settings (see src/bluesky/digest.py) that have enough
+    due events post them as a digest before the account's other events:
+    all of its posts are created in one applyWrites call, and each event's
+    intent holds the record key of the post that lists it.
+
+    Logins and posts draw from the rate limiter's token buckets. A post
+    answered with 429 is retried with jittered backoff, and posts whose
+    budget is not back within the limiter's max_wait are released for the
+    next run, together with the rest of that account's queue.
+    """
+
+    def __init__(self, connection, accounts, max_in_flight=POSTS_IN_FLIGHT, client_factory=None, limiter=None,
+                 digests=None):
+        self.connection = connection
+        self.accounts = accounts
+        self.digests = digests or {}
+        self.max_in_flight = max(1, max_in_flight)
+        self.client_factory = client_factory or session_pool.async_client
+        self.limiter = limiter or RateLimiter()
+        self.writes = None
+        self.downloads = {}
+        self.commits = 0
+        self.deferred_accounts = set()
+        self.results = {'posted': 0, 'failed': 0, 'skipped': 0, 'deferred': 0}
+
+    def _commit(self, durable):
+        try:
+            self.connection.commit()
+        except Exception as e:
+            logger.error(f"PostingEngine: Commit failed: {e}")
+            self.connection.rollback()
+            for future, _ in durable:
+                future.set_exception(e)
+            return
+        self.commits += 1
+        for future, result in durable:
+            future.set_result(result)
+
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        durable = []
+        uncommitted = 0
+        deadline = None
+        while True:
+            # Waiting claims are committed as soon as nothing else is queued
+            if durable and self.writes.empty():
+                self._commit(durable)
+                durable, uncommitted = [], 0
+            try:
+                timeout = max(0.0, deadline - loop.time()) if uncommitted else None
+                operation, args, future, wait_for_commit = await asyncio.wait_for(self.writes.get(), timeout)
+            except asyncio.TimeoutError:
+                self._commit(durable)
+                durable, uncommitted = [], 0
+                continue
+            if operation is None:
+                self._commit(durable)
+                return
+            try:
+                result = operation(self.connection, *args)
+            except Exception as e:
+                # Everything since the last commit is rolled back. Completions
+                # lost this way are recovered from their intents.
+                self.connection.rollback()
+                for waiting, _ in durable:
+                    waiting.set_exception(e)
+                future.set_exception(e)
+                durable, uncommitted = [], 0
+                continue
+            if wait_for_commit:
+                durable.append((future, result))
+            else:
+                future.set_result(result)
+            if self.connection.in_transaction:
+                if not uncommitted:
+                    deadline = loop.time() + GROUP_COMMIT_MS / 1000
+                uncommitted += 1
+                if uncommitted >= GROUP_COMMIT_SIZE or loop.time() >= deadline:
+                    self._commit(durable)
+                    durable, uncommitted = [], 0
+            elif not durable:
+                uncommitted = 0
+
+    async def _write(self, operation, *args, wait_for_commit=False):
+        future = asyncio.get_running_loop().create_future()
+        await self.writes.put((operation, args, future, wait_for_commit))
+        return await future
+
+    async def _download(self, image_url):
+        async with httpx.AsyncClient(timeout=DOWNLOAD_TIMEOUT, follow_redirects=True) as http:
+            response = await http.get(image_url)
+        response.raise_for_status()
+        return prepare_thumbnail(response.content, response.headers.get('content-type'))
+
+    async def _thumbnail(self, client, event):
+        # The image is downloaded the first time any account posts it and
+        # uploaded the first time each account does; the cache lookups go
+        # through the writer. Without a thumbnail the card is posted bare.
+        if not event.image_url:
+            return None
+        blob = await self._write(cached_blob, event.image_url, event.account_username)
+        if blob:
+            return blob
+        try:
+            thumbnail = await self._write(cached_thumbnail, event.image_url)
+            if thumbnail is None:
+                # Accounts posting the same image at once share its download
+                if event.image_url not in self.downloads:
+                    self.downloads[event.image_url] = asyncio.ensure_future(self._download(event.image_url))
+                thumbnail = await self.downloads[event.image_url]
+                if thumbnail is None:
+                    return None
+            blob = await self._write(reuse_blob, thumbnail, event.account_username)
+            if blob is None:
+                blob = (await client.upload_blob(thumbnail.data)).blob
+            await self._write(_store_blob, event.image_url, thumbnail, event.account_username, blob)
+            return blob
+        except Exception as e:
+            logger.warning(f"PostingEngine: No thumbnail for '{event.title}': {e}")
+            return None
+
+    async def _create(self, username, label, cost, request):
+        for attempt in range(MAX_RETRIES + 1):
+            await self.limiter.acquire(username, 'write', cost)
+            logger.info(f"PostingEngine: Posting {label} as {username}")
+            try:
+                return await request()
+            except RateLimitExceededError as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                self.limiter.observe(username, 'write', e.response.headers if e.response else {})
+                delay = retry_delay(attempt)
+                logger.warning(f"PostingEngine: Rate limited posting {label}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _send(self, client, event, rkey):
+        text, facets = post_content(event)
+        embed = link_card(event, await self._thumbnail(client, event))
+
+        async def create():
+            record = post_record(text, facets, embed)
+            post = await client.app.bsky.feed.post.create(repo_did(client), record, rkey=rkey)
+            return [(post.uri, post.cid)]
+
+        return await self._create(event.account_username, f"'{event.title}'", CREATE_COST, create)
+
+    async def _send_digest(self, client, username, label, records):
+        writes = [
+            {'$type': 'com.atproto.repo.applyWrites#create', 'collection': POST_COLLECTION, 'rkey': rkey, 'value': record}
+            for rkey, record, _ in records
+        ]
+
+        async def apply():
+            response = await client.com.atproto.repo.apply_writes({'repo': repo_did(client), 'writes': writes})
+            results = getattr(response, 'results', None) or []
+            if len(results) != len(records):
+                # The references were computed when the records were made
+                return [ref for _, _, ref in records]
+            return [(result.uri, result.cid) for result in results]
+
+        return await self._create(username, label, CREATE_COST * len(writes), apply)
+
+    async def _finish(self, label, username, intents, task):
+        # intents are (intent ID, index of the post in the task's (uri, cid) results)
+        try:
+            refs = await task
+        except RateLimitDeferred as e:
+            logger.info(f"PostingEngine: Deferring {label} to the next run: {e}")
+            self.results['deferred'] += len(intents)
+            self.deferred_accounts.add(username)
+            for intent_id, _ in intents:
+                await self._write(_discard, intent_id)
+            return
+        except Exception as e:
+            self.results['failed'] += len(intents)
+            if is_ambiguous(e):
+                # The post may have been created; the next run looks for it
+                logger.error(f"PostingEngine: No response posting {label}, leaving it for recovery: {e}")
+                return
+            logger.error(f"PostingEngine: Failed to post {label}: {e}")
+            for intent_id, _ in intents:
+                await self._write(_discard, intent_id)
+            return
+        logger.info(f"PostingEngine: Posted {label}: {refs[0][0]}")
+        self.results['posted'] += len(intents)
+        for intent_id, index in intents:
+            await self._write(_complete, intent_id, *refs[index])
+
+    async def _drain(self, pending, wait=False):
+        # Write results back in queue order; a finished send waits for the ones before it
+        while pending and (wait or pending[0][-1].done()):
+            await self._finish(*pending.popleft())
+
+    async def _post_digest(self, client, username, settings, events):
+        claimed, skipped = await self._write(
+            _claim_digest, events, settings, repo_did(client), wait_for_commit=True
+        )
+        self.results['skipped'] += skipped
+        # Threads longer than one applyWrites call go out in parts, oldest first
+        for start in range(0, len(claimed), APPLY_WRITES_LIMIT):
+            part = claimed[start:start + APPLY_WRITES_LIMIT]
+            intents = [(intent_id, index) for index, (_, ids) in enumerate(part) for intent_id in ids]
+            label = f"a digest of {len(intents)} {events[0].config_name} events in {len(part)} posts"
+            if username in self.deferred_accounts:
+                self.results['deferred'] += len(intents)
+                for intent_id, _ in intents:
+                    await self._write(_discard, intent_id)
+                continue
+            records = [record for record, _ in part]
+            task = asyncio.create_task(self._send_digest(client, username, label, records))
+            await self._finish(label, username, intents, task)
+
+    async def _recover(self, client, username):
+        intents = await self._write(get_pending_intents, username)
+        if not intents:
+            return
+        created, missing = await reconcile_post_intents(client, username, intents, self.limiter)
+        for intent_id, (uri, cid) in created.items():
+            await self._write(_complete, intent_id, uri, cid)
+        for intent_id in missing:
+            await self._write(_discard, intent_id)
+
+    async def _account_worker(self, username, events):
+        account = self.accounts.get(username)
+        if not account:
+            logger.warning(f"PostingEngine: No credentials for account {username}")
+            self.results['skipped'] += len(events)
+            return
+        try:
+            await self.limiter.acquire(username, 'session')
+            client = self.limiter.watch(await self.client_factory(account['username'], account['password']), username)
+            await self._recover(client, username)
+        except RateLimitDeferred as e:
+            logger.warning(f"PostingEngine: Deferring {username} to the next run: {e}")
+            self.results['deferred'] += len(events)
+            return
+        except Exception as e:
+            # The account's pending intents must be settled before it posts again
+            logger.error(f"PostingEngine: Login or recovery failed for {username}: {e}")
+            self.results['failed'] += len(events)
+            return
+
+        groups, events = split_digests(events, self.digests)
+        for settings, site_events in groups:
+            await self._post_digest(client, username, settings, site_events)
+
+        pending = deque()
+        for event in events:
+            # A send's slot frees once its outcome is recorded, so a deferral
+            # is seen here before the next event is claimed
+            await self._drain(pending)
+            while len(pending) >= self.max_in_flight:
+                await self._finish(*pending.popleft())
+            if username in self.deferred_accounts:
+                # Keep the account's order: nothing after a deferred post goes out before it
+                self.results['deferred'] += 1
+                continue
+            rkey = next_tid()
+            intent_id = await self._write(_claim, event, rkey, wait_for_commit=True)
+            if intent_id is None:
+                self.results['skipped'] += 1
+                continue
+            task = asyncio.create_task(self._send(client, event, rkey))
+            pending.append((f"'{event.title}'", username, [(intent_id, 0)], task))
+        await self._drain(pending, wait=True)
+
+    async def run(self, events):
+        """
+        Post events, a list of due Event records from get_due_posts, and
+        return the number of posted, failed, skipped and deferred events.
+        """
+        by_account = {}
+        for event in events:
+            by_account.setdefault(event.account_username, []).append(event)
+
+        self.writes = asyncio.Queue()
+        writer = asyncio.create_task(self._writer())
+        try:
+            await asyncio.gather(*(
+                self._account_worker(username, account_events)
+                for username, account_events in by_account.items()
+            ))
+        finally:
+            await self.writes.put((None, (), None, False))
+            await writer
+        logger.info(
+            f"PostingEngine: {self.results['posted']} posted, {self.results['failed']} failed, "
+            f"{self.results['skipped']} skipped, {self.results['deferred']} deferred across {len(by_account)} accounts "
+            f"in {self.commits} commits"
+        )
+        return self.results
+
+def post_events(connection, accounts, events, max_in_flight=POSTS_IN_FLIGHT, digests=None, collect_metrics=False,
+                client_factory=None):
+    """
+    Run a PostingEngine over events from synchronous code. With
+    collect_metrics, the engagement of the accounts' recent posts is then
+    collected in the same event loop, with the same clients and limiter.
+    """
+    engine = PostingEngine(connection, accounts, max_in_flight, client_factory=client_factory, digests=digests)
+
+    async def run():
+        results = await engine.run(events)
+        if collect_metrics:
+            await collect_accounts_metrics(connection, accounts, engine.client_factory, engine.limiter)
+        return results
+
+    return asyncio.run(run())
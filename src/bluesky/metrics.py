@@ -0,0 +1,118 @@
+import os
+import asyncio
+import logging
+from datetime import timedelta
+from src.bluesky.auth import session_pool
+from src.bluesky.rate_limiter import RateLimiter, RateLimitDeferred
+from src.database.db_manager import get_posts_to_measure, record_post_metrics, get_interval_engagement
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bluesky-event-sync.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Most URIs app.bsky.feed.getPosts takes per call
+METRICS_BATCH_SIZE = 25
+
+# Posts are checked at most every METRICS_INTERVAL_HOURS for
+# METRICS_WINDOW_DAYS after they were posted
+METRICS_WINDOW = timedelta(days=int(os.getenv('METRICS_WINDOW_DAYS', '14')))
+METRICS_INTERVAL = timedelta(hours=int(os.getenv('METRICS_INTERVAL_HOURS', '6')))
+
+# An update interval is dropped once it has MIN_MEASURED_POSTS posts with
+# engagement data and they average less than DROP_SHARE of the best interval's
+MIN_MEASURED_POSTS = int(os.getenv('MIN_MEASURED_POSTS', '20'))
+DROP_SHARE = float(os.getenv('INTERVAL_DROP_SHARE', '0.25'))
+
+def post_counts(post):
+    """(likes, reposts, replies, quotes) of a post view"""
+    return (post.like_count or 0, post.repost_count or 0, post.reply_count or 0, post.quote_count or 0)
+
+async def collect_metrics(client, connection, username, limiter=None, now=None):
+    """
+    Fetch the engagement of the account's posts that are due for a check,
+    METRICS_BATCH_SIZE per getPosts call, and store it with
+    record_post_metrics.
+
+    Returns:
+        int: The number of samples added.
+    """
+    uris = get_posts_to_measure(connection, username, METRICS_WINDOW, METRICS_INTERVAL, now)
+    samples = 0
+    for start in range(0, len(uris), METRICS_BATCH_SIZE):
+        batch = uris[start:start + METRICS_BATCH_SIZE]
+        if limiter is not None:
+            await limiter.acquire(username, 'api')
+        response = await client.app.bsky.feed.get_posts({'uris': batch})
+        samples += record_post_metrics(connection, batch, {post.uri: post_counts(post) for post in response.posts}, now)
+    logger.info(f"collect_metrics: {username}: {len(uris)} posts checked, {samples} changed")
+    return samples
+
+async def _collect_account(connection, account, client_factory, limiter):
+    username = account['username']
+    try:
+        await limiter.acquire(username, 'session')
+        client = limiter.watch(await client_factory(username, account['password']), username)
+        return await collect_metrics(client, connection, username, limiter)
+    except RateLimitDeferred as e:
+        logger.warning(f"collect_metrics: Deferring {username} to the next run: {e}")
+    except Exception as e:
+        logger.error(f"collect_metrics: Failed for {username}: {e}")
+    return 0
+
+async def collect_accounts_metrics(connection, accounts, client_factory=None, limiter=None):
+    """
+    Collect the engagement of every account's recent posts, accounts
+    concurrently. A failing account is logged and skipped.
+
+    Returns:
+        int: The number of samples added.
+    """
+    client_factory = client_factory or session_pool.async_client
+    limiter = limiter or RateLimiter()
+    counts = await asyncio.gather(*(
+        _collect_account(connection, account, client_factory, limiter) for account in accounts.values()
+    ))
+    return sum(counts)
+
+def prune_intervals(update_intervals, engagement, min_posts=None, drop_share=None):
+    """
+    Return update_intervals without the intervals whose posts get little
+    engagement compared to the best one, see DROP_SHARE. engagement is the
+    result of get_interval_engagement. Intervals with fewer than
+    MIN_MEASURED_POSTS measured posts are kept, and so is at least one.
+    """
+    min_posts = MIN_MEASURED_POSTS if min_posts is None else min_posts
+    drop_share = DROP_SHARE if drop_share is None else drop_share
+    measured = {label: mean for label, (posts, mean) in engagement.items() if posts >= min_posts}
+    if len(measured) < 2:
+        return list(update_intervals)
+    best = max(measured.values())
+    kept = [label for label in update_intervals if label not in measured or measured[label] >= drop_share * best]
+    return kept or list(update_intervals)
+
+def plan_intervals(connection, website_config):
+    """
+    The update intervals to schedule a website's new events with: its
+    configured ones, minus those pruned by engagement when the website sets
+    prune_intervals.
+    """
+    intervals = website_config['update_intervals']
+    if not website_config.get('prune_intervals'):
+        return list(intervals)
+    engagement = get_interval_engagement(connection, website_config['account_username'], website_config['name'])
+    kept = prune_intervals(intervals, engagement)
+    for label in intervals:
+        if label not in kept:
+            posts, mean = engagement[label]
+            logger.info(
+                f"plan_intervals: {website_config['name']}: dropping {label}, "
+                f"{mean:.1f} mean engagement over {posts} posts"
+            )
+    return kept
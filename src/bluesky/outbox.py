@@ -0,0 +1,151 @@
+import time
+import random
+import hashlib
+import logging
+from datetime import datetime, timezone
+import httpx
+import libipld
+from atproto import models
+from atproto_client.exceptions import NetworkError, RequestErrorBase
+from src.bluesky.auth import session_did
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bluesky-event-sync.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+POST_COLLECTION = 'app.bsky.feed.post'
+LIST_RECORDS_LIMIT = 100
+# Most writes one applyWrites call takes
+APPLY_WRITES_LIMIT = 200
+
+# CIDv1 header of a DAG-CBOR record hashed with SHA-256
+RECORD_CID_PREFIX = bytes([0x01, 0x71, 0x12, 0x20])
+
+# Record keys are TIDs: microseconds since the epoch and a clock ID in
+# 13 characters of sortable base32, so later posts have larger keys
+TID_ALPHABET = '234567abcdefghijklmnopqrstuvwxyz'
+_clock_id = random.randrange(1024)
+_last_micros = 0
+
+def next_tid():
+    """Return a new record key, larger than every key returned before by this process"""
+    global _last_micros
+    _last_micros = max(time.time_ns() // 1000, _last_micros + 1)
+    value = (_last_micros << 10) | _clock_id
+    return ''.join(TID_ALPHABET[(value >> shift) & 31] for shift in range(60, -1, -5))
+
+def tid_time(rkey):
+    """The time encoded in a TID record key, or None if rkey is not a TID"""
+    if len(rkey) != 13 or not set(rkey) <= set(TID_ALPHABET):
+        return None
+    value = 0
+    for char in rkey:
+        value = value * 32 + TID_ALPHABET.index(char)
+    return datetime.fromtimestamp((value >> 10) / 1000000, timezone.utc)
+
+def post_record(text, facets=None, embed=None, reply=None):
+    """
+    The app.bsky.feed.post record send_post would create, stamped with the
+    current time. reply is a (root, parent) pair of (uri, cid) of the posts
+    it answers.
+    """
+    created_at = datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+    if reply is not None:
+        root, parent = (models.ComAtprotoRepoStrongRef.Main(uri=uri, cid=cid) for uri, cid in reply)
+        reply = models.AppBskyFeedPost.ReplyRef(root=root, parent=parent)
+    return models.AppBskyFeedPost.Record(
+        created_at=created_at, text=text, facets=facets or None, embed=embed, langs=['en'], reply=reply
+    )
+
+def record_cid(record):
+    """
+    The CID a PDS stores a record under, the hash of its DAG-CBOR encoding,
+    so a thread's replies can reference posts created in the same call.
+    """
+    value = record if isinstance(record, dict) else models.get_model_as_dict(record)
+    return libipld.encode_cid(RECORD_CID_PREFIX + hashlib.sha256(libipld.encode_dag_cbor(value)).digest())
+
+def post_uri(repo, rkey):
+    return f'at://{repo}/{POST_COLLECTION}/{rkey}'
+
+def repo_did(client):
+    """DID of the repo a client posts to; clients that reused a session have no profile"""
+    if getattr(client, 'me', None) is not None:
+        return client.me.did
+    return session_did(client)
+
+def is_ambiguous(error):
+    """
+    True if a failed create may still have reached the server: the
+    connection broke or timed out before a response came back, or the
+    server failed after the request reached it. Such posts keep their
+    intent until reconcile_post_intents has looked for them.
+    """
+    if isinstance(error, (NetworkError, httpx.TransportError)):
+        return True
+    response = getattr(error, 'response', None) if isinstance(error, RequestErrorBase) else None
+    return response is not None and response.status_code >= 500
+
+def record_key(uri):
+    """The record key at the end of an at:// URI"""
+    return uri.rsplit('/', 1)[-1]
+
+async def list_post_records(client, repo, limiter=None, account=None, cursor=None):
+    """Yield pages of the repo's post records (uri, cid, value), newest first, starting below cursor"""
+    while True:
+        if limiter is not None:
+            await limiter.acquire(account, 'api')
+        page = await client.com.atproto.repo.list_records(
+            {'repo': repo, 'collection': POST_COLLECTION, 'cursor': cursor, 'limit': LIST_RECORDS_LIMIT}
+        )
+        if page.records:
+            yield page.records
+        cursor = page.cursor
+        if not cursor or not page.records:
+            return
+
+async def find_posts(client, repo, rkeys, limiter=None, account=None):
+    """
+    Page through the repo's posts until every key in rkeys is found or the
+    pages are older than the oldest of them.
+
+    Returns:
+        dict: rkey -> (uri, cid) of the keys that were found.
+    """
+    wanted = set(rkeys)
+    found = {}
+    if not wanted:
+        return found
+    oldest = min(wanted)
+    async for records in list_post_records(client, repo, limiter, account):
+        keys = [record_key(record.uri) for record in records]
+        for rkey, record in zip(keys, records):
+            if rkey in wanted:
+                found[rkey] = (record.uri, record.cid)
+                wanted.discard(rkey)
+        if not wanted or min(keys) < oldest:
+            break
+    return found
+
+async def reconcile_post_intents(client, account, intents, limiter=None):
+    """
+    Settle intents, (id, rkey) pairs whose posts may or may not have been
+    created, against the account's records.
+
+    Returns:
+        tuple: (created, missing) where created maps intent IDs to the
+        (uri, cid) of their posts and missing lists the IDs of posts that
+        were never created.
+    """
+    found = await find_posts(client, repo_did(client), [rkey for _, rkey in intents], limiter, account)
+    created = {intent_id: found[rkey] for intent_id, rkey in intents if rkey in found}
+    missing = [intent_id for intent_id, rkey in intents if rkey not in found]
+    logger.info(f"reconcile_post_intents: {account} has {len(created)} posts created and {len(missing)} never sent")
+    return created, missing
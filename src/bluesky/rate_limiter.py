@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import random
+import asyncio
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bluesky-event-sync.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Documented Bluesky limits as (capacity, window in seconds). Writes are
+# counted in points per account, sessions in logins per account, and all
+# other requests per IP address, so the 'api' buckets are shared.
+DEFAULT_LIMITS = {
+    'write': [(5000, 3600), (35000, 86400)],
+    'session': [(30, 300), (300, 86400)],
+    'api': [(3000, 300)]
+}
+
+# Write points per record operation
+CREATE_COST = 3
+UPDATE_COST = 2
+DELETE_COST = 1
+
+WRITE_ENDPOINTS = {
+    'com.atproto.repo.createRecord', 'com.atproto.repo.putRecord', 'com.atproto.repo.deleteRecord',
+    'com.atproto.repo.applyWrites'
+}
+SESSION_ENDPOINTS = {'com.atproto.server.createSession', 'com.atproto.server.refreshSession'}
+
+# A post that would have to wait longer than this for its budget is left
+# for the next run instead
+MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', '300'))
+
+# Retries of a request answered with 429, and the base of their backoff
+MAX_RETRIES = int(os.getenv('RATE_LIMIT_RETRIES', '3'))
+RETRY_BASE_DELAY = 1.0
+
+class RateLimitDeferred(Exception):
+    """Raised when a request cannot go out before MAX_WAIT has passed"""
+
+    def __init__(self, endpoint, wait):
+        super().__init__(f"{endpoint} budget is exhausted for another {wait:.0f}s")
+        self.endpoint = endpoint
+        self.wait = wait
+
+def endpoint_for(nsid):
+    """Map an XRPC method name to the rate limit bucket it draws from"""
+    if nsid in WRITE_ENDPOINTS:
+        return 'write'
+    if nsid in SESSION_ENDPOINTS:
+        return 'session'
+    return 'api'
+
+def retry_delay(attempt, base=RETRY_BASE_DELAY):
+    """Exponential backoff with full jitter for the given retry attempt"""
+    return random.uniform(0, base * 2 ** attempt)
+
+class TokenBucket:
+    """
+    A token bucket holding up to capacity tokens, refilled evenly over
+    window seconds. Tokens are reserved up front, so callers that are
+    told to wait are served in the order they asked.
+
+    Once the server has reported its own window, the bucket follows it
+    instead: nothing is refilled until the reported reset, and the full
+    capacity comes back at once.
+    """
+
+    def __init__(self, capacity, window, now=None):
+        self.capacity = capacity
+        self.window = window
+        self.tokens = float(capacity)
+        self.updated = time.monotonic() if now is None else now
+        self.reset_at = None
+
+    @property
+    def rate(self):
+        return self.capacity / self.window
+
+    def _refill(self, now):
+        if self.reset_at is not None:
+            if now < self.reset_at:
+                self.updated = now
+                return
+            self.tokens = min(self.capacity, self.tokens + self.capacity)
+            self.updated = self.reset_at
+            self.reset_at = None
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost=1, now=None):
+        """Seconds until cost tokens are available"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        deficit = cost - self.tokens
+        if deficit <= 0:
+            return 0.0
+        if self.reset_at is not None:
+            return self.reset_at - now + max(0.0, deficit - self.capacity) / self.rate
+        return deficit / self.rate
+
+    def reserve(self, cost=1, now=None):
+        """Take cost tokens, going into debt if needed, and return how long to wait before using them"""
+        wait = self.wait_time(cost, now)
+        self.tokens -= cost
+        return wait
+
+    def update(self, limit=None, remaining=None, reset_in=None, now=None):
+        """
+        Align the bucket with the server's ratelimit-* headers. The server's
+        count only lowers the local one, since requests still in flight are
+        not in it yet.
+        """
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if limit:
+            self.capacity = limit
+        if remaining is not None:
+            self.tokens = min(self.tokens, remaining)
+            if reset_in is not None:
+                self.reset_at = now + reset_in
+
+class RateLimiter:
+    """
+    Token buckets per account and endpoint, seeded from DEFAULT_LIMITS and
+    kept in line with the headers of the responses.
+    """
+
+    def __init__(self, limits=None, max_wait=MAX_WAIT):
+        self.limits = limits or DEFAULT_LIMITS
+        self.max_wait = max_wait
+        self.buckets = {}
+
+    def _buckets(self, account, endpoint):
+        key = (None if endpoint == 'api' else account, endpoint)
+        if key not in self.buckets:
+            self.buckets[key] = [TokenBucket(capacity, window) for capacity, window in self.limits[endpoint]]
+        return self.buckets[key]
+
+    async def acquire(self, account, endpoint, cost=1):
+        """
+        Wait until account may spend cost on endpoint. Raises
+        RateLimitDeferred, without spending anything, when that would take
+        longer than max_wait.
+        """
+        # Every request also counts once against the shared per-IP budget
+        plan = [(bucket, cost) for bucket in self._buckets(account, endpoint)]
+        if endpoint != 'api':
+            plan += [(bucket, 1) for bucket in self._buckets(account, 'api')]
+        now = time.monotonic()
+        wait = max(bucket.wait_time(bucket_cost, now) for bucket, bucket_cost in plan)
+        if wait > self.max_wait:
+            raise RateLimitDeferred(endpoint, wait)
+        for bucket, bucket_cost in plan:
+            bucket.reserve(bucket_cost, now)
+        if wait > 0:
+            logger.info(f"RateLimiter.acquire: {account} waits {wait:.1f}s for {endpoint}")
+            await asyncio.sleep(wait)
+
+    def observe(self, account, endpoint, headers, now=None):
+        """Update the bucket named by the response's ratelimit-policy from its headers"""
+        limit = _int_header(headers, 'ratelimit-limit')
+        remaining = _int_header(headers, 'ratelimit-remaining')
+        if limit is None and remaining is None:
+            return
+        reset = _int_header(headers, 'ratelimit-reset')
+        reset_in = max(0.0, reset - time.time()) if reset is not None else None
+        buckets = self._buckets(account, endpoint)
+        window = _policy_window(headers.get('ratelimit-policy'))
+        bucket = next((b for b in buckets if b.window == window), buckets[0])
+        bucket.update(limit, remaining, reset_in, now)
+
+    def watch(self, client, account):
+        """
+        Feed the rate limit headers of every response client receives into
+        this limiter. A client watched again, by this or another limiter,
+        keeps only the latest hook, so pooled clients do not collect one per run.
+        """
+        async def on_response(response):
+            nsid = response.request.url.path.rsplit('/', 1)[-1]
+            self.observe(account, endpoint_for(nsid), response.headers)
+        on_response.rate_limit_hook = True
+
+        # atproto exposes no response hook of its own, so register one on its httpx client
+        hooks = client.request._client.event_hooks['response']
+        hooks[:] = [hook for hook in hooks if not getattr(hook, 'rate_limit_hook', False)] + [on_response]
+        return client
+
+def _int_header(headers, name):
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+def _policy_window(policy):
+    match = re.search(r'w=(\d+)', policy or '')
+    return int(match.group(1)) if match else None
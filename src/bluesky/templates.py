@@ -0,0 +1,195 @@
+import json
+import hashlib
+import logging
+from functools import lru_cache
+from string import Formatter
+from typing import List, NamedTuple
+import regex
+from atproto import models
+from src.database.timestamps import from_epoch
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bluesky-event-sync.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Bluesky's limits on the text of a post
+MAX_GRAPHEMES = 300
+MAX_BYTES = 3000
+ELLIPSIS = '...'
+
+# The title links to the event page and hashtags become tag facets. The
+# description is shortened to fit, then the title if it is still too long.
+DEFAULT_TEMPLATE = '{title} ({start:%Y-%m-%d %H:%M}) {description} {hashtags}'
+TEMPLATE_FIELDS = {
+    'title', 'url', 'description', 'location', 'address', 'city', 'region', 'hashtags', 'start', 'end'
+}
+DEFAULT_DATE_FORMAT = '%Y-%m-%d %H:%M'
+
+FACET_TYPE = 'app.bsky.richtext.facet'
+LINK_FEATURE = 'app.bsky.richtext.facet#link'
+TAG_FEATURE = 'app.bsky.richtext.facet#tag'
+
+def graphemes(text) -> List[str]:
+    """Split text into the user-perceived characters (extended grapheme clusters) that Bluesky counts"""
+    return regex.findall(r'\X', text)
+
+def grapheme_length(text):
+    if text.isascii():
+        return len(text) - text.count('\r\n')
+    return len(graphemes(text))
+
+def fits(text):
+    """True if text is within Bluesky's grapheme and byte limits for a post"""
+    if len(text.encode('utf-8')) > MAX_BYTES:
+        return False
+    # A text has no more graphemes than code points, so short ones need no splitting
+    return len(text) <= MAX_GRAPHEMES or grapheme_length(text) <= MAX_GRAPHEMES
+
+def truncate(text, limit):
+    """Shorten text to at most limit graphemes, ending in an ellipsis when it is cut"""
+    clusters = graphemes(text)
+    if len(clusters) <= limit:
+        return text
+    if limit <= len(ELLIPSIS):
+        return ''
+    return ''.join(clusters[:limit - len(ELLIPSIS)]).rstrip() + ELLIPSIS
+
+class RenderedPost(NamedTuple):
+    text: str
+    facets: list
+
+    @property
+    def facets_json(self):
+        return json.dumps(self.facets)
+
+def facet_models(facets):
+    """Turn stored facets (a JSON string or a list of dicts) into the models send_post takes"""
+    if isinstance(facets, str):
+        facets = json.loads(facets)
+    return [models.AppBskyRichtextFacet.Main.model_validate(facet) for facet in facets or []]
+
+def _facet(start, end, feature):
+    return {
+        '$type': FACET_TYPE,
+        'index': {'byteStart': start, 'byteEnd': end},
+        'features': [feature]
+    }
+
+class PostTemplate:
+    """
+    A post template in str.format syntax, parsed once. Available fields are
+    TEMPLATE_FIELDS; start and end take a strftime format spec.
+
+    render() fits the post into MAX_GRAPHEMES grapheme clusters and
+    MAX_BYTES bytes and computes the byte offsets of the link and tag facets.
+    """
+
+    def __init__(self, source=DEFAULT_TEMPLATE):
+        self.source = source
+        # Stored with each rendered post, so changing a template re-renders its events
+        self.key = hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+        self.segments = []
+        for literal, field, spec, conversion in Formatter().parse(source):
+            if field is not None and field not in TEMPLATE_FIELDS:
+                raise ValueError(f"Unknown post template field: {field}")
+            self.segments.append((literal, field, spec or ''))
+        self.fields = {field for _, field, _ in self.segments if field}
+
+    def _values(self, event_data):
+        values = {}
+        for field in self.fields:
+            if field in ('start', 'end'):
+                timestamp = event_data.start_ts if field == 'start' else (event_data.end_ts or event_data.start_ts)
+                values[field] = from_epoch(timestamp, event_data.source_tz)
+            elif field == 'hashtags':
+                values[field] = [tag.lstrip('#') for tag in (event_data.hashtags or '').split() if tag.lstrip('#')]
+            else:
+                values[field] = getattr(event_data, field) or ''
+        return values
+
+    def _build(self, event_data, values):
+        text = ''
+        facets = []
+
+        def append(piece, feature=None):
+            nonlocal text
+            if not piece:
+                return
+            # Skip the doubled space an empty field leaves between two literals
+            if feature is None and text.endswith(' ') and piece.startswith(' '):
+                piece = piece[1:]
+            start = len(text.encode('utf-8'))
+            text += piece
+            if feature is not None:
+                facets.append(_facet(start, len(text.encode('utf-8')), feature))
+
+        for literal, field, spec in self.segments:
+            append(literal)
+            if field is None:
+                continue
+            value = values[field]
+            if field == 'hashtags':
+                for i, tag in enumerate(value):
+                    append(' ' if i else '')
+                    append(f'#{tag}', {'$type': TAG_FEATURE, 'tag': tag})
+            elif field in ('start', 'end'):
+                append(format(value, spec or DEFAULT_DATE_FORMAT))
+            elif field in ('title', 'url') and event_data.url:
+                append(format(value, spec), {'$type': LINK_FEATURE, 'uri': event_data.url})
+            else:
+                append(format(value, spec))
+        return RenderedPost(text.rstrip(), facets)
+
+    def _fits(self, post):
+        return fits(post.text)
+
+    def render(self, event_data) -> RenderedPost:
+        values = self._values(event_data)
+        post = self._build(event_data, values)
+        if self._fits(post):
+            return post
+
+        # Give the description whatever the rest of the post leaves over,
+        # then shorten the title if the rest alone is too long
+        for field in ('description', 'title'):
+            if field not in self.fields or not values[field]:
+                continue
+            full = values[field]
+            rest = grapheme_length(self._build(event_data, dict(values, **{field: ''})).text)
+            limit = min(MAX_GRAPHEMES - rest, grapheme_length(full))
+            while limit > 0:
+                values[field] = truncate(full, limit)
+                post = self._build(event_data, values)
+                if self._fits(post):
+                    return post
+                over = grapheme_length(post.text) - MAX_GRAPHEMES
+                # Within the grapheme limit means over the byte limit: shorten by a tenth
+                limit -= over if over > 0 else max(1, limit // 10)
+            values[field] = ''
+            post = self._build(event_data, values)
+            if self._fits(post):
+                return post
+        logger.warning(f"PostTemplate.render: '{event_data.title}' does not fit in a post")
+        return post
+
+@lru_cache(maxsize=None)
+def compile_template(source=None):
+    """Return the PostTemplate for a template source, parsing each source once"""
+    return PostTemplate(source or DEFAULT_TEMPLATE)
+
+def post_content(event_data):
+    """
+    Text and facets to post for an event: those rendered at ingest by the
+    site's template, or the default template for events not rendered yet.
+    """
+    if event_data.post_text:
+        return event_data.post_text, facet_models(event_data.post_facets)
+    post = compile_template().render(event_data)
+    return post.text, facet_models(post.facets)
@@ -1,7 +1,13 @@
 import logging
 import sqlite3
+import hashlib
 import os
-from datetime import datetime, timedelta
+from datetime import timedelta
+from urllib.request import pathname2url
+from src.database.timestamps import localize, timezone_name, to_epoch, from_epoch, now_epoch
+from src.database.records import EVENT_COLUMNS, event_factory
+from src.database.duplicates import index_event, resolve_duplicate
+from src.database.profiler import ProfiledConnection
 
 # Configure logging
 logging.basicConfig(
@@ -14,128 +20,255 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def connect_to_db(db_path):
-    logger.info(f"connect_to_db: Connecting to {db_path}")
+# Connection tuning shared by every entry point. WAL lets readers run while
+# main.py writes, and synchronous=NORMAL is durable in WAL mode without an
+# fsync on every commit. Foreign keys are enforced, so deleting an event
+# deletes its schedule; new databases are created with incremental
+# auto-vacuum so maintenance can give free pages back to the filesystem.
+DB_BUSY_TIMEOUT_MS = 30000
+DB_CACHE_SIZE_KIB = 65536
+DB_MMAP_SIZE = 256 * 1024 * 1024
+
+def _apply_pragmas(connection, read_only):
+    connection.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+    connection.execute('PRAGMA foreign_keys = ON')
+    if not read_only:
+        # Only takes effect on a database that has no tables yet
+        connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        journal_mode = connection.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+        if journal_mode.lower() != 'wal':
+            logger.warning(f"connect_to_db: WAL not available, using journal_mode={journal_mode}")
+    connection.execute('PRAGMA synchronous = NORMAL')
+    connection.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE_KIB}')
+    connection.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+    if read_only:
+        connection.execute('PRAGMA query_only = ON')
+
+def connect_to_db(db_path, read_only=False, profile=None):
+    """
+    Open a tuned SQLite connection.
+
+    Read-write connections switch the database to WAL mode. Read-only
+    connections open the file with mode=ro so they never take the write lock
+    and can run alongside a writer.
+
+    With profile (default: the DB_PROFILE environment variable set to TRUE)
+    the connection records every statement it runs, see profiler.py.
+    """
+    if profile is None:
+        profile = os.getenv('DB_PROFILE', 'FALSE').upper() == 'TRUE'
+    logger.info(f"connect_to_db: Connecting to {db_path} ({'read-only' if read_only else 'read-write'})")
     try:
-        if not os.path.exists(os.path.dirname(db_path)):
-            logger.info(f"Creating database directory: {os.path.dirname(db_path)}")
-            os.makedirs(os.path.dirname(db_path))
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            logger.info(f"Creating database directory: {db_dir}")
+            os.makedirs(db_dir)
         logger.info(f"Connecting to database: {db_path}")
-        connection = sqlite3.connect(db_path)
+        timeout = DB_BUSY_TIMEOUT_MS / 1000
+        factory = ProfiledConnection if profile else sqlite3.Connection
+        if read_only:
+            uri = f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro"
+            connection = sqlite3.connect(uri, uri=True, timeout=timeout, detect_types=sqlite3.PARSE_DECLTYPES, factory=factory)
+        else:
+            connection = sqlite3.connect(db_path, timeout=timeout, detect_types=sqlite3.PARSE_DECLTYPES, factory=factory)
         connection.row_factory = sqlite3.Row
+        _apply_pragmas(connection, read_only)
         return connection
     except Exception as e:
         logger.error(f"connect_to_db: Failed: {e}")
         raise
 
 def create_event_table(connection):
-    cursor = connection.cursor()
+    """Create or upgrade the events table. Kept for callers that predate migrations."""
+    from src.database.migrations import migrate_database
     logger.info("Creating events table if not exists")
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            start_date TEXT NOT NULL,
-            end_date TEXT NOT NULL,
-            url TEXT NOT NULL,
-            description TEXT,
-            location TEXT,
-            address TEXT,
-            city TEXT,
-            region TEXT,
-            hashtags TEXT,  -- New column for hashtags
-            published BOOLEAN NOT NULL,
-            account_username TEXT NOT NULL,
-            config_name TEXT NOT NULL,
-            last_posted TEXT,  -- New column to track last posted timestamp
-            UNIQUE(title, start_date, url)
-        )
-    ''')
-    connection.commit()
+    migrate_database(connection)
 
 def create_publication_schedule_table(connection):
-    cursor = connection.cursor()
+    """Create or upgrade the publication_schedule table. Kept for callers that predate migrations."""
+    from src.database.migrations import migrate_database
     logger.info("Creating publication_schedule table if not exists")
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS publication_schedule (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            event_id INTEGER NOT NULL,
-            scheduled_time TEXT NOT NULL,
-            interval TEXT NOT NULL,
-            is_posted BOOLEAN NOT NULL DEFAULT 0,
-            FOREIGN KEY(event_id) REFERENCES events(id)
-        )
-    ''')
-    connection.commit()
+    migrate_database(connection)
 
-def check_event_exists(connection, title, start_date, url):
+def check_event_exists(connection, title, start_date, url, source_tz=None):
     """Check if an event already exists in the database"""
     cursor = connection.cursor()
     logger.info(f"Checking for existing event: {title} on {start_date}")
     cursor.execute('''
         SELECT id FROM events 
-        WHERE title = ? AND start_date = ? AND url = ?
-    ''', (title, start_date.isoformat(), url))
+        WHERE title = ? AND start_ts = ? AND url = ?
+    ''', (title, to_epoch(start_date, source_tz), url))
     result = cursor.fetchone()
     return result[0] if result else None
-def add_event(connection, title, start_date, end_date, url, description, location, address, city, region, hashtags, account_username, config_name):
+
+# Event columns that make up content_hash, in hashing order
+HASHED_COLUMNS = (
+    'title', 'start_ts', 'end_ts', 'source_tz', 'url', 'description',
+    'location', 'address', 'city', 'region', 'hashtags', 'image_url'
+)
+
+def content_hash(values):
+    """Hash the HASHED_COLUMNS of an event so a rescrape can tell whether it changed"""
+    text = '\x1f'.join('' if values.get(column) is None else str(values[column]) for column in HASHED_COLUMNS)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def _update_event(connection, event_id, values):
+    # Rewrite a changed event and refresh its duplicate index entry. An event
+    # that other events point to stays their canonical event.
+    assignments = ', '.join(f'{column} = ?' for column in values)
+    connection.execute(
+        f'UPDATE events SET {assignments} WHERE id = ?', tuple(values.values()) + (event_id,)
+    )
+    connection.execute('DELETE FROM event_index WHERE rowid = ?', (event_id,))
+    index_event(connection, event_id, values['title'], values['location'], values['start_ts'], values['source_tz'])
+    is_canonical = connection.execute(
+        'SELECT 1 FROM events WHERE duplicate_of = ? LIMIT 1', (event_id,)
+    ).fetchone()
+    if not is_canonical:
+        connection.execute('UPDATE events SET duplicate_of = NULL WHERE id = ?', (event_id,))
+        return True
+    return False
+
+def add_event(connection, title, start_date, end_date, url, description, location, address, city, region, hashtags, account_username, config_name, source_tz=None, canonical_sources=None, source_id=None, image_url=None):
+    """
+    Insert an event, or update it in place, and return its ID.
+
+    Naive start and end dates are wall-clock times in source_tz (system
+    local time if not given). They are stored as epoch seconds together with
+    the name of the timezone they were given in.
+
+    Events with a source_id are matched on (config_name, source_id), so a
+    rescheduled or renamed event updates its row instead of adding one; the
+    content hash skips the write when nothing changed. Call
+    schedule_event_posts afterwards to re-plan its schedule. Events without
+    a source_id are matched on (title, start, url).
+
+    New events are added to the duplicate index; an event that another
+    source already listed is marked with duplicate_of, with the source that
+    comes first in canonical_sources kept as the one that gets posted.
+    """
     cursor = connection.cursor()
     try:
-        # First check if event already exists
-        existing_event_id = check_event_exists(connection, title, start_date, url)
-        if existing_event_id:
-            logger.info(f"Event already exists with ID {existing_event_id}: {title}")
-            return existing_event_id
+        start_date = localize(start_date, source_tz)
+        values = {
+            'title': title, 'start_ts': to_epoch(start_date), 'end_ts': to_epoch(end_date, source_tz),
+            'source_tz': timezone_name(start_date), 'url': url, 'description': description,
+            'location': location, 'address': address, 'city': city, 'region': region, 'hashtags': hashtags,
+            'image_url': image_url
+        }
+        values['content_hash'] = content_hash(values)
+
+        existing = None
+        if source_id:
+            existing = cursor.execute(
+                'SELECT id, content_hash, source_id FROM events WHERE config_name = ? AND source_id = ?',
+                (config_name, source_id)
+            ).fetchone()
+        if existing is None:
+            # Rows stored before source IDs existed are adopted on their next scrape
+            existing_event_id = check_event_exists(connection, title, start_date, url, source_tz)
+            if existing_event_id:
+                existing = cursor.execute(
+                    'SELECT id, content_hash, source_id FROM events WHERE id = ?', (existing_event_id,)
+                ).fetchone()
+
+        if existing is not None:
+            event_id, stored_hash, stored_source_id = existing
+            if stored_hash == values['content_hash'] and stored_source_id == (source_id or stored_source_id):
+                logger.info(f"Event already exists with ID {event_id}: {title}")
+                return event_id
+            if source_id:
+                values['source_id'] = source_id
+            # Render the changed event again, see render_event_posts
+            values['post_template'] = None
+            if _update_event(connection, event_id, values):
+                resolve_duplicate(connection, event_id, canonical_sources)
+            connection.commit()
+            logger.info(f"Event updated with ID {event_id}: {title}")
+            return event_id
 
         logger.info(f"Adding new event: {title}")
         logger.debug(f"Event hashtags: {hashtags}")
-        cursor.execute('''
-            INSERT INTO events (
-                title, start_date, end_date, url, description, 
-                location, address, city, region, hashtags, published, 
-                account_username, config_name
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            title, start_date.isoformat(), end_date.isoformat(), 
-            url, description, location, address, city, region, hashtags,
-            False, account_username, config_name
-        ))
-        connection.commit()
+        values.update({
+            'published': False, 'account_username': account_username,
+            'config_name': config_name, 'source_id': source_id
+        })
+        cursor.execute(f'''
+            INSERT INTO events ({', '.join(values)})
+            VALUES ({', '.join('?' for _ in values)})
+        ''', tuple(values.values()))
         event_id = cursor.lastrowid
+        index_event(connection, event_id, title, location, values['start_ts'], values['source_tz'])
+        resolve_duplicate(connection, event_id, canonical_sources)
+        connection.commit()
         logger.info(f"Event added with ID: {event_id}")
         return event_id
     except sqlite3.IntegrityError as e:
+        connection.rollback()
         logger.error(f"Database integrity error for event '{title}': {e}")
         return None
     except Exception as e:
+        connection.rollback()
         logger.error(f"Failed to add event '{title}': {e}")
         return None
     
-def get_events(connection):
+# Rows fetched per query by the streaming readers
+EVENT_BATCH_SIZE = 500
+
+def _event_cursor(connection):
+    # Plain tuples are mapped straight to Event records, skipping sqlite3.Row
     cursor = connection.cursor()
+    cursor.row_factory = None
+    return cursor
+
+def _stream_events(connection, table, account_username, batch_size):
+    where = 'AND account_username = ?' if account_username is not None else ''
+    extra = (account_username,) if account_username is not None else ()
+    last_id = 0
+    while True:
+        cursor = _event_cursor(connection)
+        cursor.execute(f'''
+            SELECT {EVENT_COLUMNS} FROM {table}
+            WHERE id > ? {where}
+            ORDER BY id
+            LIMIT ?
+        ''', (last_id,) + extra + (batch_size,))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        make_event = event_factory(cursor)
+        for row in rows:
+            yield make_event(row)
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1][0]
+
+def get_events(connection, account_username=None, batch_size=EVENT_BATCH_SIZE):
+    """
+    Yield the stored events, optionally of one account, as Event records in
+    ID order. Rows are read in batches of batch_size with keyset pagination,
+    so only one batch is in memory at a time.
+    """
     logger.info("Fetching all events")
-    cursor.execute('SELECT * FROM events')
-    return cursor.fetchall()
+    return _stream_events(connection, 'events', account_username, batch_size)
+
+def get_archived_events(connection, account_username=None, batch_size=EVENT_BATCH_SIZE):
+    """Yield the events moved out by archive_past_events, like get_events"""
+    logger.info("Fetching archived events")
+    return _stream_events(connection, 'events_archive', account_username, batch_size)
 
 def get_event_by_id(connection, event_id):
-    """Get event by ID and return as dictionary"""
-    cursor = connection.cursor()
+    """Get event by ID as an Event record, or None"""
+    cursor = _event_cursor(connection)
     logger.info(f"Fetching event with ID: {event_id}")
-    
-    # Get column names from the events table
-    cursor.execute('PRAGMA table_info(events)')
-    columns = [column[1] for column in cursor.fetchall()]
-    
-    cursor.execute('SELECT * FROM events WHERE id = ?', (event_id,))
+    cursor.execute(f'SELECT {EVENT_COLUMNS} FROM events WHERE id = ?', (event_id,))
     row = cursor.fetchone()
-    
-    if (row):
-        # Convert tuple to dictionary with column names
-        event_dict = dict(zip(columns, row))
-        logger.info(f"Found event: {event_dict['title']}")
-        return event_dict
-    
+
+    if row:
+        event = event_factory(cursor)(row)
+        logger.info(f"Found event: {event.title}")
+        return event
+
     logger.warning(f"No event found with ID: {event_id}")
     return None
 
@@ -150,142 +283,519 @@ def calculate_post_timings(event_date):
     ]
     return [event_date - interval for interval in intervals]
 
-def mark_post_as_executed(connection, schedule_id):
+# Update interval labels accepted in the website configuration
+INTERVAL_MAP = {
+    "30 days": timedelta(days=30),
+    "2 weeks": timedelta(days=14),
+    "5 days": timedelta(days=5),
+    "1 day": timedelta(days=1)
+}
+# Schedule entries store their interval as str(timedelta)
+INTERVAL_LABELS = {str(delta): label for label, delta in INTERVAL_MAP.items()}
+
+# How long an event is kept after it starts
+PAST_EVENT_RETENTION = timedelta(hours=24)
+
+# How long a claimed schedule entry is reserved before another run may take it
+CLAIM_TIMEOUT = timedelta(minutes=15)
+
+# Events moved to the archive tables per transaction
+ARCHIVE_BATCH_SIZE = 500
+
+# Columns of publication_schedule, copied as they are into publication_schedule_archive
+SCHEDULE_COLUMNS = 'id, event_id, scheduled_ts, interval, is_posted, claimed_ts'
+
+def archive_past_events(connection, account_username, now=None, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move events for an account that started more than PAST_EVENT_RETENTION
+    ago, together with their publication schedule and their cross-source
+    duplicates, to events_archive and publication_schedule_archive.
+
+    Events are moved batch_size at a time, each batch in its own transaction,
+    so the write lock is only held briefly and the hot tables keep nothing
+    but upcoming events.
+
+    Returns:
+        int: The number of events archived.
+    """
+    now = to_epoch(now) if now else now_epoch()
+    cutoff = now - int(PAST_EVENT_RETENTION.total_seconds())
     cursor = connection.cursor()
-    logger.info(f"Marking post as executed for schedule_id: {schedule_id}")
+    # The IDs of a batch are kept in a temp table rather than bound as
+    # parameters, so a batch with many duplicates stays under SQLite's
+    # limit on host parameters
+    cursor.execute('CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)')
+    archived = 0
+    while True:
+        try:
+            cursor.execute('''
+                INSERT INTO archive_batch (id)
+                SELECT id FROM events
+                WHERE account_username = ? AND start_ts < ?
+                ORDER BY start_ts
+                LIMIT ?
+            ''', (account_username, cutoff, batch_size))
+            batch_count = cursor.rowcount
+            if not batch_count:
+                connection.rollback()
+                break
+            # Duplicates, of any account, go with their canonical event;
+            # deleting it alone would promote them to events of their own,
+            # see duplicates.py
+            cursor.execute('''
+                INSERT OR IGNORE INTO archive_batch (id)
+                SELECT id FROM events WHERE duplicate_of IN (SELECT id FROM archive_batch)
+            ''')
+            count = cursor.execute('SELECT COUNT(*) FROM archive_batch').fetchone()[0]
+            cursor.execute(f'''
+                INSERT INTO events_archive ({EVENT_COLUMNS}, content_hash, archived_ts)
+                SELECT {EVENT_COLUMNS}, content_hash, ? FROM events WHERE id IN (SELECT id FROM archive_batch)
+            ''', (now,))
+            cursor.execute(f'''
+                INSERT INTO publication_schedule_archive ({SCHEDULE_COLUMNS}, archived_ts)
+                SELECT {SCHEDULE_COLUMNS}, ? FROM publication_schedule
+                WHERE event_id IN (SELECT id FROM archive_batch)
+            ''', (now,))
+            cursor.execute('DELETE FROM publication_schedule WHERE event_id IN (SELECT id FROM archive_batch)')
+            cursor.execute('DELETE FROM events WHERE id IN (SELECT id FROM archive_batch)')
+            cursor.execute('DELETE FROM archive_batch')
+            connection.commit()
+        except Exception as e:
+            connection.rollback()
+            logger.error(f"archive_past_events: Failed: {e}")
+            raise
+        archived += count
+        if batch_count < batch_size:
+            break
+    if archived:
+        logger.info(f"Archived {archived} events older than {PAST_EVENT_RETENTION} for {account_username}")
+    return archived
+
+def get_update_intervals(website_config):
+    """Return the timedeltas for the configured update intervals, ignoring unknown labels"""
+    return [INTERVAL_MAP[label] for label in website_config.get("update_intervals", []) if label in INTERVAL_MAP]
+
+def get_due_posts(connection, account_username, now=None):
+    """
+    Return the events of an account that have a publication_schedule entry
+    which is due, not yet posted and not claimed by another run. Events
+    marked as duplicates of another source's event are left out, and so are
+    past events that archive_past_events has not moved out yet.
+
+    Due entries are found with a range scan of the (is_posted, scheduled_ts)
+    index. When several entries of one event are due (for example an event
+    first scraped 10 days before it starts), only the latest is returned;
+    completing it also completes the earlier ones. Each returned Event carries
+    the schedule_id to claim and complete.
+    """
+    now = to_epoch(now) if now else now_epoch()
+    cursor = _event_cursor(connection)
+    # SQLite takes the bare columns of an aggregate query from the row that
+    # holds the MAX(), so the schedule columns belong to the latest due entry
     cursor.execute('''
-        UPDATE publication_schedule
-        SET is_posted = ?
-        WHERE id = ?
-    ''', (True, schedule_id))
-    connection.commit()
+        SELECT e.id, e.title, e.start_ts, e.end_ts, e.source_tz, e.url, e.description, e.location,
+               e.address, e.city, e.region, e.hashtags, e.published, e.account_username,
+               e.config_name, e.last_posted_ts, e.duplicate_of, e.source_id, e.image_url,
+               e.post_text, e.post_facets,
+               ps.id AS schedule_id, ps.interval AS schedule_interval, ps.scheduled_ts,
+               MAX(ps.scheduled_ts) AS latest_due
+        FROM publication_schedule ps
+        JOIN events e ON e.id = ps.event_id
+        WHERE ps.is_posted = 0
+          AND ps.scheduled_ts <= ?
+          AND (ps.claimed_ts IS NULL OR ps.claimed_ts < ?)
+          AND e.account_username = ?
+          AND e.duplicate_of IS NULL
+          AND e.start_ts >= ?
+          AND (e.last_posted_ts IS NULL OR e.last_posted_ts < ps.scheduled_ts)
+        GROUP BY ps.event_id
+        ORDER BY e.start_ts
+    ''', (
+        now, now - int(CLAIM_TIMEOUT.total_seconds()), account_username,
+        now - int(PAST_EVENT_RETENTION.total_seconds())
+    ))
+    make_event = event_factory(cursor)
+    return [make_event(row) for row in cursor.fetchall()]
 
 def get_postable_events(connection, website_config):
     """
-    Dynamically identify events that should be posted based on their start date
-    and configured intervals. Past events are removed from the database.
+    Return the due posts of the account of a website, see get_due_posts.
+    Past events are moved out beforehand by archive_past_events.
     """
     logger.info(f"Checking for events to post for {website_config['name']}")
-    cursor = connection.cursor()
+    if not get_update_intervals(website_config):
+        logger.warning(f"No valid intervals found for {website_config['name']}")
+        return []
 
-    interval_map = {
-        "30 days": timedelta(days=30),
-        "2 weeks": timedelta(days=14),
-        "5 days": timedelta(days=5),
-        "1 day": timedelta(days=1)
-    }
+    events_to_post = get_due_posts(connection, website_config['account_username'])
+    for event in events_to_post:
+        logger.info(
+            f"Event evaluated: '{event.title}', Event date: {from_epoch(event.start_ts, event.source_tz)}, "
+            f"Last posted: {from_epoch(event.last_posted_ts) or 'Never'}, "
+            f"Due since: {from_epoch(event.scheduled_ts)} (schedule {event.schedule_id}, interval {event.schedule_interval})"
+        )
 
-    now = datetime.now()
-    events_to_post = []
+    logger.info(f"Found {len(events_to_post)} events to post for {website_config['name']}")
+    return events_to_post
 
-    # Determine the maximum interval for this website
-    intervals = [interval_map[i] for i in website_config["update_intervals"] if i in interval_map]
-    if not intervals:
-        logger.warning(f"No valid intervals found for {website_config['name']}")
-        return []
+def claim_scheduled_post(connection, schedule_id, now=None, commit=True):
+    """
+    Claim a due publication_schedule entry, and the earlier unposted entries
+    of the same event that it supersedes, before posting it.
 
-    max_interval = max(intervals)
+    Returns:
+        bool: True if this caller now owns the entry, False if it was already
+        posted or is claimed by another run. Claims older than CLAIM_TIMEOUT
+        are treated as abandoned and can be taken over.
 
+    This and the other schedule updates take commit=False to leave the
+    change in the open transaction, for callers that group commits.
+    """
+    now = to_epoch(now) if now else now_epoch()
+    stale_before = now - int(CLAIM_TIMEOUT.total_seconds())
+    cursor = connection.cursor()
     cursor.execute('''
-        SELECT id, title, start_date, end_date, url, description, location, 
-               address, city, region, hashtags, published, account_username, config_name, last_posted
-        FROM events
-        WHERE account_username = ?
-    ''', (website_config['account_username'],))
-
-    for row in cursor.fetchall():
-        event = dict(row)
-        event_start = datetime.fromisoformat(event['start_date'])
-        time_until_event = event_start - now
-
-        if time_until_event < -timedelta(hours=24):
-            logger.info(
-                f"Event evaluated: '{event['title']}' is older than 24 hours (start: {event_start}). Removing event from the database."
-            )
-            cursor.execute("DELETE FROM events WHERE id = ?", (event['id'],))
-            connection.commit()
-            continue
-
-        # Compute thresholds status for each configured update interval
-        last_posted = event['last_posted']
-        last_posted_dt = datetime.fromisoformat(last_posted) if last_posted else None
-        thresholds_status = {}
-        next_post_time = None
-        min_delta = None
-        for interval_str in website_config['update_intervals']:
-            delta = interval_map.get(interval_str)
-            scheduled_time = event_start - delta
-            status = "Posted" if last_posted_dt and (last_posted_dt >= scheduled_time) else "Pending"
-            thresholds_status[interval_str] = status
-
-            if scheduled_time > now and status == "Pending":
-                diff = scheduled_time - now
-                if min_delta is None or diff < min_delta:
-                    min_delta = diff
-                    next_post_time = scheduled_time
-
-        # Log evaluation details for every event
-        logger.info(
-            f"Event: '{event['title']}', Event date: {event_start}, "
-            f"Time until next post: {min_delta if next_post_time else 'N/A'}, "
-            f"Configured update intervals: {website_config['update_intervals']}, "
-            f"Thresholds status: {thresholds_status}"
+        UPDATE publication_schedule
+        SET claimed_ts = ?
+        WHERE is_posted = 0
+          AND event_id = (SELECT event_id FROM publication_schedule WHERE id = ?)
+          AND scheduled_ts <= (SELECT scheduled_ts FROM publication_schedule WHERE id = ?)
+          AND EXISTS (
+              SELECT 1 FROM publication_schedule target
+              WHERE target.id = ? AND target.is_posted = 0
+                AND (target.claimed_ts IS NULL OR target.claimed_ts < ?)
+          )
+    ''', (now, schedule_id, schedule_id, schedule_id, stale_before))
+    if commit:
+        connection.commit()
+    claimed = cursor.rowcount > 0
+    if not claimed:
+        logger.info(f"Schedule entry {schedule_id} is already posted or claimed")
+    return claimed
+
+def release_scheduled_post(connection, schedule_id, commit=True):
+    """Give up a claim so that the entry is picked up again by the next run"""
+    cursor = connection.cursor()
+    logger.info(f"Releasing claim on schedule_id: {schedule_id}")
+    cursor.execute('''
+        UPDATE publication_schedule
+        SET claimed_ts = NULL
+        WHERE is_posted = 0
+          AND event_id = (SELECT event_id FROM publication_schedule WHERE id = ?)
+    ''', (schedule_id,))
+    if commit:
+        connection.commit()
+
+def mark_post_as_executed(connection, schedule_id, commit=True):
+    """
+    Complete a schedule entry. Earlier unposted entries of the same event are
+    completed as well, since the post that was just sent supersedes them.
+    """
+    cursor = connection.cursor()
+    logger.info(f"Marking post as executed for schedule_id: {schedule_id}")
+    cursor.execute('''
+        UPDATE publication_schedule
+        SET is_posted = 1, claimed_ts = NULL
+        WHERE is_posted = 0 AND event_id = (
+            SELECT event_id FROM publication_schedule WHERE id = ?
+        ) AND scheduled_ts <= (
+            SELECT scheduled_ts FROM publication_schedule WHERE id = ?
         )
+    ''', (schedule_id, schedule_id))
+    if commit:
+        connection.commit()
 
-        if time_until_event > max_interval:
-            logger.info(
-                f"Event evaluated: '{event['title']}' is not yet eligible. "
-                f"Time until event: {time_until_event} exceeds max interval: {max_interval}"
-            )
-            continue
-
-        if last_posted:
-            eligible = False
-            for interval_str in website_config['update_intervals']:
-                delta = interval_map.get(interval_str)
-                scheduled_time = event_start - delta
-                # Only allow a new post if the last post was before this interval's threshold
-                if now >= scheduled_time and (now - last_posted_dt) > delta:
-                    eligible = True
-                    break
-
-            if not eligible:
-                logger.info(
-                    f"Event evaluated: '{event['title']}' was already posted at {last_posted_dt} "
-                    f"and does not qualify for any interval."
-                )
-                continue
-
-        # Evaluate against each configured threshold; if any qualifies, add event to post
-        qualified = False
-        for interval_str in website_config['update_intervals']:
-            delta = interval_map.get(interval_str)
-            if delta and time_until_event <= delta:
-                next_post_for_interval = event_start - delta
-                logger.info(
-                    f"Event evaluated: '{event['title']}'. Last posted: "
-                    f"{last_posted if last_posted else 'Never'}, "
-                    f"Next post scheduled for: {next_post_for_interval} "
-                    f"(meets threshold: {interval_str})"
-                )
-                events_to_post.append(event)
-                qualified = True
+def schedule_event_posts(connection, event_id, event_start_date, intervals, source_tz=None):
+    """
+    Plan a post for each interval before the event starts. Entries that
+    already exist for an interval are moved to the new time unless they were
+    posted, so calling this again after an event is rescheduled re-plans
+    its schedule instead of adding to it.
+    """
+    cursor = connection.cursor()
+    start_ts = to_epoch(event_start_date, source_tz)
+    planned = {row[0] for row in cursor.execute(
+        'SELECT interval FROM publication_schedule WHERE event_id = ?', (event_id,)
+    ).fetchall()}
+    for interval in intervals:
+        scheduled_ts = start_ts - int(interval.total_seconds())
+        if str(interval) in planned:
+            cursor.execute('''
+                UPDATE publication_schedule SET scheduled_ts = ?
+                WHERE event_id = ? AND interval = ? AND is_posted = 0 AND scheduled_ts != ?
+            ''', (scheduled_ts, event_id, str(interval), scheduled_ts))
+        else:
+            cursor.execute('''
+                INSERT INTO publication_schedule (event_id, scheduled_ts, interval, is_posted)
+                VALUES (?, ?, ?, ?)
+            ''', (event_id, scheduled_ts, str(interval), False))
+    connection.commit()
+
+def unschedule_intervals(connection, account_username, config_name, labels):
+    """
+    Delete the pending entries of a website's events for the given update
+    interval labels, once plan_intervals stops scheduling them. Posted
+    entries stay for get_interval_engagement, and claimed ones for the run
+    that holds them.
+
+    Returns:
+        int: The number of entries deleted.
+    """
+    intervals = [str(INTERVAL_MAP[label]) for label in labels if label in INTERVAL_MAP]
+    if not intervals:
+        return 0
+    placeholders = ', '.join('?' for _ in intervals)
+    cursor = connection.execute(f'''
+        DELETE FROM publication_schedule
+        WHERE is_posted = 0 AND claimed_ts IS NULL AND interval IN ({placeholders})
+          AND event_id IN (SELECT id FROM events WHERE account_username = ? AND config_name = ?)
+    ''', intervals + [account_username, config_name])
+    connection.commit()
+    if cursor.rowcount:
+        logger.info(f"unschedule_intervals: Deleted {cursor.rowcount} pending posts of {config_name} for {', '.join(labels)}")
+    return cursor.rowcount
+
+def mark_event_posted(connection, event_id, posted_at=None, commit=True):
+    """Record when an event was last posted"""
+    cursor = connection.cursor()
+    cursor.execute('''
+        UPDATE events 
+        SET last_posted_ts = ? 
+        WHERE id = ?
+    ''', (to_epoch(posted_at) if posted_at else now_epoch(), event_id))
+    if commit:
+        connection.commit()
+
+def render_event_posts(connection, config_name, template, batch_size=EVENT_BATCH_SIZE):
+    """
+    Store the post text and facets of a site's events that are new, changed
+    or were rendered with another template. template needs a key and a
+    render(event) method returning text and facets, see
+    src/bluesky/templates.py. Unchanged events are not rendered again.
+
+    Returns:
+        int: The number of events rendered.
+    """
+    cursor = _event_cursor(connection)
+    rendered = 0
+    try:
+        while True:
+            cursor.execute(f'''
+                SELECT {EVENT_COLUMNS} FROM events
+                WHERE config_name = ? AND (post_template IS NULL OR post_template != ?)
+                LIMIT ?
+            ''', (config_name, template.key, batch_size))
+            make_event = event_factory(cursor)
+            events = [make_event(row) for row in cursor.fetchall()]
+            if not events:
                 break
-        if not qualified:
-            logger.info(
-                f"Event evaluated: '{event['title']}' does not meet any posting threshold. "
-                f"Time until event: {time_until_event}"
+            updates = []
+            for event in events:
+                try:
+                    post = template.render(event)
+                    updates.append((post.text, post.facets_json, template.key, event.id))
+                except Exception as e:
+                    # Posted with the default template instead, see templates.post_content
+                    logger.error(f"render_event_posts: Failed to render '{event.title}': {e}")
+                    updates.append((None, None, template.key, event.id))
+            connection.executemany(
+                'UPDATE events SET post_text = ?, post_facets = ?, post_template = ? WHERE id = ?', updates
             )
+            connection.commit()
+            rendered += len(updates)
+    except Exception as e:
+        connection.rollback()
+        logger.error(f"render_event_posts: Failed: {e}")
+        raise
+    logger.info(f"render_event_posts: Rendered {rendered} posts for {config_name}")
+    return rendered
 
-    logger.info(f"Found {len(events_to_post)} events to post for {website_config['name']}")
-    return events_to_post
+def get_cached_thumbnail(connection, image_url):
+    """Return (content_hash, mime_type, data) of an image that was already downloaded, or None"""
+    return connection.execute(
+        'SELECT content_hash, mime_type, data FROM thumbnails WHERE image_url = ?', (image_url,)
+    ).fetchone()
+
+def get_thumbnail_blob(connection, content_hash, account_username):
+    """Return the blob an account uploaded for a thumbnail, as JSON, or None"""
+    row = connection.execute(
+        'SELECT blob_ref FROM thumbnail_blobs WHERE content_hash = ? AND account_username = ?',
+        (content_hash, account_username)
+    ).fetchone()
+    return row[0] if row else None
 
-def schedule_event_posts(connection, event_id, event_start_date, intervals):
+def save_thumbnail(connection, image_url, content_hash, mime_type, data, account_username, blob_ref, commit=True):
+    """Record a downloaded thumbnail with its bytes and the blob an account uploaded for it"""
+    now = now_epoch()
+    connection.execute('''
+        INSERT OR REPLACE INTO thumbnails (image_url, content_hash, mime_type, size, fetched_ts, data)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (image_url, content_hash, mime_type, len(data), now, data))
+    connection.execute('''
+        INSERT OR REPLACE INTO thumbnail_blobs (content_hash, account_username, blob_ref, uploaded_ts)
+        VALUES (?, ?, ?, ?)
+    ''', (content_hash, account_username, blob_ref, now))
+    if commit:
+        connection.commit()
+
+def add_post_intent(connection, event, rkey, now=None, commit=True):
+    """
+    Record that event is about to be posted under record key rkey. Written
+    before the post is sent, so a post whose completion was lost can be
+    found again, see reconcile_post_intents in src/bluesky/outbox.py.
+
+    Returns:
+        int: The ID of the intent.
+    """
     cursor = connection.cursor()
-    for interval in intervals:
-        scheduled_time = event_start_date - interval
-        cursor.execute('''
-            INSERT INTO publication_schedule (event_id, scheduled_time, interval, is_posted)
-            VALUES (?, ?, ?, ?)
-        ''', (event_id, scheduled_time.isoformat(), str(interval), False))
-    connection.commit()
\ No newline at end of file
+    cursor.execute('''
+        INSERT INTO post_outbox (schedule_id, event_id, account_username, rkey, intent_ts)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (event.schedule_id, event.id, event.account_username, rkey, to_epoch(now) if now else now_epoch()))
+    if commit:
+        connection.commit()
+    return cursor.lastrowid
+
+def complete_post_intent(connection, intent_id, uri, cid, posted_at=None, commit=True):
+    """Store the URI and CID of a sent post and complete its event and schedule entry"""
+    posted_ts = to_epoch(posted_at) if posted_at else now_epoch()
+    row = connection.execute(
+        'SELECT event_id, schedule_id FROM post_outbox WHERE id = ?', (intent_id,)
+    ).fetchone()
+    connection.execute('''
+        UPDATE post_outbox SET status = 'posted', uri = ?, cid = ?, posted_ts = ?
+        WHERE id = ?
+    ''', (uri, cid, posted_ts, intent_id))
+    mark_event_posted(connection, row[0], posted_ts, commit=False)
+    if row[1] is not None:
+        mark_post_as_executed(connection, row[1], commit=False)
+    if commit:
+        connection.commit()
+
+def discard_post_intent(connection, intent_id, commit=True):
+    """Drop the intent of a post that was not created and release its schedule claim"""
+    row = connection.execute('SELECT schedule_id FROM post_outbox WHERE id = ?', (intent_id,)).fetchone()
+    connection.execute("DELETE FROM post_outbox WHERE id = ? AND status = 'pending'", (intent_id,))
+    if row and row[0] is not None:
+        release_scheduled_post(connection, row[0], commit=False)
+    if commit:
+        connection.commit()
+
+def get_pending_intents(connection, account_username, now=None):
+    """
+    Return (id, rkey) of the account's intents whose outcome is unknown,
+    newest first. Like claims, intents younger than CLAIM_TIMEOUT may belong
+    to a run that is still posting and are left alone.
+    """
+    now = to_epoch(now) if now else now_epoch()
+    return [tuple(row) for row in connection.execute('''
+        SELECT id, rkey FROM post_outbox
+        WHERE account_username = ? AND status = 'pending' AND intent_ts <= ?
+        ORDER BY rkey DESC
+    ''', (account_username, now - int(CLAIM_TIMEOUT.total_seconds())))]
+
+def get_post_uris(connection, account_username, config_name=None):
+    """
+    Return the URIs of the account's posts recorded in the outbox, optionally
+    only those of events from config_name, archived events included.
+    """
+    if config_name is None:
+        rows = connection.execute('''
+            SELECT uri FROM post_outbox WHERE account_username = ? AND status = 'posted'
+        ''', (account_username,))
+    else:
+        rows = connection.execute('''
+            SELECT o.uri FROM post_outbox o
+            WHERE o.account_username = ? AND o.status = 'posted' AND o.event_id IN (
+                SELECT id FROM events WHERE config_name = ?
+                UNION ALL
+                SELECT id FROM events_archive WHERE config_name = ?
+            )
+        ''', (account_username, config_name, config_name))
+    return {row[0] for row in rows}
+
+def mark_posts_deleted(connection, account_username, rkeys):
+    """Mark the account's outbox posts with these record keys as deleted from Bluesky"""
+    connection.executemany(
+        "UPDATE post_outbox SET status = 'deleted' WHERE account_username = ? AND rkey = ?",
+        [(account_username, rkey) for rkey in rkeys]
+    )
+    connection.commit()
+
+def get_posts_to_measure(connection, account_username, window, interval, now=None):
+    """
+    Return the URIs of the account's posts from the last window (a
+    timedelta) whose engagement was not checked within interval, those
+    never checked or checked longest ago first.
+    """
+    now = to_epoch(now) if now else now_epoch()
+    # The timestamps are only compared in SQL, as the epoch integers they
+    # are stored as; the UTCEPOCH converter applies to selected columns
+    return [row[0] for row in connection.execute('''
+        SELECT uri FROM post_outbox
+        WHERE account_username = ? AND status = 'posted' AND posted_ts >= ?
+        GROUP BY uri
+        HAVING COALESCE(MAX(metrics_ts), 0) <= ?
+        ORDER BY COALESCE(MAX(metrics_ts), 0), MIN(posted_ts)
+    ''', (account_username, now - int(window.total_seconds()), now - int(interval.total_seconds())))]
+
+def record_post_metrics(connection, uris, counts, now=None):
+    """
+    Store the engagement of checked posts. counts maps URIs to (likes,
+    reposts, replies, quotes); a sample is only added for posts whose counts
+    changed since their last one. Every URI in uris is marked as checked,
+    including posts that no longer exist and are missing from counts.
+
+    Returns:
+        int: The number of samples added.
+    """
+    now = to_epoch(now) if now else now_epoch()
+    placeholders = ', '.join('?' for _ in uris)
+    latest = {row[0]: tuple(row[1:]) for row in connection.execute(f'''
+        SELECT m.uri, m.likes, m.reposts, m.replies, m.quotes FROM post_metrics m
+        WHERE m.uri IN ({placeholders})
+          AND m.fetched_ts = (SELECT MAX(fetched_ts) FROM post_metrics WHERE uri = m.uri)
+    ''', list(uris))}
+    changed = [(uri,) + tuple(values) for uri, values in counts.items() if latest.get(uri) != tuple(values)]
+    connection.executemany('''
+        INSERT OR REPLACE INTO post_metrics (uri, fetched_ts, likes, reposts, replies, quotes)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(row[0], now) + row[1:] for row in changed])
+    connection.executemany('UPDATE post_outbox SET metrics_ts = ? WHERE uri = ?', [(now, uri) for uri in uris])
+    connection.commit()
+    return len(changed)
+
+def get_interval_engagement(connection, account_username, config_name=None):
+    """
+    Return how the account's posts did by the update interval that posted
+    them, optionally only those of events from config_name: a dict of
+    interval label -> (measured posts, mean likes + reposts + replies +
+    quotes in their latest sample). Archived events and schedules count.
+    """
+    event_filter = ''
+    params = [account_username]
+    if config_name is not None:
+        event_filter = '''AND o.event_id IN (
+            SELECT id FROM events WHERE config_name = ?
+            UNION ALL
+            SELECT id FROM events_archive WHERE config_name = ?
+        )'''
+        params += [config_name, config_name]
+    rows = connection.execute(f'''
+        WITH schedule AS (
+            SELECT id, interval FROM publication_schedule
+            UNION ALL
+            SELECT id, interval FROM publication_schedule_archive
+        ),
+        posts AS (
+            SELECT DISTINCT s.interval, o.uri FROM post_outbox o
+            JOIN schedule s ON s.id = o.schedule_id
+            WHERE o.account_username = ? AND o.status != 'pending' {event_filter}
+        )
+        SELECT p.interval, COUNT(*), AVG(m.likes + m.reposts + m.replies + m.quotes)
+        FROM posts p
+        JOIN post_metrics m ON m.uri = p.uri
+            AND m.fetched_ts = (SELECT MAX(fetched_ts) FROM post_metrics WHERE uri = p.uri)
+        GROUP BY p.interval
+    ''', params).fetchall()
+    return {INTERVAL_LABELS.get(row[0], row[0]): (row[1], row[2]) for row in rows}
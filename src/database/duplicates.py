@@ -0,0 +1,139 @@
+import re
+import logging
+import unicodedata
+from src.database.timestamps import from_epoch
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bluesky-event-sync.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Minimum similarity for two events from different sources to be the same event
+DUPLICATE_THRESHOLD = 0.6
+
+# Weight of the venue when both events have one; the title makes up the rest
+VENUE_WEIGHT = 0.25
+
+# Candidates fetched from the index per lookup, best FTS5 rank first
+MAX_CANDIDATES = 20
+
+STOPWORDS = frozenset({
+    'a', 'an', 'and', 'at', 'by', 'for', 'from', 'in', 'of', 'on', 'or', 'the', 'to', 'with'
+})
+
+def normalize_tokens(text):
+    """Lowercase, strip accents and punctuation and drop stopwords"""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+    return [token for token in re.findall(r'[a-z0-9]+', text) if token not in STOPWORDS]
+
+def day_token(start_ts, source_tz):
+    """The local calendar day an event starts on, as an index token"""
+    return from_epoch(start_ts, source_tz).strftime('d%Y%m%d')
+
+def _jaccard(first, second):
+    first, second = set(first), set(second)
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+def similarity(title, venue, other_title, other_venue):
+    """Score two normalized events between 0 and 1"""
+    score = _jaccard(title, other_title)
+    if venue and other_venue:
+        score = (1 - VENUE_WEIGHT) * score + VENUE_WEIGHT * _jaccard(venue, other_venue)
+    return score
+
+def index_event(connection, event_id, title, location, start_ts, source_tz):
+    """Add an event to the duplicate index. Deleting the event removes it through a trigger."""
+    connection.execute(
+        'INSERT INTO event_index (rowid, title, venue, day) VALUES (?, ?, ?, ?)',
+        (event_id, ' '.join(normalize_tokens(title)), ' '.join(normalize_tokens(location)),
+         day_token(start_ts, source_tz))
+    )
+
+def find_duplicate(connection, event_id):
+    """
+    Return (event_id, score) of the most similar indexed event from another
+    source that starts on the same day, or None.
+
+    The lookup is a single FTS5 MATCH on the day token and any of the title
+    tokens, so its cost depends on the number of candidates rather than the
+    size of the events table.
+    """
+    row = connection.execute(
+        'SELECT i.title, i.venue, i.day, e.config_name FROM event_index i JOIN events e ON e.id = i.rowid WHERE i.rowid = ?',
+        (event_id,)
+    ).fetchone()
+    if row is None or not row[0]:
+        return None
+    title, venue, day, config_name = row[0].split(), row[1].split(), row[2], row[3]
+
+    terms = ' OR '.join(f'"{token}"' for token in sorted(set(title)))
+    query = f'day:{day} AND title:({terms})'
+    candidates = connection.execute('''
+        SELECT e.id, i.title, i.venue
+        FROM event_index i
+        JOIN events e ON e.id = i.rowid
+        WHERE event_index MATCH ?
+          AND e.id != ?
+          AND e.config_name != ?
+        ORDER BY i.rank
+        LIMIT ?
+    ''', (query, event_id, config_name, MAX_CANDIDATES)).fetchall()
+
+    best = None
+    for candidate_id, candidate_title, candidate_venue in candidates:
+        score = similarity(title, venue, candidate_title.split(), candidate_venue.split())
+        if score >= DUPLICATE_THRESHOLD and (best is None or score > best[1]):
+            best = (candidate_id, score)
+    return best
+
+def _source_rank(config_name, canonical_sources):
+    sources = list(canonical_sources or [])
+    return sources.index(config_name) if config_name in sources else len(sources)
+
+def resolve_duplicate(connection, event_id, canonical_sources=None):
+    """
+    Mark a newly indexed event as a duplicate of a matching event from
+    another source, or make it the canonical event of that group when its
+    source comes first in canonical_sources and the group has not been
+    posted yet. Does not commit.
+
+    Returns:
+        int: ID of the canonical event of the group, or None if the event
+        has no duplicate.
+    """
+    match = find_duplicate(connection, event_id)
+    if match is None:
+        return None
+    candidate_id, score = match
+
+    canonical_id, canonical_source, last_posted = connection.execute('''
+        SELECT id, config_name, last_posted_ts FROM events
+        WHERE id = (SELECT COALESCE(duplicate_of, id) FROM events WHERE id = ?)
+    ''', (candidate_id,)).fetchone()
+    config_name = connection.execute('SELECT config_name FROM events WHERE id = ?', (event_id,)).fetchone()[0]
+    if canonical_source == config_name:
+        # Only cross-source copies are duplicates; the source lists both on purpose
+        return None
+
+    if last_posted is None and _source_rank(config_name, canonical_sources) < _source_rank(canonical_source, canonical_sources):
+        connection.execute(
+            'UPDATE events SET duplicate_of = ? WHERE id = ? OR duplicate_of = ?',
+            (event_id, canonical_id, canonical_id)
+        )
+        logger.info(f"Event {event_id} ({config_name}) replaces {canonical_id} ({canonical_source}) as canonical, score {score:.2f}")
+        return event_id
+
+    connection.execute('UPDATE events SET duplicate_of = ? WHERE id = ?', (canonical_id, event_id))
+    logger.info(f"Event {event_id} ({config_name}) is a duplicate of {canonical_id} ({canonical_source}), score {score:.2f}")
+    return canonical_id
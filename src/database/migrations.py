@@ -0,0 +1,521 @@
+import re
+import logging
+import unicodedata
+from datetime import datetime, timedelta
+from src.database.timestamps import EPOCH_DECLTYPE, DEFAULT_SOURCE_TZ, iso_to_epoch, from_epoch
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bluesky-event-sync.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+def _column_names(connection, table):
+    return [row[1] for row in connection.execute(f'PRAGMA table_info({table})').fetchall()]
+
+def _create_base_tables(connection):
+    # The schema as it was before migrations existed; later versions alter it
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            url TEXT NOT NULL,
+            description TEXT,
+            location TEXT,
+            address TEXT,
+            city TEXT,
+            region TEXT,
+            hashtags TEXT,
+            published BOOLEAN NOT NULL,
+            account_username TEXT NOT NULL,
+            config_name TEXT NOT NULL,
+            last_posted TEXT,
+            UNIQUE(title, start_date, url)
+        )
+    ''')
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS publication_schedule (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_id INTEGER NOT NULL,
+            scheduled_time TEXT NOT NULL,
+            interval TEXT NOT NULL,
+            is_posted BOOLEAN NOT NULL DEFAULT 0,
+            FOREIGN KEY(event_id) REFERENCES events(id)
+        )
+    ''')
+
+def _add_hashtags_and_last_posted(connection):
+    # Databases created before these columns were added to the DDL lack them
+    columns = _column_names(connection, 'events')
+    if 'hashtags' not in columns:
+        connection.execute('ALTER TABLE events ADD COLUMN hashtags TEXT')
+    if 'last_posted' not in columns:
+        connection.execute('ALTER TABLE events ADD COLUMN last_posted TEXT')
+
+def _create_hot_path_indexes(connection):
+    # get_postable_events: WHERE account_username = ? [AND start_date ...]
+    connection.execute('''
+        CREATE INDEX IF NOT EXISTS idx_events_account_start
+        ON events(account_username, start_date)
+    ''')
+    # Due posts: WHERE is_posted = 0 AND scheduled_time <= ?
+    connection.execute('''
+        CREATE INDEX IF NOT EXISTS idx_publication_schedule_due
+        ON publication_schedule(is_posted, scheduled_time)
+    ''')
+    # Foreign key lookups and deletes by event
+    connection.execute('''
+        CREATE INDEX IF NOT EXISTS idx_publication_schedule_event
+        ON publication_schedule(event_id)
+    ''')
+
+# Migrations keep their own copies of the constants and logic they use, as
+# they were when the migration was released, so that changing the live code
+# never changes what an old migration does
+
+# The update intervals at migration 4
+_V4_INTERVALS = (timedelta(days=30), timedelta(days=14), timedelta(days=5), timedelta(days=1))
+
+def _backfill_publication_schedule(connection):
+    # publication_schedule becomes the source of truth for due posts, so every
+    # event needs entries and entries already covered by last_posted must not
+    # be posted again
+    if 'claimed_at' not in _column_names(connection, 'publication_schedule'):
+        connection.execute('ALTER TABLE publication_schedule ADD COLUMN claimed_at TEXT')
+
+    unscheduled = connection.execute('''
+        SELECT id, start_date FROM events e
+        WHERE NOT EXISTS (SELECT 1 FROM publication_schedule ps WHERE ps.event_id = e.id)
+    ''').fetchall()
+    for event_id, start_date in unscheduled:
+        event_start = datetime.fromisoformat(start_date)
+        connection.executemany('''
+            INSERT INTO publication_schedule (event_id, scheduled_time, interval, is_posted)
+            VALUES (?, ?, ?, 0)
+        ''', [
+            (event_id, (event_start - delta).isoformat(), str(delta))
+            for delta in _V4_INTERVALS
+        ])
+    logger.info(f"Backfilled publication schedule for {len(unscheduled)} events")
+
+    connection.execute('''
+        UPDATE publication_schedule
+        SET is_posted = 1
+        WHERE is_posted = 0 AND scheduled_time <= (
+            SELECT last_posted FROM events WHERE events.id = publication_schedule.event_id
+        )
+    ''')
+
+def _convert_timestamps_to_epoch(connection):
+    # Rebuild both tables with integer epoch columns. Event and schedule
+    # times were naive wall-clock times of the scraped calendars, while
+    # last_posted and claimed_at came from datetime.now() on the host.
+    connection.create_function('iso_to_epoch', 2, iso_to_epoch)
+
+    connection.execute(f'''
+        CREATE TABLE events_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            start_ts {EPOCH_DECLTYPE} INTEGER NOT NULL,
+            end_ts {EPOCH_DECLTYPE} INTEGER NOT NULL,
+            source_tz TEXT NOT NULL,  -- Timezone the event times were published in
+            url TEXT NOT NULL,
+            description TEXT,
+            location TEXT,
+            address TEXT,
+            city TEXT,
+            region TEXT,
+            hashtags TEXT,
+            published BOOLEAN NOT NULL,
+            account_username TEXT NOT NULL,
+            config_name TEXT NOT NULL,
+            last_posted_ts {EPOCH_DECLTYPE} INTEGER,
+            UNIQUE(title, start_ts, url)
+        )
+    ''')
+    connection.execute('''
+        INSERT INTO events_new (
+            id, title, start_ts, end_ts, source_tz, url, description, location, address,
+            city, region, hashtags, published, account_username, config_name, last_posted_ts
+        )
+        SELECT id, title, iso_to_epoch(start_date, ?), iso_to_epoch(end_date, ?), ?, url,
+               description, location, address, city, region, hashtags, published,
+               account_username, config_name, iso_to_epoch(last_posted, NULL)
+        FROM events
+    ''', (DEFAULT_SOURCE_TZ, DEFAULT_SOURCE_TZ, DEFAULT_SOURCE_TZ))
+
+    connection.execute(f'''
+        CREATE TABLE publication_schedule_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_id INTEGER NOT NULL,
+            scheduled_ts {EPOCH_DECLTYPE} INTEGER NOT NULL,
+            interval TEXT NOT NULL,
+            is_posted BOOLEAN NOT NULL DEFAULT 0,
+            claimed_ts {EPOCH_DECLTYPE} INTEGER,  -- Set while a run is posting this entry
+            FOREIGN KEY(event_id) REFERENCES events(id)
+        )
+    ''')
+    connection.execute('''
+        INSERT INTO publication_schedule_new (id, event_id, scheduled_ts, interval, is_posted, claimed_ts)
+        SELECT id, event_id, iso_to_epoch(scheduled_time, ?), interval, is_posted, iso_to_epoch(claimed_at, NULL)
+        FROM publication_schedule
+    ''', (DEFAULT_SOURCE_TZ,))
+
+    connection.execute('DROP TABLE publication_schedule')
+    connection.execute('DROP TABLE events')
+    connection.execute('ALTER TABLE events_new RENAME TO events')
+    connection.execute('ALTER TABLE publication_schedule_new RENAME TO publication_schedule')
+
+    connection.execute('CREATE INDEX idx_events_account_start ON events(account_username, start_ts)')
+    connection.execute('CREATE INDEX idx_publication_schedule_due ON publication_schedule(is_posted, scheduled_ts)')
+    connection.execute('CREATE INDEX idx_publication_schedule_event ON publication_schedule(event_id)')
+
+# Duplicate detection at migration 6, see duplicates.py for the live version
+_V6_DUPLICATE_THRESHOLD = 0.6
+_V6_VENUE_WEIGHT = 0.25
+_V6_MAX_CANDIDATES = 20
+_V6_STOPWORDS = frozenset({
+    'a', 'an', 'and', 'at', 'by', 'for', 'from', 'in', 'of', 'on', 'or', 'the', 'to', 'with'
+})
+
+def _v6_tokens(text):
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+    return [token for token in re.findall(r'[a-z0-9]+', text) if token not in _V6_STOPWORDS]
+
+def _v6_jaccard(first, second):
+    first, second = set(first), set(second)
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+def _v6_similarity(title, venue, other_title, other_venue):
+    score = _v6_jaccard(title, other_title)
+    if venue and other_venue:
+        score = (1 - _V6_VENUE_WEIGHT) * score + _V6_VENUE_WEIGHT * _v6_jaccard(venue, other_venue)
+    return score
+
+def _v6_mark_duplicate(connection, event_id, title, venue, day, config_name):
+    # Without canonical sources the first indexed event of a group stays canonical
+    terms = ' OR '.join(f'"{token}"' for token in sorted(set(title)))
+    candidates = connection.execute('''
+        SELECT e.id, i.title, i.venue
+        FROM event_index i
+        JOIN events e ON e.id = i.rowid
+        WHERE event_index MATCH ?
+          AND e.id != ?
+          AND e.config_name != ?
+        ORDER BY i.rank
+        LIMIT ?
+    ''', (f'day:{day} AND title:({terms})', event_id, config_name, _V6_MAX_CANDIDATES)).fetchall()
+    best = None
+    for candidate_id, candidate_title, candidate_venue in candidates:
+        score = _v6_similarity(title, venue, candidate_title.split(), candidate_venue.split())
+        if score >= _V6_DUPLICATE_THRESHOLD and (best is None or score > best[1]):
+            best = (candidate_id, score)
+    if best is None:
+        return False
+
+    canonical_id, canonical_source = connection.execute('''
+        SELECT id, config_name FROM events
+        WHERE id = (SELECT COALESCE(duplicate_of, id) FROM events WHERE id = ?)
+    ''', (best[0],)).fetchone()
+    if canonical_source == config_name:
+        return False
+    connection.execute('UPDATE events SET duplicate_of = ? WHERE id = ?', (canonical_id, event_id))
+    return True
+
+def _create_duplicate_index(connection):
+    # Normalized titles, venues and start days of every event for
+    # cross-source duplicate detection, see duplicates.py
+    connection.execute('ALTER TABLE events ADD COLUMN duplicate_of INTEGER REFERENCES events(id)')
+    connection.execute('CREATE INDEX idx_events_duplicate_of ON events(duplicate_of)')
+    connection.execute('''
+        CREATE VIRTUAL TABLE event_index USING fts5(
+            title, venue, day, tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+    # Deleting a canonical event promotes its duplicates back to events of their own
+    connection.execute('''
+        CREATE TRIGGER events_delete_duplicate_index AFTER DELETE ON events
+        BEGIN
+            DELETE FROM event_index WHERE rowid = old.id;
+            UPDATE events SET duplicate_of = NULL WHERE duplicate_of = old.id;
+        END
+    ''')
+
+    events = connection.execute(
+        'SELECT id, title, location, start_ts, source_tz, config_name FROM events ORDER BY id'
+    ).fetchall()
+    duplicates = 0
+    for event_id, title, location, start_ts, source_tz, config_name in events:
+        title, venue = _v6_tokens(title), _v6_tokens(location)
+        day = from_epoch(start_ts, source_tz).strftime('d%Y%m%d')
+        connection.execute(
+            'INSERT INTO event_index (rowid, title, venue, day) VALUES (?, ?, ?, ?)',
+            (event_id, ' '.join(title), ' '.join(venue), day)
+        )
+        if title and _v6_mark_duplicate(connection, event_id, title, venue, day, config_name):
+            duplicates += 1
+    logger.info(f"Indexed {len(events)} events, {duplicates} cross-source duplicates found")
+
+def _create_archive_tables(connection):
+    # Cold copies of past events and their schedules, see
+    # db_manager.archive_past_events. IDs are kept, so archived schedule
+    # entries still point at their archived event.
+    connection.execute(f'''
+        CREATE TABLE events_archive (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            start_ts {EPOCH_DECLTYPE} INTEGER NOT NULL,
+            end_ts {EPOCH_DECLTYPE} INTEGER NOT NULL,
+            source_tz TEXT NOT NULL,
+            url TEXT NOT NULL,
+            description TEXT,
+            location TEXT,
+            address TEXT,
+            city TEXT,
+            region TEXT,
+            hashtags TEXT,
+            published BOOLEAN NOT NULL,
+            account_username TEXT NOT NULL,
+            config_name TEXT NOT NULL,
+            last_posted_ts {EPOCH_DECLTYPE} INTEGER,
+            duplicate_of INTEGER,
+            archived_ts {EPOCH_DECLTYPE} INTEGER NOT NULL
+        )
+    ''')
+    connection.execute(f'''
+        CREATE TABLE publication_schedule_archive (
+            id INTEGER PRIMARY KEY,
+            event_id INTEGER NOT NULL,
+            scheduled_ts {EPOCH_DECLTYPE} INTEGER NOT NULL,
+            interval TEXT NOT NULL,
+            is_posted BOOLEAN NOT NULL,
+            claimed_ts {EPOCH_DECLTYPE} INTEGER,
+            archived_ts {EPOCH_DECLTYPE} INTEGER NOT NULL
+        )
+    ''')
+    connection.execute('CREATE INDEX idx_events_archive_account_start ON events_archive(account_username, start_ts)')
+    connection.execute('CREATE INDEX idx_publication_schedule_archive_event ON publication_schedule_archive(event_id)')
+
+def _cascade_schedule_deletes(connection):
+    # Rebuild publication_schedule so deleting an event deletes its schedule.
+    # Orphaned rows left by earlier deletes are copied as they are; the
+    # maintenance job prunes them in batches.
+    connection.execute(f'''
+        CREATE TABLE publication_schedule_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_id INTEGER NOT NULL,
+            scheduled_ts {EPOCH_DECLTYPE} INTEGER NOT NULL,
+            interval TEXT NOT NULL,
+            is_posted BOOLEAN NOT NULL DEFAULT 0,
+            claimed_ts {EPOCH_DECLTYPE} INTEGER,  -- Set while a run is posting this entry
+            FOREIGN KEY(event_id) REFERENCES events(id) ON DELETE CASCADE
+        )
+    ''')
+    connection.execute('''
+        INSERT INTO publication_schedule_new (id, event_id, scheduled_ts, interval, is_posted, claimed_ts)
+        SELECT id, event_id, scheduled_ts, interval, is_posted, claimed_ts FROM publication_schedule
+    ''')
+    connection.execute('DROP TABLE publication_schedule')
+    connection.execute('ALTER TABLE publication_schedule_new RENAME TO publication_schedule')
+    connection.execute('CREATE INDEX idx_publication_schedule_due ON publication_schedule(is_posted, scheduled_ts)')
+    connection.execute('CREATE INDEX idx_publication_schedule_event ON publication_schedule(event_id)')
+
+def _add_source_keys(connection):
+    # Scrapers identify events by a stable ID on their site, so rescheduled
+    # or renamed events are updated in place. Existing rows get their
+    # source_id the next time they are scraped, see db_manager.add_event.
+    for table in ('events', 'events_archive'):
+        connection.execute(f'ALTER TABLE {table} ADD COLUMN source_id TEXT')
+        connection.execute(f'ALTER TABLE {table} ADD COLUMN content_hash TEXT')
+    connection.execute('CREATE UNIQUE INDEX idx_events_source ON events(config_name, source_id)')
+
+def _create_thumbnail_cache(connection):
+    # Link cards show the event image. thumbnails maps an image URL to the
+    # hash of its resized and compressed bytes, so it is downloaded once;
+    # thumbnail_blobs keeps the blob each account uploaded for that hash.
+    for table in ('events', 'events_archive'):
+        connection.execute(f'ALTER TABLE {table} ADD COLUMN image_url TEXT')
+    connection.execute(f'''
+        CREATE TABLE thumbnails (
+            image_url TEXT PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            mime_type TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            fetched_ts {EPOCH_DECLTYPE} INTEGER NOT NULL
+        )
+    ''')
+    connection.execute(f'''
+        CREATE TABLE thumbnail_blobs (
+            content_hash TEXT NOT NULL,
+            account_username TEXT NOT NULL,
+            blob_ref TEXT NOT NULL,
+            uploaded_ts {EPOCH_DECLTYPE} INTEGER NOT NULL,
+            PRIMARY KEY (content_hash, account_username)
+        )
+    ''')
+
+def _add_rendered_posts(connection):
+    # Post text and facets are rendered from the site's template when an
+    # event is added or changes; post_template records which template, so
+    # editing it re-renders the site's events.
+    for table in ('events', 'events_archive'):
+        connection.execute(f'ALTER TABLE {table} ADD COLUMN post_text TEXT')
+        connection.execute(f'ALTER TABLE {table} ADD COLUMN post_facets TEXT')
+        connection.execute(f'ALTER TABLE {table} ADD COLUMN post_template TEXT')
+
+def _create_post_outbox(connection):
+    # A post intent is written, with the record key the post will be
+    # created under, before the post is sent. Completion adds the URI and
+    # CID. Intents still pending after a crash are looked up among the
+    # account's records on the next run instead of being posted again.
+    connection.execute(f'''
+        CREATE TABLE post_outbox (
+            id INTEGER PRIMARY KEY,
+            schedule_id INTEGER,
+            event_id INTEGER NOT NULL,
+            account_username TEXT NOT NULL,
+            rkey TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            uri TEXT,
+            cid TEXT,
+            intent_ts {EPOCH_DECLTYPE} INTEGER NOT NULL,
+            posted_ts {EPOCH_DECLTYPE} INTEGER,
+            UNIQUE (account_username, rkey)
+        )
+    ''')
+    connection.execute('''
+        CREATE INDEX idx_post_outbox_pending ON post_outbox(account_username, rkey)
+        WHERE status = 'pending'
+    ''')
+    connection.execute('CREATE INDEX idx_post_outbox_event ON post_outbox(event_id)')
+
+def _share_outbox_posts(connection):
+    # A digest post lists several events, each with its own intent under
+    # the post's record key, so record keys are only unique per event
+    connection.execute(f'''
+        CREATE TABLE post_outbox_new (
+            id INTEGER PRIMARY KEY,
+            schedule_id INTEGER,
+            event_id INTEGER NOT NULL,
+            account_username TEXT NOT NULL,
+            rkey TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            uri TEXT,
+            cid TEXT,
+            intent_ts {EPOCH_DECLTYPE} INTEGER NOT NULL,
+            posted_ts {EPOCH_DECLTYPE} INTEGER,
+            UNIQUE (account_username, rkey, event_id)
+        )
+    ''')
+    connection.execute('INSERT INTO post_outbox_new SELECT * FROM post_outbox')
+    connection.execute('DROP TABLE post_outbox')
+    connection.execute('ALTER TABLE post_outbox_new RENAME TO post_outbox')
+    connection.execute('''
+        CREATE INDEX idx_post_outbox_pending ON post_outbox(account_username, rkey)
+        WHERE status = 'pending'
+    ''')
+    connection.execute('CREATE INDEX idx_post_outbox_event ON post_outbox(event_id)')
+
+def _create_post_metrics(connection):
+    # Engagement counts of posts over time. A sample is only added when a
+    # count changed; metrics_ts records when a post was last checked.
+    connection.execute(f'ALTER TABLE post_outbox ADD COLUMN metrics_ts {EPOCH_DECLTYPE} INTEGER')
+    connection.execute('CREATE INDEX idx_post_outbox_uri ON post_outbox(uri)')
+    connection.execute('''
+        CREATE INDEX idx_post_outbox_posted ON post_outbox(account_username, posted_ts)
+        WHERE status = 'posted'
+    ''')
+    connection.execute(f'''
+        CREATE TABLE post_metrics (
+            uri TEXT NOT NULL,
+            fetched_ts {EPOCH_DECLTYPE} INTEGER NOT NULL,
+            likes INTEGER NOT NULL DEFAULT 0,
+            reposts INTEGER NOT NULL DEFAULT 0,
+            replies INTEGER NOT NULL DEFAULT 0,
+            quotes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (uri, fetched_ts)
+        )
+    ''')
+
+def _cache_thumbnail_data(connection):
+    # The resized and compressed image bytes, so an image is downloaded once
+    # and then only uploaded by each further account that posts it
+    connection.execute('ALTER TABLE thumbnails ADD COLUMN data BLOB')
+
+# Ordered list of (version, description, migration). Append new entries only;
+# never edit or reorder a migration that has been released.
+MIGRATIONS = [
+    (1, "create events and publication_schedule tables", _create_base_tables),
+    (2, "add hashtags and last_posted columns to events", _add_hashtags_and_last_posted),
+    (3, "create hot-path indexes", _create_hot_path_indexes),
+    (4, "add schedule claims and backfill publication_schedule", _backfill_publication_schedule),
+    (5, "store timestamps as integer epoch seconds", _convert_timestamps_to_epoch),
+    (6, "add duplicate_of and the duplicate detection index", _create_duplicate_index),
+    (7, "create archive tables for past events", _create_archive_tables),
+    (8, "cascade event deletes to publication_schedule", _cascade_schedule_deletes),
+    (9, "add source_id and content_hash to events", _add_source_keys),
+    (10, "add event images and the thumbnail blob cache", _create_thumbnail_cache),
+    (11, "store post text rendered at ingest", _add_rendered_posts),
+    (12, "create the post outbox", _create_post_outbox),
+    (13, "let digest posts share a record key across events", _share_outbox_posts),
+    (14, "create the post engagement time series", _create_post_metrics),
+    (15, "cache thumbnail bytes by image URL", _cache_thumbnail_data),
+]
+
+def get_schema_version(connection):
+    """Return the schema version recorded in PRAGMA user_version"""
+    return connection.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate_database(connection):
+    """
+    Bring the database schema up to date by applying every pending migration.
+
+    Each migration runs in its own transaction together with the
+    PRAGMA user_version bump, so a failed migration leaves the database at
+    the last successfully applied version. Foreign key enforcement is
+    switched off while migrations rebuild tables and restored afterwards.
+
+    Returns:
+        int: The schema version after migrating.
+    """
+    current_version = get_schema_version(connection)
+    logger.info(f"migrate_database: Current schema version: {current_version}")
+    if current_version >= MIGRATIONS[-1][0]:
+        return current_version
+
+    # PRAGMA foreign_keys is a no-op inside a transaction
+    if connection.in_transaction:
+        connection.commit()
+    foreign_keys = connection.execute('PRAGMA foreign_keys').fetchone()[0]
+    connection.execute('PRAGMA foreign_keys = OFF')
+    try:
+        for version, description, migration in MIGRATIONS:
+            if version <= current_version:
+                continue
+            logger.info(f"migrate_database: Applying migration {version}: {description}")
+            try:
+                connection.execute('BEGIN')
+                migration(connection)
+                connection.execute(f'PRAGMA user_version = {int(version)}')
+                connection.commit()
+                current_version = version
+            except Exception as e:
+                connection.rollback()
+                logger.error(f"migrate_database: Migration {version} failed: {e}")
+                raise
+    finally:
+        connection.execute(f'PRAGMA foreign_keys = {int(foreign_keys)}')
+
+    return current_version
@@ -1,32 +1,178 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, UniqueConstraint
+from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Index, UniqueConstraint, LargeBinary
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.types import TypeDecorator
+from src.database.timestamps import to_epoch
 
 Base = declarative_base()
 
+class EpochDateTime(TypeDecorator):
+    """
+    Integer epoch seconds in the database, aware UTC datetimes in Python,
+    matching the UTCEPOCH columns of the raw-SQL schema.
+    """
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return to_epoch(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return datetime.fromtimestamp(int(value), timezone.utc)
+
+# Mirrors the schema built by src/database/migrations.py. On SQLite the
+# migrations create the tables; these models are used to query them and to
+# create the tables on other databases.
 class Event(Base):
     __tablename__ = 'events'
 
-    id = Column(Integer, primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     title = Column(String, nullable=False)
-    start_date = Column(DateTime, nullable=False)
-    end_date = Column(DateTime, nullable=False)
+    start_ts = Column(EpochDateTime, nullable=False)
+    end_ts = Column(EpochDateTime, nullable=False)
+    source_tz = Column(String, nullable=False)
     url = Column(String, nullable=False)
     description = Column(String, nullable=True)
     location = Column(String, nullable=True)
     address = Column(String, nullable=True)
     city = Column(String, nullable=True)
     region = Column(String, nullable=True)
-    published = Column(Boolean, default=False)
+    hashtags = Column(String, nullable=True)
+    published = Column(Boolean, nullable=False, default=False)
     account_username = Column(String, nullable=False)
     config_name = Column(String, nullable=False)
+    last_posted_ts = Column(EpochDateTime, nullable=True)
+    duplicate_of = Column(Integer, ForeignKey('events.id'), nullable=True)  # Same event listed by another source
+    source_id = Column(String, nullable=True)  # Stable ID of the event on its source site
+    content_hash = Column(String, nullable=True)  # Detects changed events on rescrape
+    image_url = Column(String, nullable=True)  # Shown as the link card thumbnail
+    post_text = Column(String, nullable=True)  # Rendered from the site's post template
+    post_facets = Column(String, nullable=True)  # Facets of post_text as JSON
+    post_template = Column(String, nullable=True)  # Key of the template post_text was rendered with
 
-    __table_args__ = (UniqueConstraint('title', 'start_date', 'url', name='_event_uc'),)
+    __table_args__ = (
+        UniqueConstraint('title', 'start_ts', 'url', name='_event_uc'),
+        Index('idx_events_account_start', 'account_username', 'start_ts'),
+        Index('idx_events_duplicate_of', 'duplicate_of'),
+        Index('idx_events_source', 'config_name', 'source_id', unique=True),
+    )
 
 class PublicationSchedule(Base):
     __tablename__ = 'publication_schedule'
 
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    event_id = Column(Integer, ForeignKey('events.id', ondelete='CASCADE'), nullable=False)
+    scheduled_ts = Column(EpochDateTime, nullable=False)
+    interval = Column(String, nullable=False)
+    is_posted = Column(Boolean, nullable=False, default=False)
+    claimed_ts = Column(EpochDateTime, nullable=True)  # Set while a run is posting this entry
+
+    __table_args__ = (
+        Index('idx_publication_schedule_due', 'is_posted', 'scheduled_ts'),
+        Index('idx_publication_schedule_event', 'event_id'),
+    )
+
+# Past events and their schedules, moved out of the tables above by
+# archive_past_events; IDs are those of the original rows
+class EventArchive(Base):
+    __tablename__ = 'events_archive'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    title = Column(String, nullable=False)
+    start_ts = Column(EpochDateTime, nullable=False)
+    end_ts = Column(EpochDateTime, nullable=False)
+    source_tz = Column(String, nullable=False)
+    url = Column(String, nullable=False)
+    description = Column(String, nullable=True)
+    location = Column(String, nullable=True)
+    address = Column(String, nullable=True)
+    city = Column(String, nullable=True)
+    region = Column(String, nullable=True)
+    hashtags = Column(String, nullable=True)
+    published = Column(Boolean, nullable=False, default=False)
+    account_username = Column(String, nullable=False)
+    config_name = Column(String, nullable=False)
+    last_posted_ts = Column(EpochDateTime, nullable=True)
+    duplicate_of = Column(Integer, nullable=True)
+    source_id = Column(String, nullable=True)
+    content_hash = Column(String, nullable=True)
+    image_url = Column(String, nullable=True)
+    post_text = Column(String, nullable=True)
+    post_facets = Column(String, nullable=True)
+    post_template = Column(String, nullable=True)
+    archived_ts = Column(EpochDateTime, nullable=False)
+
+    __table_args__ = (
+        Index('idx_events_archive_account_start', 'account_username', 'start_ts'),
+    )
+
+class PublicationScheduleArchive(Base):
+    __tablename__ = 'publication_schedule_archive'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    event_id = Column(Integer, nullable=False)
+    scheduled_ts = Column(EpochDateTime, nullable=False)
+    interval = Column(String, nullable=False)
+    is_posted = Column(Boolean, nullable=False)
+    claimed_ts = Column(EpochDateTime, nullable=True)
+    archived_ts = Column(EpochDateTime, nullable=False)
+
+    __table_args__ = (
+        Index('idx_publication_schedule_archive_event', 'event_id'),
+    )
+
+# Link card thumbnails: each image URL is downloaded once and stored by the
+# hash of its compressed bytes, and uploaded once per account
+class Thumbnail(Base):
+    __tablename__ = 'thumbnails'
+
+    image_url = Column(String, primary_key=True)
+    content_hash = Column(String, nullable=False)
+    mime_type = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    fetched_ts = Column(EpochDateTime, nullable=False)
+    data = Column(LargeBinary)  # The resized image bytes, see migrations._cache_thumbnail_data
+
+class ThumbnailBlob(Base):
+    __tablename__ = 'thumbnail_blobs'
+
+    content_hash = Column(String, primary_key=True)
+    account_username = Column(String, primary_key=True)
+    blob_ref = Column(String, nullable=False)  # The uploaded blob as JSON
+    uploaded_ts = Column(EpochDateTime, nullable=False)
+
+# Posts are written here before they are sent and completed with the
+# created record's URI and CID, see migrations._create_post_outbox
+class PostOutbox(Base):
+    __tablename__ = 'post_outbox'
+
     id = Column(Integer, primary_key=True)
+    schedule_id = Column(Integer, nullable=True)
     event_id = Column(Integer, nullable=False)
-    scheduled_time = Column(DateTime, nullable=False)
-    account_username = Column(String, nullable=False)  # To support multiple Bluesky accounts
-    is_executed = Column(Boolean, default=False)
\ No newline at end of file
+    account_username = Column(String, nullable=False)
+    rkey = Column(String, nullable=False)  # Record key the post is created under, shared by a digest's events
+    status = Column(String, nullable=False, default='pending')  # pending, posted or deleted
+    uri = Column(String, nullable=True)
+    cid = Column(String, nullable=True)
+    intent_ts = Column(EpochDateTime, nullable=False)
+    posted_ts = Column(EpochDateTime, nullable=True)
+    metrics_ts = Column(EpochDateTime, nullable=True)  # When the post's engagement was last checked
+
+    __table_args__ = (
+        UniqueConstraint('account_username', 'rkey', 'event_id', name='_post_outbox_rkey_uc'),
+        Index('idx_post_outbox_event', 'event_id'),
+        Index('idx_post_outbox_uri', 'uri'),
+    )
+
+# Engagement counts of a post, sampled when they change, see src/bluesky/metrics.py
+class PostMetric(Base):
+    __tablename__ = 'post_metrics'
+
+    uri = Column(String, primary_key=True)
+    fetched_ts = Column(EpochDateTime, primary_key=True)
+    likes = Column(Integer, nullable=False, default=0)
+    reposts = Column(Integer, nullable=False, default=0)
+    replies = Column(Integer, nullable=False, default=0)
+    quotes = Column(Integer, nullable=False, default=0)
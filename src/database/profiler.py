@@ -0,0 +1,199 @@
+import os
+import re
+import time
+import logging
+import sqlite3
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bluesky-event-sync.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Executions slower than this get their query plan logged, once per statement
+SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', '100'))
+
+# Statements shown in the summary table, most total time first
+SUMMARY_LIMIT = 20
+
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+def fingerprint(sql):
+    """
+    Normalize a statement so executions that differ only in literals,
+    IN-list lengths or whitespace are counted together.
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'(?<![\w.])-?\d+(?:\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\s+', ' ', sql).strip()
+    return re.sub(r'\bIN \(\s*\?(?:\s*,\s*\?)*\s*\)', 'IN (...)', sql, flags=re.IGNORECASE)
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[max(0, int(round(percent / 100 * len(ordered))) - 1)]
+
+class QueryProfiler:
+    """Per-statement counts, latencies and row counts of one profiled connection"""
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS):
+        self.slow_ms = slow_ms
+        self.statements = {}
+        self.commits = 0
+        self.commit_seconds = 0.0
+        self.explained = set()
+
+    def start(self, sql):
+        """Register an execution of sql and return (stats, index) to add its time to"""
+        key = fingerprint(sql)
+        stats = self.statements.get(key)
+        if stats is None:
+            stats = self.statements[key] = {'sql': key, 'latencies': [], 'rows': 0}
+        stats['latencies'].append(0.0)
+        return stats, len(stats['latencies']) - 1
+
+    def add(self, execution, seconds, rows=0):
+        stats, index = execution
+        stats['latencies'][index] += seconds
+        stats['rows'] += rows
+        return stats['latencies'][index]
+
+    def record_commit(self, seconds):
+        self.commits += 1
+        self.commit_seconds += seconds
+
+    def explain(self, connection, key, sql, parameters, elapsed):
+        """Log the query plan of a slow statement the first time it is seen"""
+        if key in self.explained or elapsed * 1000 < self.slow_ms:
+            return
+        self.explained.add(key)
+        plan = 'n/a'
+        if sql.lstrip().upper().startswith(EXPLAINABLE):
+            try:
+                # A plain cursor keeps the EXPLAIN itself out of the profile
+                rows = sqlite3.Cursor(connection).execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+                plan = ' | '.join(row[3] for row in rows)
+            except sqlite3.Error as e:
+                plan = f'unavailable ({e})'
+        logger.warning(f"QueryProfiler: Slow statement ({elapsed * 1000:.1f} ms): {key}; plan: {plan}")
+
+    def summary(self):
+        """Return one dict per statement with count, total/avg/p95 ms and rows, most total time first"""
+        rows = []
+        for stats in self.statements.values():
+            latencies = stats['latencies']
+            total = sum(latencies)
+            rows.append({
+                'sql': stats['sql'],
+                'count': len(latencies),
+                'total_ms': total * 1000,
+                'avg_ms': total * 1000 / len(latencies),
+                'p95_ms': _percentile(latencies, 95) * 1000,
+                'rows': stats['rows']
+            })
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def format_summary(self, limit=SUMMARY_LIMIT):
+        lines = [f"{'count':>7} {'total ms':>10} {'avg ms':>8} {'p95 ms':>8} {'rows':>8}  statement"]
+        for row in self.summary()[:limit]:
+            sql = row['sql'] if len(row['sql']) <= 100 else row['sql'][:97] + '...'
+            lines.append(
+                f"{row['count']:>7} {row['total_ms']:>10.1f} {row['avg_ms']:>8.2f} "
+                f"{row['p95_ms']:>8.2f} {row['rows']:>8}  {sql}"
+            )
+        lines.append(f"{self.commits} commits, {self.commit_seconds * 1000:.1f} ms")
+        return '\n'.join(lines)
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that times its statements and the fetches that step them"""
+
+    def _timed(self, method, sql, parameters):
+        profiler = self.connection.profiler
+        self._execution = profiler.start(sql)
+        self._statement = (sql, parameters)
+        started = time.perf_counter()
+        try:
+            return method(sql, parameters)
+        finally:
+            self._record(time.perf_counter() - started, max(self.rowcount, 0))
+
+    def _record(self, seconds, rows):
+        execution = getattr(self, '_execution', None)
+        if execution is None:
+            return
+        profiler = self.connection.profiler
+        elapsed = profiler.add(execution, seconds, rows)
+        if elapsed * 1000 >= profiler.slow_ms:
+            sql, parameters = self._statement
+            if not isinstance(parameters, (tuple, list, dict)):
+                parameters = ()  # executemany: explain without the parameter rows
+            profiler.explain(self.connection, execution[0]['sql'], sql, parameters, elapsed)
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._record(time.perf_counter() - started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._record(time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._record(time.perf_counter() - started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._record(time.perf_counter() - started, 0)
+            raise
+        self._record(time.perf_counter() - started, 1)
+        return row
+
+class ProfiledConnection(sqlite3.Connection):
+    """
+    Connection factory for sqlite3.connect that records every statement in
+    self.profiler. Used by db_manager.connect_to_db when profiling is on.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.profiler = QueryProfiler()
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        super().commit()
+        self.profiler.record_commit(time.perf_counter() - started)
+
+def log_profile(connection):
+    """Log the statement summary of a connection opened with profiling, if any"""
+    profiler = getattr(connection, 'profiler', None)
+    if profiler is None:
+        return
+    logger.info(f"Database profile:\n{profiler.format_summary()}")
@@ -0,0 +1,63 @@
+from datetime import datetime
+from functools import lru_cache
+from operator import itemgetter
+from typing import NamedTuple, Optional
+
+class Event(NamedTuple):
+    """
+    An event as read from the database. Timestamps are aware UTC datetimes
+    (see timestamps.py); the schedule fields are only set on due posts
+    returned by get_due_posts.
+
+    Records are immutable tuples without a per-instance __dict__; use
+    _replace() to derive a changed copy.
+    """
+    id: int
+    title: str
+    start_ts: datetime
+    end_ts: datetime
+    source_tz: str
+    url: str
+    description: Optional[str]
+    location: Optional[str]
+    address: Optional[str]
+    city: Optional[str]
+    region: Optional[str]
+    hashtags: Optional[str]
+    published: bool
+    account_username: str
+    config_name: str
+    last_posted_ts: Optional[datetime]
+    duplicate_of: Optional[int]
+    source_id: Optional[str]
+    image_url: Optional[str]
+    post_text: Optional[str]
+    post_facets: Optional[str]
+    schedule_id: Optional[int] = None
+    schedule_interval: Optional[str] = None
+    scheduled_ts: Optional[datetime] = None
+
+# Columns of the events table in Event field order, for SELECT lists
+EVENT_COLUMNS = ', '.join(Event._fields[:Event._fields.index('post_facets') + 1])
+
+@lru_cache(maxsize=32)
+def _event_maker(columns):
+    if columns == Event._fields:
+        return Event._make
+    positions = [columns.index(field) if field in columns else None for field in Event._fields]
+    if None not in positions:
+        getter = itemgetter(*positions)
+        return lambda row: Event._make(getter(row))
+    return lambda row: Event._make([None if position is None else row[position] for position in positions])
+
+def event_factory(cursor):
+    """
+    Return a function that turns rows of the cursor's current query into
+    Event records. The column mapping is built once per query shape; columns
+    that are not Event fields are ignored and missing fields are None.
+    """
+    return _event_maker(tuple(column[0] for column in cursor.description))
+
+def event_from_mapping(mapping):
+    """Build an Event from a dict-like row, e.g. an SQLAlchemy row mapping"""
+    return Event._make([mapping.get(field) for field in Event._fields])
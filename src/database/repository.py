@@ -0,0 +1,397 @@
+import logging
+from abc import ABC, abstractmethod
+from sqlalchemy import create_engine, event as sqlalchemy_event, select, func, literal, or_, false, true, Integer
+from src.database import db_manager
+from src.database.db_manager import CLAIM_TIMEOUT, PAST_EVENT_RETENTION, content_hash
+from src.database.migrations import migrate_database
+from src.database.models import Base, Event as EventModel, PublicationSchedule, EventArchive, PublicationScheduleArchive
+from src.database.records import event_from_mapping
+from src.database.duplicates import index_event, resolve_duplicate
+from src.database.timestamps import localize, timezone_name, to_epoch, now_epoch
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bluesky-event-sync.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+EVENT_FIELDS = (
+    'title', 'url', 'description', 'location', 'address', 'city', 'region',
+    'hashtags', 'account_username', 'config_name', 'image_url'
+)
+
+def _event_values(event):
+    # Scraped events carry naive start/end datetimes in their source timezone
+    source_tz = event.get('source_tz')
+    start_date = localize(event['start_date'], source_tz)
+    end_date = localize(event.get('end_date') or event['start_date'], source_tz)
+    values = {field: event.get(field) for field in EVENT_FIELDS}
+    values.update({
+        'start_ts': to_epoch(start_date),
+        'end_ts': to_epoch(end_date),
+        'source_tz': timezone_name(start_date),
+        'published': False,
+        'source_id': event.get('source_id')
+    })
+    values['content_hash'] = content_hash(values)
+    return values
+
+class EventRepository(ABC):
+    """
+    Storage interface for events and their publication schedule.
+
+    Readers return records.Event records with timestamps as aware UTC
+    datetimes on every backend. Events passed to add_events are dictionaries with the arguments of
+    db_manager.add_event (start_date, end_date, source_tz, title, url, ...).
+    """
+
+    @abstractmethod
+    def add_events(self, events, intervals=(), canonical_sources=None):
+        """
+        Insert the events that do not exist yet and schedule a post for each
+        interval before their start, all in one transaction. Events that
+        exist by (title, start, url) or by (config_name, source_id) are
+        skipped; db_manager.add_event updates changed events in place. On
+        SQLite new events also go through duplicate detection.
+
+        Returns:
+            list: IDs of the inserted events.
+        """
+
+    @abstractmethod
+    def get_event(self, event_id):
+        """Return an Event record, or None"""
+
+    @abstractmethod
+    def count_events(self, account_username=None, archived=False):
+        """Return the number of stored events, or of archived events, optionally for one account"""
+
+    @abstractmethod
+    def get_due_posts(self, account_username, now=None):
+        """Return the latest due, unposted and unclaimed entry of each event, see db_manager.get_due_posts"""
+
+    @abstractmethod
+    def claim_post(self, schedule_id, now=None):
+        """Claim a due entry and the entries it supersedes. Returns False if another run owns it."""
+
+    @abstractmethod
+    def release_post(self, schedule_id):
+        """Give up the claim on an entry and its event"""
+
+    @abstractmethod
+    def complete_post(self, schedule_id, posted_at=None):
+        """Mark an entry and the earlier entries of its event as posted and record the post time"""
+
+    @abstractmethod
+    def archive_past_events(self, account_username, now=None, batch_size=db_manager.ARCHIVE_BATCH_SIZE):
+        """Move events past their retention and their schedule to the archive tables in batches. Returns the count."""
+
+    @abstractmethod
+    def close(self):
+        """Release the underlying connection or engine"""
+
+class SQLiteRepository(EventRepository):
+    """Fast path on a raw sqlite3 connection from db_manager.connect_to_db"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        migrate_database(connection)
+
+    def add_events(self, events, intervals=(), canonical_sources=None):
+        cursor = self.connection.cursor()
+        inserted = []
+        try:
+            for event in events:
+                values = _event_values(event)
+                cursor.execute(f'''
+                    INSERT OR IGNORE INTO events ({', '.join(values)})
+                    VALUES ({', '.join('?' for _ in values)})
+                ''', tuple(values.values()))
+                if cursor.rowcount:
+                    inserted.append((cursor.lastrowid, values['start_ts']))
+                    index_event(
+                        self.connection, cursor.lastrowid, values['title'], values['location'],
+                        values['start_ts'], values['source_tz']
+                    )
+                    resolve_duplicate(self.connection, cursor.lastrowid, canonical_sources)
+            cursor.executemany('''
+                INSERT INTO publication_schedule (event_id, scheduled_ts, interval, is_posted)
+                VALUES (?, ?, ?, 0)
+            ''', [
+                (event_id, start_ts - int(interval.total_seconds()), str(interval))
+                for event_id, start_ts in inserted
+                for interval in intervals
+            ])
+            self.connection.commit()
+        except Exception as e:
+            self.connection.rollback()
+            logger.error(f"SQLiteRepository.add_events: Failed: {e}")
+            raise
+        logger.info(f"SQLiteRepository.add_events: Inserted {len(inserted)} of {len(events)} events")
+        return [event_id for event_id, _ in inserted]
+
+    def get_event(self, event_id):
+        return db_manager.get_event_by_id(self.connection, event_id)
+
+    def count_events(self, account_username=None, archived=False):
+        table = 'events_archive' if archived else 'events'
+        if account_username is None:
+            return self.connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        return self.connection.execute(
+            f'SELECT COUNT(*) FROM {table} WHERE account_username = ?', (account_username,)
+        ).fetchone()[0]
+
+    def get_due_posts(self, account_username, now=None):
+        return db_manager.get_due_posts(self.connection, account_username, now)
+
+    def claim_post(self, schedule_id, now=None):
+        return db_manager.claim_scheduled_post(self.connection, schedule_id, now)
+
+    def release_post(self, schedule_id):
+        db_manager.release_scheduled_post(self.connection, schedule_id)
+
+    def complete_post(self, schedule_id, posted_at=None):
+        row = self.connection.execute(
+            'SELECT event_id FROM publication_schedule WHERE id = ?', (schedule_id,)
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"No schedule entry with ID {schedule_id}")
+        db_manager.mark_post_as_executed(self.connection, schedule_id)
+        db_manager.mark_event_posted(self.connection, row[0], posted_at)
+
+    def archive_past_events(self, account_username, now=None, batch_size=db_manager.ARCHIVE_BATCH_SIZE):
+        return db_manager.archive_past_events(self.connection, account_username, now, batch_size)
+
+    def close(self):
+        self.connection.close()
+
+class SQLAlchemyRepository(EventRepository):
+    """
+    SQLAlchemy Core backend for databases shared by several workers. SQLite
+    URLs get the same pragmas and migrations as connect_to_db; other
+    databases get their tables from the models.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.events = EventModel.__table__
+        self.schedule = PublicationSchedule.__table__
+        self.events_archive = EventArchive.__table__
+        self.schedule_archive = PublicationScheduleArchive.__table__
+        if engine.dialect.name == 'sqlite':
+            sqlalchemy_event.listen(
+                engine, 'connect',
+                lambda dbapi_connection, record: db_manager._apply_pragmas(dbapi_connection, False)
+            )
+            raw_connection = engine.raw_connection()
+            try:
+                migrate_database(raw_connection.connection)
+            finally:
+                raw_connection.close()
+        else:
+            Base.metadata.create_all(engine)
+
+    def add_events(self, events, intervals=(), canonical_sources=None):
+        rows = [_event_values(event) for event in events]
+        inserted = []
+        try:
+            with self.engine.begin() as conn:
+                existing = set()
+                urls = list({row['url'] for row in rows})
+                for start in range(0, len(urls), 500):
+                    query = select(self.events.c.title, self.events.c.start_ts, self.events.c.url).where(
+                        self.events.c.url.in_(urls[start:start + 500])
+                    )
+                    existing.update(
+                        (title, to_epoch(start_ts), url) for title, start_ts, url in conn.execute(query)
+                    )
+                source_ids = list({row['source_id'] for row in rows if row['source_id']})
+                for start in range(0, len(source_ids), 500):
+                    query = select(self.events.c.config_name, self.events.c.source_id).where(
+                        self.events.c.source_id.in_(source_ids[start:start + 500])
+                    )
+                    existing.update(tuple(key) for key in conn.execute(query))
+                for row in rows:
+                    key = (row['title'], row['start_ts'], row['url'])
+                    source_key = (row['config_name'], row['source_id'])
+                    if key in existing or source_key in existing:
+                        continue
+                    existing.add(key)
+                    if row['source_id']:
+                        existing.add(source_key)
+                    result = conn.execute(self.events.insert(), row)
+                    event_id = result.inserted_primary_key[0]
+                    inserted.append((event_id, row['start_ts']))
+                    if self.engine.dialect.name == 'sqlite':
+                        # The FTS5 duplicate index only exists in SQLite databases
+                        index_event(conn.connection, event_id, row['title'], row['location'], row['start_ts'], row['source_tz'])
+                        resolve_duplicate(conn.connection, event_id, canonical_sources)
+                schedule_rows = [
+                    {
+                        'event_id': event_id,
+                        'scheduled_ts': start_ts - int(interval.total_seconds()),
+                        'interval': str(interval),
+                        'is_posted': False
+                    }
+                    for event_id, start_ts in inserted
+                    for interval in intervals
+                ]
+                if schedule_rows:
+                    conn.execute(self.schedule.insert(), schedule_rows)
+        except Exception as e:
+            logger.error(f"SQLAlchemyRepository.add_events: Failed: {e}")
+            raise
+        logger.info(f"SQLAlchemyRepository.add_events: Inserted {len(inserted)} of {len(events)} events")
+        return [event_id for event_id, _ in inserted]
+
+    def get_event(self, event_id):
+        with self.engine.connect() as conn:
+            row = conn.execute(select(self.events).where(self.events.c.id == event_id)).first()
+        return event_from_mapping(row._mapping) if row else None
+
+    def count_events(self, account_username=None, archived=False):
+        table = self.events_archive if archived else self.events
+        query = select(func.count()).select_from(table)
+        if account_username is not None:
+            query = query.where(table.c.account_username == account_username)
+        with self.engine.connect() as conn:
+            return conn.execute(query).scalar()
+
+    def get_due_posts(self, account_username, now=None):
+        now = to_epoch(now) if now else now_epoch()
+        events, schedule = self.events, self.schedule
+        query = select(
+            *[column for column in events.c],
+            schedule.c.id.label('schedule_id'),
+            schedule.c.interval.label('schedule_interval'),
+            schedule.c.scheduled_ts
+        ).select_from(
+            schedule.join(events, events.c.id == schedule.c.event_id)
+        ).where(
+            schedule.c.is_posted == false(),
+            schedule.c.scheduled_ts <= now,
+            or_(schedule.c.claimed_ts.is_(None), schedule.c.claimed_ts < now - int(CLAIM_TIMEOUT.total_seconds())),
+            events.c.account_username == account_username,
+            events.c.duplicate_of.is_(None),
+            events.c.start_ts >= now - int(PAST_EVENT_RETENTION.total_seconds()),
+            or_(events.c.last_posted_ts.is_(None), events.c.last_posted_ts < schedule.c.scheduled_ts)
+        ).order_by(events.c.start_ts, schedule.c.event_id, schedule.c.scheduled_ts)
+
+        # Keep the latest due entry per event; rows arrive in start order
+        due = {}
+        with self.engine.connect() as conn:
+            for row in conn.execute(query):
+                due[row.id] = event_from_mapping(row._mapping)
+        return list(due.values())
+
+    def claim_post(self, schedule_id, now=None):
+        now = to_epoch(now) if now else now_epoch()
+        schedule = self.schedule
+        with self.engine.begin() as conn:
+            target = conn.execute(
+                select(schedule.c.event_id, schedule.c.scheduled_ts).where(schedule.c.id == schedule_id)
+            ).first()
+            claimed = target is not None and conn.execute(
+                schedule.update().where(
+                    schedule.c.id == schedule_id,
+                    schedule.c.is_posted == false(),
+                    or_(schedule.c.claimed_ts.is_(None), schedule.c.claimed_ts < now - int(CLAIM_TIMEOUT.total_seconds()))
+                ).values(claimed_ts=now)
+            ).rowcount > 0
+            if claimed:
+                conn.execute(
+                    schedule.update().where(
+                        schedule.c.event_id == target.event_id,
+                        schedule.c.scheduled_ts <= target.scheduled_ts,
+                        schedule.c.is_posted == false()
+                    ).values(claimed_ts=now)
+                )
+        if not claimed:
+            logger.info(f"SQLAlchemyRepository.claim_post: Schedule entry {schedule_id} is already posted or claimed")
+        return claimed
+
+    def _schedule_entry(self, conn, schedule_id):
+        target = conn.execute(
+            select(self.schedule.c.event_id, self.schedule.c.scheduled_ts).where(self.schedule.c.id == schedule_id)
+        ).first()
+        if target is None:
+            raise ValueError(f"No schedule entry with ID {schedule_id}")
+        return target
+
+    def release_post(self, schedule_id):
+        schedule = self.schedule
+        with self.engine.begin() as conn:
+            target = self._schedule_entry(conn, schedule_id)
+            conn.execute(
+                schedule.update().where(
+                    schedule.c.event_id == target.event_id,
+                    schedule.c.is_posted == false()
+                ).values(claimed_ts=None)
+            )
+
+    def complete_post(self, schedule_id, posted_at=None):
+        schedule = self.schedule
+        with self.engine.begin() as conn:
+            target = self._schedule_entry(conn, schedule_id)
+            conn.execute(
+                schedule.update().where(
+                    schedule.c.event_id == target.event_id,
+                    schedule.c.scheduled_ts <= target.scheduled_ts,
+                    schedule.c.is_posted == false()
+                ).values(is_posted=true(), claimed_ts=None)
+            )
+            conn.execute(
+                self.events.update().where(self.events.c.id == target.event_id).values(
+                    last_posted_ts=to_epoch(posted_at) if posted_at else now_epoch()
+                )
+            )
+
+    def archive_past_events(self, account_username, now=None, batch_size=db_manager.ARCHIVE_BATCH_SIZE):
+        now = to_epoch(now) if now else now_epoch()
+        cutoff = now - int(PAST_EVENT_RETENTION.total_seconds())
+        events, schedule = self.events, self.schedule
+        archived = 0
+        while True:
+            with self.engine.begin() as conn:
+                ids = [row[0] for row in conn.execute(
+                    select(events.c.id).where(
+                        events.c.account_username == account_username,
+                        events.c.start_ts < cutoff
+                    ).order_by(events.c.start_ts).limit(batch_size)
+                )]
+                if not ids:
+                    break
+                conn.execute(self.events_archive.insert().from_select(
+                    [column.name for column in events.c] + ['archived_ts'],
+                    select(*events.c, literal(now, Integer)).where(events.c.id.in_(ids))
+                ))
+                conn.execute(self.schedule_archive.insert().from_select(
+                    [column.name for column in schedule.c] + ['archived_ts'],
+                    select(*schedule.c, literal(now, Integer)).where(schedule.c.event_id.in_(ids))
+                ))
+                conn.execute(schedule.delete().where(schedule.c.event_id.in_(ids)))
+                conn.execute(events.delete().where(events.c.id.in_(ids)))
+            archived += len(ids)
+            if len(ids) < batch_size:
+                break
+        if archived:
+            logger.info(f"Archived {archived} events older than {PAST_EVENT_RETENTION} for {account_username}")
+        return archived
+
+    def close(self):
+        self.engine.dispose()
+
+def open_repository(database):
+    """
+    Open a repository for a database path (raw sqlite3 fast path) or an
+    SQLAlchemy URL such as postgresql://user@host/events.
+    """
+    if '://' in database:
+        logger.info(f"open_repository: Using SQLAlchemy backend for {database}")
+        return SQLAlchemyRepository(create_engine(database))
+    return SQLiteRepository(db_manager.connect_to_db(database))
@@ -0,0 +1,86 @@
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python 3.8
+    from backports.zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Timestamps are stored as integer epoch seconds (UTC) in columns declared
+# with this type. Connections opened with detect_types=PARSE_DECLTYPES get
+# them back as aware UTC datetimes.
+EPOCH_DECLTYPE = 'UTCEPOCH'
+
+# Timezone of the calendars we scrape; their times carry no offset
+DEFAULT_SOURCE_TZ = 'America/Chicago'
+
+def get_timezone(name):
+    """Return the tzinfo for an IANA name, or None (system local time) if it is unknown"""
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+def localize(dt, tz_name=None):
+    """
+    Make a datetime aware. Naive datetimes are wall-clock times in tz_name,
+    or in the system's local time when tz_name is not given.
+    """
+    if dt.tzinfo is not None:
+        return dt
+    tz = get_timezone(tz_name)
+    if tz is None:
+        return dt.astimezone()
+    return dt.replace(tzinfo=tz)
+
+def timezone_name(dt):
+    """Name of the timezone of an aware datetime, as recorded in source_tz"""
+    dt = localize(dt)
+    return getattr(dt.tzinfo, 'key', None) or dt.tzname()
+
+def to_epoch(value, tz_name=None):
+    """Convert a datetime (naive times are interpreted as in localize) or epoch value to int epoch seconds"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return int(localize(value, tz_name).timestamp())
+    return int(value)
+
+def from_epoch(value, tz_name=None):
+    """
+    Convert a stored timestamp (epoch int, or the datetime the converter
+    produced) to an aware datetime in tz_name, or in system local time.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        dt = localize(value)
+    else:
+        dt = datetime.fromtimestamp(int(value), timezone.utc)
+    return dt.astimezone(get_timezone(tz_name))
+
+def now_epoch():
+    """The current time in epoch seconds"""
+    return int(time.time())
+
+def iso_to_epoch(text, tz_name=None):
+    """Convert a legacy ISO 8601 column value to epoch seconds, see localize for naive values"""
+    if not text:
+        return None
+    return to_epoch(datetime.fromisoformat(text), tz_name)
+
+def _adapt_datetime(value):
+    return to_epoch(value)
+
+def _convert_epoch(value):
+    return datetime.fromtimestamp(int(value), timezone.utc)
+
+def register_sqlite_types():
+    """Store datetimes as epoch seconds and read UTCEPOCH columns back as aware datetimes"""
+    sqlite3.register_adapter(datetime, _adapt_datetime)
+    sqlite3.register_converter(EPOCH_DECLTYPE, _convert_epoch)
+
+register_sqlite_types()
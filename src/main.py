@@ -1,19 +1,24 @@
 import os
 import logging
-import json
-import argparse
-from datetime import datetime, timedelta
+from datetime import datetime
 from src.config.config_loader import load_config, load_credentials
 from src.scrapers.oshkosh_scraper import OshkoshScraper
 from src.scrapers.winnebago_scraper import WinnebagoScraper
 from src.database.db_manager import (
-    connect_to_db, create_event_table, create_publication_schedule_table, add_event, check_event_exists, get_postable_events, get_events, schedule_event_posts
+    connect_to_db, add_event, get_postable_events, schedule_event_posts,
+    get_update_intervals, unschedule_intervals, archive_past_events, render_event_posts
 )
-from src.bluesky.auth import authenticate
-from src.bluesky.poster import post_event_to_bluesky
+from src.database.migrations import migrate_database
+from src.database.profiler import log_profile
+from src.database.timestamps import DEFAULT_SOURCE_TZ, localize
+from src.bluesky.engine import post_events
+from src.bluesky.metrics import plan_intervals
+from src.bluesky.templates import compile_template, post_content
+from src.bluesky.digest import digest_sites, split_digests, plan_digest
 
 # Import the backup script
-from src.scripts.backup_database import create_backup, cleanup_old_backups
+from src.scripts.backup_database import start_backup_thread
+from src.scripts.maintain_database import run_maintenance
 
 # Configure logging
 logging.basicConfig(
@@ -53,13 +58,44 @@ def parse_date_string(date_str):
                 logger.error(f"Failed to parse date string: {date_str}")
                 raise
 
+def plan_update_intervals(connection, config, unschedule=True):
+    """
+    The update intervals to schedule each website's events with, by site
+    name: for sites with prune_intervals only those whose posts get
+    engagement. With unschedule, the pending posts of the pruned intervals
+    are deleted as well.
+    """
+    update_intervals = {}
+    for website in config['websites']:
+        kept = plan_intervals(connection, website)
+        pruned = [label for label in website.get('update_intervals', []) if label not in kept]
+        if unschedule and pruned:
+            unschedule_intervals(connection, website['account_username'], website['name'], pruned)
+        update_intervals[website['name']] = get_update_intervals(dict(website, update_intervals=kept))
+    return update_intervals
+
+def render_posts(connection, config):
+    """Render the post text of new and changed events with each site's post_template"""
+    for website in config['websites']:
+        rendered = render_event_posts(connection, website['name'], compile_template(website.get('post_template')))
+        if rendered:
+            logger.info(f"Rendered {rendered} posts for {website['name']}")
+
+def log_digests(groups):
+    """Log the posts of the digests a run would post instead of their events"""
+    for settings, events in groups:
+        for post in plan_digest(events, settings):
+            logger.info(
+                f"Dry run: Would post digest of {len(post.events)} events to {events[0].account_username}: {post.text}"
+            )
+
 def dry_run(skip_scraping):
     logger.info("Starting dry-run mode")
 
     config = load_config('config/config.json')
     connection = connect_to_db('database/events.db')
-    create_event_table(connection)
-    create_publication_schedule_table(connection)
+    migrate_database(connection)
+    update_intervals = plan_update_intervals(connection, config, unschedule=False)
 
     if not skip_scraping:
         for website in config['websites']:
@@ -70,60 +106,64 @@ def dry_run(skip_scraping):
             events = scraper.scrape()
             for ev in events:
                 try:
-                    start_date = parse_date_string(ev['start_date'])
-                    end_date = parse_date_string(ev['end_date']) if ev['end_date'] != 'N/A' else start_date
-                    if not check_event_exists(connection, ev['title'], start_date, ev['url']):
-                        event_id = add_event(
-                            connection,
-                            ev['title'],
-                            start_date,
-                            end_date,
-                            ev['url'],
-                            ev.get('description', ''),
-                            ev.get('location', ''),
-                            ev.get('address', ''),
-                            ev.get('city', ''),
-                            ev.get('region', ''),
-                            ' '.join(website.get('hashtags', [])),  # Add hashtags from config
-                            website['account_username'],
-                            website['name']
-                        )
-                        if event_id:
-                            intervals = [timedelta(days=30), timedelta(days=14), timedelta(days=5), timedelta(days=1)]
-                            schedule_event_posts(connection, event_id, start_date, intervals)
+                    source_tz = website.get('timezone', DEFAULT_SOURCE_TZ)
+                    start_date = localize(parse_date_string(ev['start_date']), source_tz)
+                    end_date = localize(parse_date_string(ev['end_date']), source_tz) if ev['end_date'] != 'N/A' else start_date
+                    event_id = add_event(
+                        connection,
+                        ev['title'],
+                        start_date,
+                        end_date,
+                        ev['url'],
+                        ev.get('description', ''),
+                        ev.get('location', ''),
+                        ev.get('address', ''),
+                        ev.get('city', ''),
+                        ev.get('region', ''),
+                        ' '.join(website.get('hashtags', [])),  # Add hashtags from config
+                        website['account_username'],
+                        website['name'],
+                        canonical_sources=config.get('canonical_sources'),
+                        source_id=ev.get('source_id'),
+                        image_url=ev.get('image_url')
+                    )
+                    if event_id:
+                        schedule_event_posts(connection, event_id, start_date, update_intervals[website['name']])
                 except ValueError as e:
                     logger.error(f"Date parsing error: {e}")
                     continue
 
+    render_posts(connection, config)
+
     all_events = []
     for website in config['websites']:
         postable_events = get_postable_events(connection, website)
         all_events.extend(postable_events)
 
-    all_events.sort(key=lambda x: parse_date_string(x['start_date']))
+    all_events.sort(key=lambda x: x.start_ts)
+    groups, all_events = split_digests(all_events, digest_sites(config))
+    log_digests(groups)
     for event in all_events:
-        start_date = parse_date_string(event['start_date'])
-        hashtags = event.get('hashtags', '').split()  # Retrieve hashtags from the database
-        post_content = f"{event['title']} ({start_date.strftime('%Y-%m-%d %H:%M')}) - {event['description']} {' '.join(hashtags)} {event['url']}"
-
-        logger.info(f"Dry run: Would post: {post_content}")
+        logger.info(f"Dry run: Would post: {post_content(event)[0]}")
+    log_profile(connection)
     return True
 
 def post(skip_scraping):
     logger.info("post: Starting production mode")
+    backup_thread = None
+    connection = None
     try:
         config = load_config('config/config.json')
         credentials = load_credentials()
         connection = connect_to_db('database/events.db')
-        create_event_table(connection)
-        create_publication_schedule_table(connection)
+        migrate_database(connection)
+        update_intervals = plan_update_intervals(connection, config)
 
-        # Create a backup before modifying the database
-        create_backup()
-        cleanup_old_backups()
+        # Back up online in the background; the backup API copies a
+        # consistent snapshot while this run keeps writing
+        backup_thread = start_backup_thread()
 
         max_posts = int(os.getenv('MAX_POSTS', '0'))
-        post_count = 0
 
         if not skip_scraping:
             for website in config['websites']:
@@ -134,72 +174,78 @@ def post(skip_scraping):
                 events = scraper.scrape()
                 for ev in events:
                     try:
-                        start_date = parse_date_string(ev['start_date'])
-                        end_date = parse_date_string(ev['end_date']) if ev['end_date'] != 'N/A' else start_date
-                        if not check_event_exists(connection, ev['title'], start_date, ev['url']):
-                            event_id = add_event(
-                                connection,
-                                ev['title'],
-                                start_date,
-                                end_date,
-                                ev['url'],
-                                ev.get('description', ''),
-                                ev.get('location', ''),
-                                ev.get('address', ''),
-                                ev.get('city', ''),
-                                ev.get('region', ''),
-                                ev.get('hashtags', ''),  # Add hashtags from event data
-                                website['account_username'],
-                                website['name']
-                            )
-                            if event_id:
-                                intervals = [timedelta(days=30), timedelta(days=14), timedelta(days=5), timedelta(days=1)]
-                                schedule_event_posts(connection, event_id, start_date, intervals)
+                        source_tz = website.get('timezone', DEFAULT_SOURCE_TZ)
+                        start_date = localize(parse_date_string(ev['start_date']), source_tz)
+                        end_date = localize(parse_date_string(ev['end_date']), source_tz) if ev['end_date'] != 'N/A' else start_date
+                        event_id = add_event(
+                            connection,
+                            ev['title'],
+                            start_date,
+                            end_date,
+                            ev['url'],
+                            ev.get('description', ''),
+                            ev.get('location', ''),
+                            ev.get('address', ''),
+                            ev.get('city', ''),
+                            ev.get('region', ''),
+                            ev.get('hashtags', ''),  # Add hashtags from event data
+                            website['account_username'],
+                            website['name'],
+                            canonical_sources=config.get('canonical_sources'),
+                            source_id=ev.get('source_id'),
+                            image_url=ev.get('image_url')
+                        )
+                        if event_id:
+                            schedule_event_posts(connection, event_id, start_date, update_intervals[website['name']])
                     except ValueError as e:
                         logger.error(f"Date parsing error: {e}")
                         continue
 
-        authenticated_accounts = {}
-        for account in credentials['accounts']:
-            token = authenticate(account['username'], account['password'])
-            authenticated_accounts[account['username']] = {
-                'username': account['username'],
-                'password': account['password'],  # Ensure password is included
-                'auth_token': token
-            }
+        render_posts(connection, config)
+
+        accounts = {account['username']: account for account in credentials['accounts']}
+
+        # Move past events out of the hot tables before scanning for due posts
+        for website in config['websites']:
+            archive_past_events(connection, website['account_username'])
 
         all_events = []
         for website in config['websites']:
             postable_events = get_postable_events(connection, website)
             all_events.extend(postable_events)
 
-        all_events.sort(key=lambda x: parse_date_string(x['start_date']))
-        for event in all_events:
-            if max_posts > 0 and post_count >= max_posts:
-                logger.info(f"Reached the maximum number of posts: {max_posts}")
-                break
+        all_events.sort(key=lambda x: x.start_ts)
+        if max_posts > 0 and len(all_events) > max_posts:
+            logger.info(f"Reached the maximum number of posts: {max_posts}")
+            all_events = all_events[:max_posts]
 
-            account = authenticated_accounts.get(event['account_username'])
-            if not account:
-                logger.warning(f"No credentials for account {event['account_username']}")
-                continue
-            start_date = parse_date_string(event['start_date'])
-            hashtags = event.get('hashtags', '').split()  # Retrieve hashtags from the database
-            post_content = f"{event['title']} ({start_date.strftime('%Y-%m-%d %H:%M')}) - {event['description']} {' '.join(hashtags)} {event['url']}"
+        digests = digest_sites(config)
+        if os.getenv('PROD') == 'TRUE':
+            # One worker per account; the run takes as long as the slowest account
+            # Then the engagement of recent posts, for plan_update_intervals on later runs
+            post_events(
+                connection, accounts, all_events, digests=digests,
+                collect_metrics=os.getenv('COLLECT_METRICS', 'TRUE').upper() == 'TRUE'
+            )
+        else:
+            groups, all_events = split_digests(all_events, digests)
+            log_digests(groups)
+            for event in all_events:
+                logger.info(f"Dry run: Would post {post_content(event)[0]} to {event.account_username}")
 
-            try:
-                if os.getenv('PROD') == 'TRUE':
-                    post_event_to_bluesky(event, account, connection)
-                    post_count += 1
-                else:
-                    logger.info(f"Dry run: Would post {post_content} to {account['username']}")
-            except ValueError as e:
-                logger.error(f"Failed to post event: {event['title']} due to: {e}")
-                continue
+        if os.getenv('DB_MAINTENANCE', 'FALSE').upper() == 'TRUE':
+            # Vacuuming needs the backup's read transaction to be over
+            backup_thread.join()
+            run_maintenance(connection)
 
     except Exception as e:
         logger.error(f"post: Failed: {e}")
         raise
+    finally:
+        if backup_thread is not None:
+            backup_thread.join()
+        if connection is not None:
+            log_profile(connection)
 
 if __name__ == "__main__":
     skip_scraping = os.getenv('SKIP_SCRAPING', 'FALSE').upper() == 'TRUE'
@@ -1,5 +1,6 @@
 import logging
 from abc import ABC, abstractmethod
+from urllib.parse import urlparse
 from selenium import webdriver
 
 # Configure logging
@@ -28,6 +29,19 @@ class BaseScraper(ABC):
         logger.info("BaseScraper.scrape: Starting scrape operation")
         raise NotImplementedError("Subclasses should implement this method.")
 
+    def source_id(self, url):
+        """Stable ID of an event on its source site, used to update rescraped events in place. Defaults to the URL path."""
+        return urlparse(url).path.rstrip('/') or None
+
+    def image_url(self, json_ld):
+        """URL of the first image in a JSON-LD record, which may be a URL, an ImageObject or a list of either"""
+        image = json_ld.get('image')
+        if isinstance(image, list):
+            image = image[0] if image else None
+        if isinstance(image, dict):
+            image = image.get('url') or image.get('contentUrl')
+        return image if isinstance(image, str) and image.startswith('http') else None
+
     def handle_data(self, data):
         raise NotImplementedError("Subclasses should implement this method.")
 
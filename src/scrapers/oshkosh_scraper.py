@@ -95,6 +95,11 @@ class OshkoshScraper(BaseScraper):
             logger.error(f"extract_event_links: Error during link extraction: {e}", exc_info=True)
             raise
 
+    def source_id(self, url):
+        """The numeric event ID at the end of the URL, which stays the same when an event is renamed or rescheduled"""
+        match = re.search(r'/(\d{6,})/?$', url)
+        return match.group(1) if match else super().source_id(url)
+
     def is_next_button_present(self, driver):
         logger.info("is_next_button_present: Checking for next button")
         try:
@@ -229,6 +234,8 @@ class OshkoshScraper(BaseScraper):
                             'start_date': start_date or event_data.get('startDate', 'N/A'),
                             'end_date': end_date or event_data.get('endDate', 'N/A'),
                             'url': link,
+                            'source_id': self.source_id(link),
+                            'image_url': self.image_url(event_data),
                             'description': event_data.get('description', 'N/A'),
                             'location': event_data.get('location', {}).get('name', 'N/A'),
                             'address': event_data.get('location', {}).get('address', {}).get('streetAddress', 'N/A'),
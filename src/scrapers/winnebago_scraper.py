@@ -79,6 +79,7 @@ class WinnebagoScraper(BaseScraper):
                                         'start_date': date,
                                         'end_date': date,
                                         'url': full_url,
+                                        'source_id': self.source_id(full_url),
                                         'description': description,
                                         'location': location,
                                         'address': address,
@@ -1,7 +1,15 @@
 import os
-import shutil
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
 import logging
-from datetime import datetime, timedelta
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from src.database.db_manager import connect_to_db
+from src.database.timestamps import localize, to_epoch, now_epoch
 
 # Configure logging
 logging.basicConfig(
@@ -18,40 +26,410 @@ BACKUP_DIR = 'database/backups'
 DATABASE_FILE = 'database/events.db'
 MAX_BACKUPS = 5
 
-def create_backup():
+# Copy this many pages per backup step and pause between steps so that
+# writers are never locked out for the duration of a full copy
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.01
+
+MANIFEST_SUFFIX = '.manifest.json'
+
+# Deduplicated snapshot store: snapshots/<id>.json lists the SHA-256 of each
+# chunk of CHUNK_PAGES pages, chunks/<xx>/<sha256>.z holds the zlib
+# compressed chunk. Unchanged chunks are shared between snapshots.
+STORE_DIR = os.path.join(BACKUP_DIR, 'store')
+CHUNK_PAGES = 16
+SNAPSHOT_RETENTION = timedelta(weeks=4)
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def database_fingerprint(db_path):
+    """
+    Sizes and modification times of the database file and its WAL. Every
+    commit changes at least one of them, so an equal fingerprint means an
+    unchanged database without reading it.
+    """
+    fingerprint = []
+    for path in (db_path, db_path + '-wal'):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            stat = None
+        # Opening the database, even read-only, leaves an empty WAL behind;
+        # with no frames in it, it is the same as no WAL at all
+        if stat is None or stat.st_size == 0:
+            fingerprint.append(None)
+        else:
+            fingerprint.append([stat.st_size, stat.st_mtime_ns])
+    return fingerprint
+
+def copy_database(source, destination_path, pages=BACKUP_PAGES_PER_STEP, step_sleep=BACKUP_STEP_SLEEP):
+    """
+    Copy a consistent snapshot of the database behind the source connection
+    to destination_path with the SQLite online backup API.
+
+    Returns:
+        dict: page_count, steps and integrity_check result of the copy.
+    """
+    steps = []
+
+    def progress(status, remaining, total):
+        steps.append(remaining)
+        logger.debug(f"copy_database: {total - remaining}/{total} pages copied")
+        if remaining and step_sleep:
+            time.sleep(step_sleep)
+
+    destination = sqlite3.connect(destination_path)
+    try:
+        # Pin one WAL snapshot for the whole copy; otherwise every commit by
+        # another connection between steps restarts the backup
+        source.execute('BEGIN')
+        source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        source.backup(destination, pages=pages, progress=progress)
+        integrity = destination.execute('PRAGMA integrity_check').fetchone()[0]
+        page_count = destination.execute('PRAGMA page_count').fetchone()[0]
+        page_size = destination.execute('PRAGMA page_size').fetchone()[0]
+        schema_version = destination.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        destination.close()
+    return {
+        'page_count': page_count,
+        'page_size': page_size,
+        'schema_version': schema_version,
+        'steps': len(steps),
+        'integrity_check': integrity
+    }
+
+def create_backup(db_path=DATABASE_FILE, backup_dir=BACKUP_DIR, pages=BACKUP_PAGES_PER_STEP, step_sleep=BACKUP_STEP_SLEEP):
+    """
+    Back up the live database without blocking other connections.
+
+    The copy is made in steps of `pages` pages through a read-only
+    connection, verified with PRAGMA integrity_check and only then renamed
+    into place next to a JSON manifest describing it.
+
+    Returns:
+        str: Path of the backup file.
+    """
     logger.info("Starting database backup process")
-    if not os.path.exists(BACKUP_DIR):
-        os.makedirs(BACKUP_DIR)
-        logger.info(f"Created backup directory: {BACKUP_DIR}")
-    
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    backup_file = os.path.join(BACKUP_DIR, f'events_{timestamp}.db')
-    
+    if not os.path.exists(backup_dir):
+        os.makedirs(backup_dir)
+        logger.info(f"Created backup directory: {backup_dir}")
+
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    backup_file = os.path.join(backup_dir, f'events_{timestamp}.db')
+    partial_file = backup_file + '.partial'
+
     try:
-        shutil.copy2(DATABASE_FILE, backup_file)
-        logger.info(f"Backup created: {backup_file}")
+        started = time.monotonic()
+        source = connect_to_db(db_path, read_only=True)
+        try:
+            details = copy_database(source, partial_file, pages, step_sleep)
+        finally:
+            source.close()
+
+        if details['integrity_check'] != 'ok':
+            raise sqlite3.DatabaseError(f"Backup failed integrity check: {details['integrity_check']}")
+
+        os.replace(partial_file, backup_file)
+        manifest = {
+            'backup_file': os.path.basename(backup_file),
+            'source': os.path.abspath(db_path),
+            'created_at': datetime.now().isoformat(),
+            'size_bytes': os.path.getsize(backup_file),
+            'sha256': _sha256(backup_file),
+            'duration_seconds': round(time.monotonic() - started, 3),
+            **details
+        }
+        with open(backup_file + MANIFEST_SUFFIX, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        logger.info(f"Backup created: {backup_file} ({details['page_count']} pages in {details['steps']} steps)")
+        return backup_file
     except Exception as e:
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
         logger.error(f"Failed to create backup: {e}")
         raise
 
-def cleanup_old_backups():
+def _chunk_path(store_dir, digest):
+    return os.path.join(store_dir, 'chunks', digest[:2], f'{digest}.z')
+
+def _write_atomic(path, data):
+    partial = path + '.partial'
+    with open(partial, 'wb') as f:
+        f.write(data)
+    os.replace(partial, path)
+
+def list_snapshots(store_dir=STORE_DIR):
+    """Return the manifests of all snapshots in the store, oldest first"""
+    snapshot_dir = os.path.join(store_dir, 'snapshots')
+    if not os.path.isdir(snapshot_dir):
+        return []
+    snapshots = []
+    for name in os.listdir(snapshot_dir):
+        if name.endswith('.json'):
+            with open(os.path.join(snapshot_dir, name)) as f:
+                snapshots.append(json.load(f))
+    return sorted(snapshots, key=lambda m: (m['created_ts'], m['id']))
+
+def store_backup(db_path=DATABASE_FILE, store_dir=STORE_DIR, chunk_pages=CHUNK_PAGES):
+    """
+    Add a snapshot of the live database to the deduplicated backup store.
+
+    The database is copied with copy_database, split into chunks of
+    chunk_pages pages and only chunks the store does not hold yet are
+    compressed and written. No snapshot is recorded when the database is
+    identical to the latest one. When its database_fingerprint matches the
+    latest snapshot's, it is not even copied.
+
+    Returns:
+        dict: Manifest of the new snapshot, or None if nothing changed.
+    """
+    logger.info("store_backup: Starting snapshot")
+    # Taken before copying, so a commit made during the copy shows up next time
+    fingerprint = database_fingerprint(db_path)
+    snapshots = list_snapshots(store_dir)
+    if snapshots and snapshots[-1].get('fingerprint') == fingerprint:
+        logger.info(f"store_backup: Database files unchanged since snapshot {snapshots[-1]['id']}, skipping")
+        return None
+
+    for sub_dir in ('chunks', 'snapshots'):
+        os.makedirs(os.path.join(store_dir, sub_dir), exist_ok=True)
+
+    fd, copy_path = tempfile.mkstemp(suffix='.partial', dir=store_dir)
+    os.close(fd)
+    try:
+        started = time.monotonic()
+        source = connect_to_db(db_path, read_only=True)
+        try:
+            details = copy_database(source, copy_path)
+        finally:
+            source.close()
+        if details['integrity_check'] != 'ok':
+            raise sqlite3.DatabaseError(f"Snapshot failed integrity check: {details['integrity_check']}")
+
+        chunk_size = details['page_size'] * chunk_pages
+        whole = hashlib.sha256()
+        chunks = []
+        new_chunks = 0
+        stored_bytes = 0
+        with open(copy_path, 'rb') as f:
+            for data in iter(lambda: f.read(chunk_size), b''):
+                whole.update(data)
+                digest = hashlib.sha256(data).hexdigest()
+                chunks.append(digest)
+                path = _chunk_path(store_dir, digest)
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    compressed = zlib.compress(data)
+                    _write_atomic(path, compressed)
+                    new_chunks += 1
+                    stored_bytes += len(compressed)
+    finally:
+        os.remove(copy_path)
+
+    if snapshots and snapshots[-1]['sha256'] == whole.hexdigest():
+        # Only the files changed, for example by a checkpoint; remember them
+        # so the next run skips the copy
+        latest = dict(snapshots[-1], fingerprint=fingerprint)
+        _write_atomic(
+            os.path.join(store_dir, 'snapshots', f"{latest['id']}.json"), json.dumps(latest, indent=2).encode()
+        )
+        logger.info(f"store_backup: Database unchanged since snapshot {latest['id']}, skipping")
+        return None
+
+    created = datetime.now(timezone.utc)
+    manifest = {
+        'id': created.strftime('%Y%m%dT%H%M%S%fZ'),
+        'created_at': created.isoformat(),
+        'created_ts': to_epoch(created),
+        'source': os.path.abspath(db_path),
+        'size_bytes': details['page_count'] * details['page_size'],
+        'sha256': whole.hexdigest(),
+        'fingerprint': fingerprint,
+        'chunk_size': chunk_size,
+        'chunks': chunks,
+        'new_chunks': new_chunks,
+        'stored_bytes': stored_bytes,
+        'duration_seconds': round(time.monotonic() - started, 3),
+        **details
+    }
+    _write_atomic(
+        os.path.join(store_dir, 'snapshots', f"{manifest['id']}.json"),
+        json.dumps(manifest, indent=2).encode()
+    )
+    logger.info(
+        f"store_backup: Snapshot {manifest['id']}: {len(chunks)} chunks, {new_chunks} new "
+        f"({stored_bytes} bytes written)"
+    )
+    return manifest
+
+def find_snapshot(at=None, store_dir=STORE_DIR):
+    """
+    Return the manifest of the latest snapshot taken at or before `at`
+    (a datetime, naive values are local time), or the latest snapshot.
+    """
+    snapshots = list_snapshots(store_dir)
+    if at is not None:
+        cutoff = to_epoch(at)
+        snapshots = [m for m in snapshots if m['created_ts'] <= cutoff]
+    if not snapshots:
+        raise ValueError(f"No snapshot found at or before {at}")
+    return snapshots[-1]
+
+def restore_snapshot(at=None, output_path=DATABASE_FILE, store_dir=STORE_DIR):
+    """
+    Rebuild the snapshot selected by find_snapshot into output_path.
+
+    The chunks are reassembled and verified in a temporary file, then
+    copied into output_path with the backup API so that restoring over a
+    database in WAL mode is safe.
+
+    Returns:
+        dict: Manifest of the restored snapshot.
+    """
+    manifest = find_snapshot(at, store_dir)
+    logger.info(f"restore_snapshot: Restoring snapshot {manifest['id']} to {output_path}")
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+
+    fd, copy_path = tempfile.mkstemp(suffix='.partial', dir=output_dir)
+    try:
+        whole = hashlib.sha256()
+        with os.fdopen(fd, 'wb') as f:
+            for digest in manifest['chunks']:
+                with open(_chunk_path(store_dir, digest), 'rb') as chunk:
+                    data = zlib.decompress(chunk.read())
+                if hashlib.sha256(data).hexdigest() != digest:
+                    raise sqlite3.DatabaseError(f"Chunk {digest} is corrupt")
+                whole.update(data)
+                f.write(data)
+        if whole.hexdigest() != manifest['sha256']:
+            raise sqlite3.DatabaseError(f"Snapshot {manifest['id']} does not match its checksum")
+
+        source = sqlite3.connect(copy_path)
+        try:
+            integrity = source.execute('PRAGMA integrity_check').fetchone()[0]
+            if integrity != 'ok':
+                raise sqlite3.DatabaseError(f"Restored snapshot failed integrity check: {integrity}")
+            destination = connect_to_db(output_path)
+            try:
+                source.backup(destination)
+            finally:
+                destination.close()
+        finally:
+            source.close()
+    except Exception as e:
+        logger.error(f"restore_snapshot: Failed: {e}")
+        raise
+    finally:
+        if os.path.exists(copy_path):
+            os.remove(copy_path)
+
+    logger.info(f"restore_snapshot: Restored snapshot {manifest['id']} ({manifest['created_at']})")
+    return manifest
+
+def prune_snapshots(store_dir=STORE_DIR, retention=SNAPSHOT_RETENTION, now=None):
+    """
+    Delete snapshots older than retention, always keeping the latest one,
+    then delete chunks no remaining snapshot refers to.
+
+    Returns:
+        tuple: (snapshots removed, chunks removed)
+    """
+    snapshots = list_snapshots(store_dir)
+    cutoff = (now_epoch() if now is None else to_epoch(now)) - int(retention.total_seconds())
+    expired = [m for m in snapshots[:-1] if m['created_ts'] < cutoff]
+    for manifest in expired:
+        os.remove(os.path.join(store_dir, 'snapshots', f"{manifest['id']}.json"))
+        logger.info(f"prune_snapshots: Deleted snapshot {manifest['id']}")
+
+    referenced = set()
+    for manifest in snapshots[len(expired):]:
+        referenced.update(manifest['chunks'])
+
+    removed_chunks = 0
+    chunk_root = os.path.join(store_dir, 'chunks')
+    if os.path.isdir(chunk_root):
+        for prefix in os.listdir(chunk_root):
+            for name in os.listdir(os.path.join(chunk_root, prefix)):
+                if name[:-len('.z')] not in referenced:
+                    os.remove(os.path.join(chunk_root, prefix, name))
+                    removed_chunks += 1
+    logger.info(f"prune_snapshots: Removed {len(expired)} snapshots and {removed_chunks} chunks")
+    return len(expired), removed_chunks
+
+def start_backup_thread(db_path=DATABASE_FILE, store_dir=STORE_DIR):
+    """
+    Run store_backup and prune_snapshots in a background thread so the
+    caller can carry on using the database. Join the returned thread before
+    exiting.
+    """
+    def run():
+        try:
+            store_backup(db_path, store_dir)
+            prune_snapshots(store_dir)
+        except Exception as e:
+            logger.error(f"Background backup failed: {e}")
+
+    thread = threading.Thread(target=run, name='database-backup')
+    thread.start()
+    return thread
+
+def cleanup_old_backups(backup_dir=BACKUP_DIR):
     logger.info("Starting cleanup of old backups")
     backups = sorted(
-        [f for f in os.listdir(BACKUP_DIR) if f.startswith('events_')],
-        key=lambda x: os.path.getmtime(os.path.join(BACKUP_DIR, x))
+        [f for f in os.listdir(backup_dir) if f.startswith('events_') and f.endswith('.db')],
+        key=lambda x: os.path.getmtime(os.path.join(backup_dir, x))
     )
-    
+
     while len(backups) > MAX_BACKUPS:
         old_backup = backups.pop(0)
-        old_backup_path = os.path.join(BACKUP_DIR, old_backup)
+        old_backup_path = os.path.join(backup_dir, old_backup)
         try:
             os.remove(old_backup_path)
+            if os.path.exists(old_backup_path + MANIFEST_SUFFIX):
+                os.remove(old_backup_path + MANIFEST_SUFFIX)
             logger.info(f"Deleted old backup: {old_backup_path}")
         except Exception as e:
             logger.error(f"Failed to delete old backup: {e}")
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Back up and restore the events database")
+    parser.add_argument("--db-path", type=str, default=DATABASE_FILE, help="Path to the database file")
+    parser.add_argument("--store-dir", type=str, default=STORE_DIR, help="Path to the backup store")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("backup", help="Add a snapshot to the store and prune expired ones (default)")
+    subparsers.add_parser("full", help="Write a full standalone copy and keep the last five")
+    subparsers.add_parser("list", help="List the snapshots in the store")
+    subparsers.add_parser("prune", help="Delete expired snapshots and unreferenced chunks")
+    restore_parser = subparsers.add_parser("restore", help="Restore a snapshot into --output")
+    restore_parser.add_argument("--at", type=str, help="Restore the latest snapshot at or before this ISO timestamp (local time unless an offset is given)")
+    restore_parser.add_argument("--output", type=str, help="Database to restore into (defaults to --db-path)")
+
+    args = parser.parse_args()
     logger.info("Backup script started")
-    create_backup()
-    cleanup_old_backups()
-    logger.info("Backup script completed")
\ No newline at end of file
+    if args.command in (None, "backup"):
+        store_backup(args.db_path, args.store_dir)
+        prune_snapshots(args.store_dir)
+    elif args.command == "full":
+        create_backup(args.db_path)
+        cleanup_old_backups()
+    elif args.command == "list":
+        for manifest in list_snapshots(args.store_dir):
+            print(
+                f"{manifest['id']}  {manifest['created_at']}  {manifest['size_bytes']} bytes  "
+                f"{len(manifest['chunks'])} chunks ({manifest['new_chunks']} new, {manifest['stored_bytes']} bytes stored)"
+            )
+    elif args.command == "prune":
+        prune_snapshots(args.store_dir)
+    elif args.command == "restore":
+        at = localize(datetime.fromisoformat(args.at)) if args.at else None
+        restore_snapshot(at, args.output or args.db_path, args.store_dir)
+    logger.info("Backup script completed")
@@ -0,0 +1,127 @@
+import os
+import time
+import asyncio
+import logging
+import tempfile
+from datetime import datetime, timedelta
+from atproto_client import AsyncClient
+from src.bluesky.engine import PostingEngine
+from src.database.db_manager import connect_to_db, add_event, schedule_event_posts, get_postable_events
+from src.database.migrations import migrate_database
+from src.scripts.mock_pds import MockPDS
+
+# Configure logging
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bluesky-event-sync.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+def make_due_events(connection, accounts, count):
+    """count events per account, each with a schedule entry that is due now"""
+    start = datetime.now() + timedelta(days=1)
+    events = []
+    for username in accounts:
+        for i in range(count):
+            event_id = add_event(
+                connection, f'Benchmark event {i}', start + timedelta(minutes=i), start + timedelta(minutes=i + 60),
+                f'http://example.com/{username}/{i}', 'Benchmark event description ' * 4, 'Location', 'Address',
+                'City', 'Region', '#benchmark', username, 'Benchmark'
+            )
+            schedule_event_posts(connection, event_id, start + timedelta(minutes=i), [timedelta(days=5)])
+        website = {'name': 'Benchmark', 'account_username': username, 'update_intervals': ['5 days']}
+        events.extend(get_postable_events(connection, website))
+    return events
+
+def percentile(values, share):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+def timed_client_factory(pds_url, latencies):
+    """Log in to the PDS at pds_url and record the latency of every post the client creates"""
+    async def factory(username, password):
+        client = AsyncClient(pds_url)
+        await client.login(username, password, fetch_bsky_profile=False)
+        post = client.app.bsky.feed.post
+        create = post.create
+
+        async def timed_create(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await create(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - started)
+
+        post.create = timed_create
+        return client
+    return factory
+
+def run_benchmark(connection, pds, accounts=2, count=100, max_in_flight=4):
+    """
+    Post count events for each of accounts accounts through a PostingEngine
+    against pds, a running MockPDS.
+
+    Returns:
+        dict: Posts per second, post latency percentiles and the run's results.
+    """
+    usernames = [f'bench{i}.test' for i in range(accounts)]
+    events = make_due_events(connection, usernames, count)
+    latencies = []
+    engine = PostingEngine(
+        connection, {u: {'username': u, 'password': 'secret'} for u in usernames}, max_in_flight,
+        client_factory=timed_client_factory(pds.url, latencies)
+    )
+    started = time.perf_counter()
+    results = asyncio.run(engine.run(events))
+    elapsed = time.perf_counter() - started
+    return {
+        'posts': results['posted'],
+        'seconds': elapsed,
+        'posts_per_second': results['posted'] / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': max(latencies, default=0.0) * 1000,
+        'requests': len(latencies),
+        'commits': engine.commits,
+        'results': results
+    }
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the posting engine against a local mock PDS")
+    parser.add_argument("--accounts", type=int, default=2, help="Number of accounts posting at once")
+    parser.add_argument("--events", type=int, default=100, help="Number of posts per account")
+    parser.add_argument("--in-flight", type=int, default=4, help="Posts per account waiting on the PDS at once")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Delay of every PDS request")
+    parser.add_argument("--jitter-ms", type=float, default=50, help="Random extra delay of up to this much")
+    parser.add_argument("--failure-rate", type=float, default=0, help="Share of writes that fail with 500")
+    parser.add_argument("--drop-rate", type=float, default=0, help="Share of writes applied but answered with 502")
+    parser.add_argument("--write-limit", type=int, default=5000, help="Write points per account per hour")
+
+    args = parser.parse_args()
+
+    pds = MockPDS(
+        latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, failure_rate=args.failure_rate,
+        drop_rate=args.drop_rate, write_limit=(args.write_limit, 3600), seed=0
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir, pds:
+        connection = connect_to_db(os.path.join(tmp_dir, 'posting.db'))
+        try:
+            migrate_database(connection)
+            report = run_benchmark(connection, pds, args.accounts, args.events, args.in_flight)
+        finally:
+            connection.close()
+    print(f"posting ({args.accounts} accounts x {args.events} events, {args.in_flight} in flight)")
+    print(f"  {report['posts']} posts in {report['seconds']:.2f}s: {report['posts_per_second']:.1f} posts/s")
+    print(f"  latency p50 {report['p50_ms']:.1f} ms, p95 {report['p95_ms']:.1f} ms, "
+          f"p99 {report['p99_ms']:.1f} ms, max {report['max_ms']:.1f} ms over {report['requests']} requests")
+    print(f"  {report['commits']} commits, results {report['results']}")
+    print(f"  PDS responses {dict(pds.stats)}")
@@ -0,0 +1,101 @@
+import os
+import time
+import logging
+import tempfile
+from datetime import datetime, timedelta, timezone
+from src.database.db_manager import INTERVAL_MAP
+from src.database.repository import open_repository
+
+# Configure logging
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bluesky-event-sync.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+ACCOUNT = 'benchmark.bsky.social'
+
+def make_events(count, now):
+    """Events spread from two days ago to 40 days ahead, so some are past, due and pending"""
+    events = []
+    for i in range(count):
+        start = now + timedelta(minutes=(i * 42 * 24 * 60) // max(count, 1)) - timedelta(days=2)
+        events.append({
+            'title': f'Benchmark event {i}',
+            'start_date': start,
+            'end_date': start + timedelta(hours=2),
+            'source_tz': 'UTC',
+            'url': f'http://example.com/benchmark/{i}',
+            'description': 'Benchmark event description ' * 4,
+            'location': 'Location',
+            'address': 'Address',
+            'city': 'City',
+            'region': 'Region',
+            'hashtags': '#benchmark',
+            'account_username': ACCOUNT,
+            'config_name': 'Benchmark'
+        })
+    return events
+
+def _timed(timings, name, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    timings[name] = time.perf_counter() - started
+    return result
+
+def run_benchmark(repository, count=1000, posts=100):
+    """
+    Time the bulk operations of a posting run against a repository.
+
+    Returns:
+        dict: Seconds per operation.
+    """
+    now = datetime.now(timezone.utc)
+    events = make_events(count, now)
+    intervals = list(INTERVAL_MAP.values())
+    timings = {}
+
+    _timed(timings, 'add_events', repository.add_events, events, intervals)
+    _timed(timings, 'add_events (existing)', repository.add_events, events, intervals)
+    due = _timed(timings, 'get_due_posts', repository.get_due_posts, ACCOUNT, now)
+
+    started = time.perf_counter()
+    for event in due[:posts]:
+        if repository.claim_post(event.schedule_id, now):
+            repository.complete_post(event.schedule_id, now)
+    timings[f'claim + complete x{min(len(due), posts)}'] = time.perf_counter() - started
+
+    _timed(timings, 'archive_past_events', repository.archive_past_events, ACCOUNT, now)
+    return timings
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the storage backends with bulk operations")
+    parser.add_argument("--events", type=int, default=1000, help="Number of events to insert")
+    parser.add_argument("--posts", type=int, default=100, help="Number of due posts to claim and complete")
+    parser.add_argument("--url", type=str, help="SQLAlchemy URL to benchmark instead of temporary SQLite files")
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.url:
+            databases = {'sqlalchemy': args.url}
+        else:
+            databases = {
+                'sqlite3': os.path.join(tmp_dir, 'sqlite3.db'),
+                'sqlalchemy': f"sqlite:///{os.path.join(tmp_dir, 'sqlalchemy.db')}"
+            }
+        for backend, database in databases.items():
+            repository = open_repository(database)
+            try:
+                timings = run_benchmark(repository, args.events, args.posts)
+            finally:
+                repository.close()
+            print(f"{backend} ({args.events} events)")
+            for name, seconds in timings.items():
+                print(f"  {name:<28} {seconds * 1000:10.1f} ms")
@@ -0,0 +1,74 @@
+import os
+import time
+import logging
+import tempfile
+from datetime import datetime, timedelta, timezone
+from src.bluesky.templates import compile_template, post_content
+from src.database.db_manager import connect_to_db, add_event, get_events, render_event_posts
+from src.database.migrations import migrate_database
+
+# Configure logging
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bluesky-event-sync.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+ACCOUNT = 'benchmark.bsky.social'
+CONFIG_NAME = 'Benchmark'
+# Long enough that every post has to be shortened, with multibyte text
+DESCRIPTION = 'Live music on the Leach Amphitheater lawn 🎸🇺🇸 café ' * 10
+
+def _timed(timings, name, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    timings[name] = time.perf_counter() - started
+    return result
+
+def run_benchmark(connection, count=1000, template=None):
+    """
+    Time rendering every event of a site, rendering again when nothing
+    changed, and reading the stored posts back as the posting loop does.
+
+    Returns:
+        dict: Seconds per operation.
+    """
+    now = datetime.now(timezone.utc)
+    for i in range(count):
+        start = now + timedelta(hours=i)
+        add_event(
+            connection, f'Benchmark event {i}', start, start + timedelta(hours=2), f'http://example.com/benchmark/{i}',
+            DESCRIPTION, 'Location', 'Address', 'City', 'Region', '#benchmark #oshkosh', ACCOUNT, CONFIG_NAME
+        )
+    template = compile_template(template)
+    timings = {}
+
+    _timed(timings, f'render x{count}', render_event_posts, connection, CONFIG_NAME, template)
+    _timed(timings, 'render (unchanged)', render_event_posts, connection, CONFIG_NAME, template)
+    events = list(get_events(connection, ACCOUNT))
+    _timed(timings, f'post_content x{count}', lambda: [post_content(event) for event in events])
+    return timings
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark rendering post templates over a whole events table")
+    parser.add_argument("--events", type=int, default=1000, help="Number of events to render")
+    parser.add_argument("--template", type=str, help="Post template to render instead of the default one")
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        connection = connect_to_db(os.path.join(tmp_dir, 'templates.db'))
+        try:
+            migrate_database(connection)
+            timings = run_benchmark(connection, args.events, args.template)
+        finally:
+            connection.close()
+        print(f"templates ({args.events} events)")
+        for name, seconds in timings.items():
+            print(f"  {name:<28} {seconds * 1000:10.1f} ms")
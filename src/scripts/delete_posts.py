@@ -1,16 +1,26 @@
 import sys
 import os
+import asyncio
 import logging
 import argparse
-from atproto import Client
-from src.config.config_loader import load_config
-from src.bluesky.auth import authenticate
+from collections import deque
+from datetime import datetime, timezone
+from atproto_client.exceptions import RateLimitExceededError
+from src.bluesky.auth import session_pool
+from src.bluesky.outbox import APPLY_WRITES_LIMIT, POST_COLLECTION, list_post_records, record_key, repo_did, tid_time
+from src.bluesky.rate_limiter import RateLimiter, DELETE_COST, MAX_RETRIES, retry_delay
+from src.database.db_manager import connect_to_db, get_post_uris, mark_posts_deleted
+from src.database.timestamps import localize
 
 ## Set password environment variable
 # export BLUESKY_DISCOVEROSHKOSH_PASSWORD=your_password
 #
 # Run script with debug output
 # PYTHONPATH=$(pwd) python3 src/scripts/delete_posts.py discoveroshkosh.bsky.social
+#
+# Only posts of one site's events from 2024, as recorded in the database
+# PYTHONPATH=$(pwd) python3 src/scripts/delete_posts.py discoveroshkosh.bsky.social \
+#     --config-name OshkoshEvents --since 2024-01-01 --until 2025-01-01
 
 # Set up logging to both file and console with DEBUG level
 logging.basicConfig(
@@ -22,62 +32,200 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+DELETE_BATCH_SIZE = APPLY_WRITES_LIMIT
+DELETE_CONCURRENCY = 4
+
+def cursor_file(username):
+    """Where the progress of an interrupted deletion is kept"""
+    return f'delete_cursor_{username}.txt'
+
+def load_cursor(path):
+    try:
+        with open(path, encoding='UTF-8') as f:
+            return f.read().strip() or None
+    except (FileNotFoundError, TypeError):
+        return None
+
+def save_cursor(path, cursor):
+    with open(path, 'w', encoding='UTF-8') as f:
+        f.write(cursor)
+
+def created_at(record):
+    """When a post was created: from its TID record key, or else its createdAt"""
+    created = tid_time(record_key(record.uri))
+    if created is None:
+        value = record.value
+        text = value.get('createdAt') if isinstance(value, dict) else getattr(value, 'created_at', None)
+        created = datetime.fromisoformat(text[:19]).replace(tzinfo=timezone.utc)
+    return created
+
+def matches(record, since=None, until=None, uris=None):
+    """True if a listed post passes the date range and, when given, is one of uris"""
+    if uris is not None and record.uri not in uris:
+        return False
+    if since is None and until is None:
+        return True
+    created = created_at(record)
+    return (since is None or created >= since) and (until is None or created < until)
+
+async def _apply_deletes(client, repo, rkeys, limiter, username):
+    writes = [{'$type': 'com.atproto.repo.applyWrites#delete', 'collection': POST_COLLECTION, 'rkey': rkey}
+              for rkey in rkeys]
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.acquire(username, 'write', DELETE_COST * len(rkeys))
+        try:
+            return await client.com.atproto.repo.apply_writes({'repo': repo, 'writes': writes})
+        except RateLimitExceededError as e:
+            if attempt == MAX_RETRIES:
+                raise
+            limiter.observe(username, 'write', e.response.headers if e.response else {})
+            await asyncio.sleep(retry_delay(attempt))
+
+async def delete_posts(client, username, since=None, until=None, uris=None, batch_size=DELETE_BATCH_SIZE,
+                       concurrency=DELETE_CONCURRENCY, cursor_path=None, limiter=None, on_deleted=None,
+                       dry_run=False):
+    """
+    Delete an account's posts, enumerated with listRecords and deleted with
+    applyWrites in batches of batch_size, up to concurrency batches at a
+    time within the rate limiter's write budget.
+
+    since and until (aware datetimes) limit the posts by creation time and
+    uris to the given post URIs. With cursor_path, progress is saved after
+    every batch and an interrupted run continues where it stopped; the
+    file is removed once everything was deleted. on_deleted is called with
+    the record keys of every deleted batch.
+
+    Returns:
+        int: The number of posts deleted, or that would be with dry_run.
+    """
+    limiter = limiter or RateLimiter()
+    repo = repo_did(client)
+    start = load_cursor(cursor_path)
+    if start:
+        logger.info(f"Continuing deletion for {username} below {start}")
+    slots = asyncio.Semaphore(max(1, concurrency))
+    pending = deque()
+    deleted = 0
+    failed = False
+
+    async def send(rkeys):
+        try:
+            await _apply_deletes(client, repo, rkeys, limiter, username)
+        finally:
+            slots.release()
+
+    async def settle(wait):
+        # Batches finish out of order; progress only advances past a contiguous run of finished ones
+        nonlocal deleted, failed
+        while pending and (wait or pending[0][1].done()):
+            rkeys, task = pending.popleft()
+            try:
+                await task
+            except Exception as e:
+                logger.error(f"Failed to delete {len(rkeys)} posts: {e}")
+                failed = True
+                continue
+            deleted += len(rkeys)
+            logger.info(f"Deleted {deleted} posts")
+            if on_deleted:
+                on_deleted(rkeys)
+            if cursor_path and not failed:
+                save_cursor(cursor_path, rkeys[-1])
+
+    async def flush(rkeys):
+        nonlocal deleted
+        if dry_run:
+            deleted += len(rkeys)
+            return
+        await slots.acquire()
+        pending.append((rkeys, asyncio.create_task(send(rkeys))))
+        await settle(False)
+
+    batch = []
+    async for records in list_post_records(client, repo, limiter, username, start):
+        for record in records:
+            if matches(record, since, until, uris):
+                batch.append(record_key(record.uri))
+            if len(batch) == batch_size:
+                await flush(batch)
+                batch = []
+    if batch:
+        await flush(batch)
+    await settle(True)
+
+    if cursor_path and not failed and not dry_run and os.path.exists(cursor_path):
+        os.remove(cursor_path)
+    return deleted
+
 def delete_all_posts(username, password):
     """Delete all posts for a given Bluesky account."""
+    return asyncio.run(_run(username, password))
+
+async def _run(username, password, connection=None, uris=None, **options):
     logger.debug(f"Starting deletion process for {username}")
-    
     try:
-        # Initialize client
-        logger.debug("Creating Bluesky client")
-        client = Client()
-        
-        # Attempt login
-        logger.debug("Attempting to login")
-        client.login(username, password)
+        # Reuse the account's saved session; only logs in when it has expired
+        logger.debug("Getting Bluesky client")
+        limiter = RateLimiter()
+        client = limiter.watch(await session_pool.async_client(username, password), username)
         logger.info(f"Successfully logged in as {username}")
-        
-        deleted_count = 0
-        cursor = None
-        
-        while True:
-            logger.debug(f"Fetching posts (cursor: {cursor})")
-            feed = client.get_author_feed(actor=username, cursor=cursor)
-            
-            if not feed.feed:
-                logger.info("No posts found")
-                break
-            
-            for post in feed.feed:
-                try:
-                    logger.info(f"Deleting post: {post.post.record.text[:50]}...")
-                    client.delete_post(post.post.uri)
-                    deleted_count += 1
-                    print(f"Deleted post {deleted_count}")
-                except Exception as e:
-                    logger.error(f"Failed to delete post: {e}")
-            
-            cursor = feed.cursor
-            if not cursor:
-                break
-                
-        logger.info(f"Finished. Deleted {deleted_count} posts")
-        
+
+        on_deleted = None
+        if connection is not None:
+            def on_deleted(rkeys):
+                mark_posts_deleted(connection, username, rkeys)
+
+        deleted = await delete_posts(client, username, uris=uris, limiter=limiter, on_deleted=on_deleted, **options)
+        logger.info(f"Finished. {'Would delete' if options.get('dry_run') else 'Deleted'} {deleted} posts")
+        return deleted
     except Exception as e:
         logger.error(f"Error in deletion process: {e}")
         raise
 
+def _parse_date(value):
+    return localize(datetime.fromisoformat(value))
+
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Delete all posts for a Bluesky account")
+    parser = argparse.ArgumentParser(description="Delete posts of a Bluesky account")
     parser.add_argument("username", help="Bluesky username (e.g., username.bsky.social)")
+    parser.add_argument("--since", type=_parse_date, help="Only posts created at or after this date (local time)")
+    parser.add_argument("--until", type=_parse_date, help="Only posts created before this date (local time)")
+    parser.add_argument("--config-name", help="Only posts of this site's events, as recorded in the database")
+    parser.add_argument("--stored-only", action="store_true", help="Only posts recorded in the database")
+    parser.add_argument("--db-path", default="database/events.db", help="Database with the recorded posts")
+    parser.add_argument("--batch-size", type=int, default=DELETE_BATCH_SIZE, help="Deletes per applyWrites call")
+    parser.add_argument("--concurrency", type=int, default=DELETE_CONCURRENCY, help="applyWrites calls at once")
+    parser.add_argument("--restart", action="store_true", help="Ignore the progress of an interrupted run")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the posts that would be deleted")
     args = parser.parse_args()
-    
+
     # Get password from environment
     env_var = f"BLUESKY_{args.username.split('.')[0].upper()}_PASSWORD"
     password = os.getenv(env_var)
-    
+
     if not password:
         logger.error(f"No password found in environment variable {env_var}")
         sys.exit(1)
-    
+
     logger.debug(f"Found password in environment variable {env_var}")
-    delete_all_posts(args.username, password)
\ No newline at end of file
+    connection = connect_to_db(args.db_path) if os.path.exists(args.db_path) else None
+    uris = None
+    if args.config_name or args.stored_only:
+        if connection is None:
+            logger.error(f"No database at {args.db_path} to select posts from")
+            sys.exit(1)
+        uris = get_post_uris(connection, args.username, args.config_name)
+        logger.info(f"Selecting from {len(uris)} posts recorded in the database")
+
+    path = cursor_file(args.username)
+    if args.restart and os.path.exists(path):
+        os.remove(path)
+    try:
+        asyncio.run(_run(
+            args.username, password, connection, uris, since=args.since, until=args.until,
+            batch_size=min(args.batch_size, APPLY_WRITES_LIMIT), concurrency=args.concurrency,
+            cursor_path=None if args.dry_run else path, dry_run=args.dry_run
+        ))
+    finally:
+        if connection is not None:
+            connection.close()
@@ -0,0 +1,180 @@
+import logging
+from src.database.db_manager import connect_to_db
+from src.database.migrations import migrate_database
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bluesky-event-sync.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+DATABASE_FILE = 'database/events.db'
+
+# Orphaned rows deleted per transaction
+ORPHAN_BATCH_SIZE = 1000
+
+# Free pages given back per incremental_vacuum step, and at most per run,
+# so a run never holds the write lock for long
+VACUUM_PAGES_PER_STEP = 1024
+MAX_VACUUM_PAGES = 65536
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+def database_size(connection):
+    """Return (size in bytes, free pages) of the main database"""
+    page_size = connection.execute('PRAGMA page_size').fetchone()[0]
+    page_count = connection.execute('PRAGMA page_count').fetchone()[0]
+    free_pages = connection.execute('PRAGMA freelist_count').fetchone()[0]
+    return page_count * page_size, free_pages
+
+def prune_orphans(connection, batch_size=ORPHAN_BATCH_SIZE):
+    """
+    Delete publication_schedule rows and duplicate index entries whose event
+    no longer exists, batch_size rows per transaction.
+
+    Returns:
+        int: The number of rows deleted.
+    """
+    statements = (
+        '''
+        DELETE FROM publication_schedule WHERE id IN (
+            SELECT ps.id FROM publication_schedule ps
+            WHERE NOT EXISTS (SELECT 1 FROM events e WHERE e.id = ps.event_id)
+            LIMIT ?
+        )
+        ''',
+        '''
+        DELETE FROM event_index WHERE rowid IN (
+            SELECT i.rowid FROM event_index i
+            WHERE NOT EXISTS (SELECT 1 FROM events e WHERE e.id = i.rowid)
+            LIMIT ?
+        )
+        ''',
+    )
+    removed = 0
+    for sql in statements:
+        while True:
+            try:
+                deleted = connection.execute(sql, (batch_size,)).rowcount
+                connection.commit()
+            except Exception as e:
+                connection.rollback()
+                logger.error(f"prune_orphans: Failed: {e}")
+                raise
+            removed += deleted
+            if deleted < batch_size:
+                break
+    logger.info(f"prune_orphans: Removed {removed} orphaned rows")
+    return removed
+
+def enable_incremental_vacuum(connection):
+    """
+    Switch a database created without auto-vacuum to incremental
+    auto-vacuum. This needs one full VACUUM; later runs only use
+    incremental_vacuum.
+
+    Returns:
+        bool: True if the database was converted.
+    """
+    if connection.execute('PRAGMA auto_vacuum').fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+        return False
+    logger.info("enable_incremental_vacuum: Converting database, running a one-time VACUUM")
+    if connection.in_transaction:
+        connection.commit()
+    connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    connection.execute('VACUUM')
+    return True
+
+def incremental_vacuum(connection, max_pages=MAX_VACUUM_PAGES, pages_per_step=VACUUM_PAGES_PER_STEP):
+    """
+    Return up to max_pages free pages to the filesystem, pages_per_step at
+    a time with a commit after each step.
+
+    Returns:
+        int: The number of pages released.
+    """
+    released = 0
+    while released < max_pages:
+        free_pages = connection.execute('PRAGMA freelist_count').fetchone()[0]
+        if not free_pages:
+            break
+        step = min(pages_per_step, max_pages - released, free_pages)
+        # The pragma frees one page per step of the statement, so fetch all of it
+        connection.execute(f'PRAGMA incremental_vacuum({int(step)})').fetchall()
+        connection.commit()
+        released += free_pages - connection.execute('PRAGMA freelist_count').fetchone()[0]
+    return released
+
+def optimize(connection):
+    """Refresh the query planner statistics: a full ANALYZE the first time, PRAGMA optimize after that"""
+    has_stats = connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+    ).fetchone()
+    if has_stats:
+        connection.execute('PRAGMA optimize')
+    else:
+        connection.execute('ANALYZE')
+    connection.commit()
+
+def run_maintenance(connection, batch_size=ORPHAN_BATCH_SIZE, max_vacuum_pages=MAX_VACUUM_PAGES):
+    """
+    Prune orphans, refresh statistics and give free pages back to the
+    filesystem.
+
+    Returns:
+        dict: Sizes before and after, bytes reclaimed and rows pruned.
+    """
+    size_before, free_before = database_size(connection)
+    try:
+        orphans = prune_orphans(connection, batch_size)
+        optimize(connection)
+        converted = enable_incremental_vacuum(connection)
+        released = incremental_vacuum(connection, max_vacuum_pages)
+        # Shrink the WAL file too, now that the freed pages are out of it
+        connection.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+    except Exception as e:
+        logger.error(f"run_maintenance: Failed: {e}")
+        raise
+    size_after, free_after = database_size(connection)
+    report = {
+        'size_before': size_before,
+        'size_after': size_after,
+        'reclaimed_bytes': size_before - size_after,
+        'orphans_removed': orphans,
+        'pages_released': released,
+        'free_pages': free_after,
+        'converted': converted
+    }
+    logger.info(
+        f"run_maintenance: {size_before} -> {size_after} bytes ({report['reclaimed_bytes']} reclaimed), "
+        f"{orphans} orphaned rows removed, {free_before} -> {free_after} free pages"
+    )
+    return report
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Prune, analyze and vacuum the events database")
+    parser.add_argument("--db-path", type=str, default=DATABASE_FILE, help="Path to the database file")
+    parser.add_argument("--batch-size", type=int, default=ORPHAN_BATCH_SIZE, help="Orphaned rows deleted per transaction")
+    parser.add_argument("--max-vacuum-pages", type=int, default=MAX_VACUUM_PAGES, help="Most free pages to release in this run")
+
+    args = parser.parse_args()
+    logger.info("Maintenance script started")
+    connection = connect_to_db(args.db_path)
+    try:
+        migrate_database(connection)
+        report = run_maintenance(connection, args.batch_size, args.max_vacuum_pages)
+        print(
+            f"Size: {report['size_before']} -> {report['size_after']} bytes "
+            f"({report['reclaimed_bytes']} reclaimed); orphaned rows removed: {report['orphans_removed']}; "
+            f"free pages left: {report['free_pages']}"
+        )
+    finally:
+        connection.close()
+    logger.info("Maintenance script completed")
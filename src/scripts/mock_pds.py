@@ -0,0 +1,392 @@
+import json
+import time
+import base64
+import random
+import hashlib
+import logging
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from src.bluesky.outbox import APPLY_WRITES_LIMIT, next_tid, record_cid
+from src.bluesky.rate_limiter import CREATE_COST, UPDATE_COST, DELETE_COST
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('bluesky-event-sync.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+ACCESS_TTL = 7200
+REFRESH_TTL = 90 * 86400
+MAX_APPLY_WRITES = APPLY_WRITES_LIMIT
+MAX_LIST_LIMIT = 100
+
+WRITE_COSTS = {'create': CREATE_COST, 'update': UPDATE_COST, 'delete': DELETE_COST}
+
+class XrpcError(Exception):
+    def __init__(self, status, error, message='', headers=None):
+        super().__init__(message)
+        self.status = status
+        self.error = error
+        self.message = message
+        self.headers = headers or {}
+
+def _b64(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).rstrip(b'=').decode('ascii')
+
+def _cid(*parts):
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).digest()
+    return 'bafyrei' + base64.b32encode(digest).decode('ascii').lower().rstrip('=')[:52]
+
+class FixedWindow:
+    """Counts points spent per key in fixed windows, like the PDS's rate limits"""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.windows = {}
+
+    def spend(self, key, points, now):
+        start, used = self.windows.get(key, (now, 0))
+        if now >= start + self.window:
+            start, used = now, 0
+        headers = {
+            'ratelimit-limit': str(self.limit),
+            'ratelimit-policy': f'{self.limit};w={self.window}',
+            'ratelimit-reset': str(int(start + self.window))
+        }
+        if used + points > self.limit:
+            headers['ratelimit-remaining'] = str(self.limit - used)
+            raise XrpcError(429, 'RateLimitExceeded', 'Rate Limit Exceeded', headers)
+        self.windows[key] = (start, used + points)
+        headers['ratelimit-remaining'] = str(self.limit - used - points)
+        return headers
+
+class MockPDS:
+    """
+    A local stand-in for a Bluesky PDS with the XRPC methods this project
+    uses: createSession, refreshSession, getProfile, createRecord,
+    deleteRecord, listRecords, applyWrites, uploadBlob and getPosts. Any
+    identifier logs in with any password, unless passwords are given.
+    getPosts reports the counts set in engagement, by post URI.
+
+    Every request waits latency seconds plus up to jitter. Writes draw from
+    a per-account point budget of write_limit (points, window seconds) and
+    logins from session_limit, with the ratelimit-* headers the real
+    server sends. A write fails with 500 before it is applied with
+    probability failure_rate, and is applied but answered with 502 with
+    probability drop_rate, as if the response was lost.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, drop_rate=0.0, write_limit=(5000, 3600),
+                 session_limit=(30, 300), access_ttl=ACCESS_TTL, passwords=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.access_ttl = access_ttl
+        self.passwords = passwords
+        self.random = random.Random(seed)
+        self.write_limits = FixedWindow(*write_limit)
+        self.session_limits = FixedWindow(*session_limit)
+        self.lock = threading.Lock()
+        self.tokens = {}
+        self.repos = {}
+        self.blobs = {}
+        self.engagement = {}
+        self.stats = Counter()
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        """Base URL to pass to atproto clients"""
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/xrpc'
+
+    def start(self, host='127.0.0.1', port=0):
+        pds = self
+
+        class Handler(_XrpcHandler):
+            server_pds = pds
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+        logger.info(f"MockPDS: Listening on {self.url}")
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def records(self, did, collection='app.bsky.feed.post'):
+        """rkey -> record of a repo's collection"""
+        with self.lock:
+            return {rkey: value for rkey, (_, value) in self.repos.get(did, {}).get(collection, {}).items()}
+
+    def add_records(self, did, values, collection='app.bsky.feed.post'):
+        """Store records in a repo directly, e.g. posts to delete, and return their URIs"""
+        writes = [{'action': 'create', 'collection': collection, 'value': value} for value in values]
+        with self.lock:
+            return [result['uri'] for result in self._apply(did, writes)]
+
+    def did_for(self, identifier):
+        return 'did:plc:' + hashlib.sha256(identifier.encode('utf-8')).hexdigest()[:24]
+
+    # Sessions
+
+    def _session(self, did, handle, now):
+        access = _b64({'typ': 'JWT', 'alg': 'HS256'}) + '.' + _b64(
+            {'scope': 'com.atproto.access', 'sub': did, 'iat': int(now), 'exp': int(now + self.access_ttl),
+             'jti': next_tid()}
+        ) + '.c2ln'
+        refresh = _b64({'typ': 'JWT', 'alg': 'HS256'}) + '.' + _b64(
+            {'scope': 'com.atproto.refresh', 'sub': did, 'iat': int(now), 'exp': int(now + REFRESH_TTL),
+             'jti': next_tid()}
+        ) + '.c2ln'
+        self.tokens[access] = ('access', did, handle, now + self.access_ttl)
+        self.tokens[refresh] = ('refresh', did, handle, now + REFRESH_TTL)
+        return {'accessJwt': access, 'refreshJwt': refresh, 'handle': handle, 'did': did, 'active': True}
+
+    def _authorize(self, token, kind, now):
+        session = self.tokens.get(token)
+        if session is None or session[0] != kind:
+            raise XrpcError(401, 'InvalidToken', 'Token could not be verified')
+        if session[3] < now:
+            raise XrpcError(400, 'ExpiredToken', 'Token has expired')
+        return session[1], session[2]
+
+    def create_session(self, body, token, now):
+        identifier = body.get('identifier', '')
+        headers = self.session_limits.spend(identifier, 1, now)
+        if self.passwords is not None and self.passwords.get(identifier) != body.get('password'):
+            raise XrpcError(401, 'AuthenticationRequired', 'Invalid identifier or password', headers)
+        return self._session(self.did_for(identifier), identifier, now), headers
+
+    def refresh_session(self, body, token, now):
+        did, handle = self._authorize(token, 'refresh', now)
+        headers = self.session_limits.spend(handle, 1, now)
+        del self.tokens[token]
+        return self._session(did, handle, now), headers
+
+    def get_profile(self, params, token, now):
+        did, handle = self._authorize(token, 'access', now)
+        return {'did': did, 'handle': handle}, {}
+
+    # Records
+
+    def _apply(self, did, writes):
+        # Validate every write before applying any, so a batch is all or nothing
+        collections = self.repos.setdefault(did, {})
+        pending = {}
+        for write in writes:
+            records = collections.get(write['collection'], {})
+            rkey = write.get('rkey')
+            exists = pending.get((write['collection'], rkey), rkey in records)
+            if write['action'] == 'create':
+                if rkey is None:
+                    write['rkey'] = rkey = next_tid()
+                elif exists:
+                    raise XrpcError(400, 'InvalidRequest', f'Record already exists: {rkey}')
+                pending[(write['collection'], rkey)] = True
+            elif write['action'] == 'update':
+                pending[(write['collection'], rkey)] = True
+            else:
+                pending[(write['collection'], rkey)] = False
+        results = []
+        for write in writes:
+            records = collections.setdefault(write['collection'], {})
+            uri = f"at://{did}/{write['collection']}/{write['rkey']}"
+            if write['action'] == 'delete':
+                records.pop(write['rkey'], None)
+                results.append({'$type': 'com.atproto.repo.applyWrites#deleteResult'})
+            else:
+                cid = record_cid(write['value'])
+                records[write['rkey']] = (cid, write['value'])
+                results.append({'$type': f"com.atproto.repo.applyWrites#{write['action']}Result", 'uri': uri, 'cid': cid})
+        return results
+
+    def _write(self, token, repo, writes, now):
+        did, handle = self._authorize(token, 'access', now)
+        if repo not in (did, handle):
+            raise XrpcError(400, 'InvalidRequest', 'Can only write to your own repo')
+        headers = self.write_limits.spend(did, sum(WRITE_COSTS[write['action']] for write in writes), now)
+        if self.random.random() < self.failure_rate:
+            raise XrpcError(500, 'InternalServerError', 'Injected failure', headers)
+        results = self._apply(did, writes)
+        if self.random.random() < self.drop_rate:
+            raise XrpcError(502, 'UpstreamFailure', 'Injected lost response', headers)
+        return results, headers
+
+    def create_record(self, body, token, now):
+        write = {'action': 'create', 'collection': body['collection'], 'rkey': body.get('rkey'), 'value': body['record']}
+        results, headers = self._write(token, body['repo'], [write], now)
+        return {'uri': results[0]['uri'], 'cid': results[0]['cid']}, headers
+
+    def delete_record(self, body, token, now):
+        write = {'action': 'delete', 'collection': body['collection'], 'rkey': body['rkey']}
+        _, headers = self._write(token, body['repo'], [write], now)
+        return {}, headers
+
+    def apply_writes(self, body, token, now):
+        writes = body.get('writes', [])
+        if len(writes) > MAX_APPLY_WRITES:
+            raise XrpcError(400, 'InvalidRequest', f'Too many writes. Max: {MAX_APPLY_WRITES}')
+        writes = [
+            {'action': write['$type'].rsplit('#', 1)[-1], 'collection': write['collection'],
+             'rkey': write.get('rkey'), 'value': write.get('value')}
+            for write in writes
+        ]
+        results, headers = self._write(token, body['repo'], writes, now)
+        return {'results': results}, headers
+
+    def list_records(self, params, token, now):
+        did = params['repo'][0]
+        if not did.startswith('did:'):
+            did = self.did_for(did)
+        records = self.repos.get(did, {}).get(params['collection'][0], {})
+        limit = min(int(params.get('limit', ['50'])[0]), MAX_LIST_LIMIT)
+        reverse = params.get('reverse', ['false'])[0] == 'true'
+        cursor = params.get('cursor', [None])[0]
+        rkeys = sorted(records, reverse=not reverse)
+        if cursor:
+            rkeys = [rkey for rkey in rkeys if (rkey > cursor if reverse else rkey < cursor)]
+        page = rkeys[:limit]
+        response = {'records': [
+            {'uri': f"at://{did}/{params['collection'][0]}/{rkey}", 'cid': records[rkey][0], 'value': records[rkey][1]}
+            for rkey in page
+        ]}
+        if len(rkeys) > limit:
+            response['cursor'] = page[-1]
+        return response, {}
+
+    def upload_blob(self, data, content_type, token, now):
+        did, _ = self._authorize(token, 'access', now)
+        cid = _cid(base64.b64encode(data).decode('ascii'))
+        self.blobs[cid] = data
+        return {'blob': {'$type': 'blob', 'ref': {'$link': cid}, 'mimeType': content_type, 'size': len(data)}}, {}
+
+    def get_posts(self, params, token, now):
+        did, handle = self._authorize(token, 'access', now)
+        posts = []
+        for uri in params['uris']:
+            repo, collection, rkey = uri[len('at://'):].split('/')
+            record = self.repos.get(repo, {}).get(collection, {}).get(rkey)
+            if record is None:
+                continue
+            likes, reposts, replies, quotes = self.engagement.get(uri, (0, 0, 0, 0))
+            posts.append({
+                'uri': uri, 'cid': record[0], 'record': record[1], 'indexedAt': record[1].get('createdAt', ''),
+                'author': {'did': repo, 'handle': handle if repo == did else 'handle.invalid'},
+                'likeCount': likes, 'repostCount': reposts, 'replyCount': replies, 'quoteCount': quotes
+            })
+        return {'posts': posts}, {}
+
+    def handle(self, method, nsid, params, body, content_type, token):
+        """Run one XRPC call and return (status, response body, headers)"""
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self.random.uniform(0, self.jitter))
+        now = time.time()
+        handlers = {
+            'com.atproto.server.createSession': self.create_session,
+            'com.atproto.server.refreshSession': self.refresh_session,
+            'com.atproto.repo.createRecord': self.create_record,
+            'com.atproto.repo.deleteRecord': self.delete_record,
+            'com.atproto.repo.applyWrites': self.apply_writes
+        }
+        queries = {
+            'com.atproto.repo.listRecords': self.list_records,
+            'app.bsky.actor.getProfile': self.get_profile,
+            'app.bsky.feed.getPosts': self.get_posts
+        }
+        try:
+            with self.lock:
+                if method == 'POST' and nsid in handlers:
+                    result, headers = handlers[nsid](json.loads(body or b'{}'), token, now)
+                elif method == 'POST' and nsid == 'com.atproto.repo.uploadBlob':
+                    result, headers = self.upload_blob(body, content_type, token, now)
+                elif method == 'GET' and nsid in queries:
+                    result, headers = queries[nsid](params, token, now)
+                else:
+                    raise XrpcError(501, 'MethodNotImplemented', f'{nsid} is not implemented')
+            self.stats[(nsid, 200)] += 1
+            return 200, result, headers
+        except XrpcError as e:
+            self.stats[(nsid, e.status)] += 1
+            return e.status, {'error': e.error, 'message': e.message}, e.headers
+        except (KeyError, ValueError) as e:
+            self.stats[(nsid, 400)] += 1
+            return 400, {'error': 'InvalidRequest', 'message': str(e)}, {}
+
+class _XrpcHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without this, delayed ACKs add ~40 ms per keep-alive request
+    disable_nagle_algorithm = True
+    server_pds = None
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        nsid = url.path.rsplit('/', 1)[-1]
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        token = (self.headers.get('Authorization') or '').replace('Bearer ', '', 1)
+        status, result, headers = self.server_pds.handle(
+            method, nsid, parse_qs(url.query), body, self.headers.get('Content-Type'), token
+        )
+        payload = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def log_message(self, format, *args):
+        pass
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a local mock Bluesky PDS")
+    parser.add_argument("--port", type=int, default=2583, help="Port to listen on")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay of every request")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Random extra delay of up to this much")
+    parser.add_argument("--failure-rate", type=float, default=0, help="Share of writes that fail with 500")
+    parser.add_argument("--drop-rate", type=float, default=0, help="Share of writes applied but answered with 502")
+    parser.add_argument("--write-limit", type=int, default=5000, help="Write points per account per hour")
+
+    args = parser.parse_args()
+
+    pds = MockPDS(
+        latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000, failure_rate=args.failure_rate,
+        drop_rate=args.drop_rate, write_limit=(args.write_limit, 3600)
+    ).start(port=args.port)
+    print(f"Mock PDS at {pds.url}; set BLUESKY_PDS_URL to use it. Ctrl+C to stop.")
+    try:
+        pds.thread.join()
+    except KeyboardInterrupt:
+        pds.stop()
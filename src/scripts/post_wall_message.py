@@ -1,8 +1,7 @@
-import os
 import logging
-import sqlite3
-from datetime import datetime, timedelta
-from src.database.db_manager import connect_to_db, create_event_table, create_publication_schedule_table, add_event, schedule_event_posts
+from datetime import datetime, timedelta, timezone
+from src.database.db_manager import connect_to_db, add_event, schedule_event_posts
+from src.database.migrations import migrate_database
 
 # Configure logging
 logging.basicConfig(
@@ -17,10 +16,9 @@ logger = logging.getLogger(__name__)
 
 def post_wall_message(message, account_username, config_name, db_path):
     connection = connect_to_db(db_path)
-    create_event_table(connection)
-    create_publication_schedule_table(connection)
+    migrate_database(connection)
 
-    now = datetime.now()
+    now = datetime.now(timezone.utc)
     event_id = add_event(
         connection,
         title="Wall Message",
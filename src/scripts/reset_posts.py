@@ -10,6 +10,8 @@ project_root = Path(__file__).parent.parent.parent
 sys.path.append(str(project_root))
 
 from src.database.db_manager import connect_to_db, get_postable_events
+from src.database.migrations import migrate_database
+from src.database.timestamps import DEFAULT_SOURCE_TZ, to_epoch, from_epoch, now_epoch
 from src.config.config_loader import load_config
 
 def parse_args():
@@ -36,12 +38,17 @@ def reset_post_status(db_path):
     """Reset the post status for events that didn't post correctly"""
     try:
         connection = connect_to_db(db_path)
+        migrate_database(connection)
         cursor = connection.cursor()
+
+        # Integer range over the local calendar day, which can use the index
+        day_start = to_epoch(datetime(2025, 2, 15), DEFAULT_SOURCE_TZ)
+        day_end = to_epoch(datetime(2025, 2, 16), DEFAULT_SOURCE_TZ)
         
         reset_query = """
             UPDATE events 
-            SET last_posted = NULL
-            WHERE DATE(start_date) = '2025-02-15' 
+            SET last_posted_ts = NULL
+            WHERE start_ts >= ? AND start_ts < ?
             AND title IN (
                 'Grand Opening Celebration of X-Golf Oshkosh',
                 'Oshkosh Farmers Market',
@@ -57,8 +64,19 @@ def reset_post_status(db_path):
             )
         """
         
-        cursor.execute(reset_query)
+        cursor.execute(reset_query, (day_start, day_end))
         rows_affected = cursor.rowcount
+
+        # Due posts come from publication_schedule, so reopen the entries of
+        # the reset events that are already due
+        cursor.execute("""
+            UPDATE publication_schedule
+            SET is_posted = 0, claimed_ts = NULL
+            WHERE scheduled_ts <= ?
+            AND event_id IN (
+                SELECT id FROM events WHERE start_ts >= ? AND start_ts < ? AND last_posted_ts IS NULL
+            )
+        """, (now_epoch(), day_start, day_end))
         connection.commit()
         logger.info(f"Reset post status for {rows_affected} events")
         
@@ -67,18 +85,18 @@ def reset_post_status(db_path):
         logger.info("====================")
         
         cursor.execute("""
-            SELECT title, start_date, last_posted
+            SELECT title, start_ts, source_tz, last_posted_ts
             FROM events
-            WHERE DATE(start_date) = '2025-02-15'
-            AND last_posted IS NULL
-        """)
+            WHERE start_ts >= ? AND start_ts < ?
+            AND last_posted_ts IS NULL
+        """, (day_start, day_end))
         reset_events = cursor.fetchall()
         
         logger.info(f"Found {len(reset_events)} reset events:")
         for event in reset_events:
             logger.info(f"\nTitle: {event['title']}")
-            logger.info(f"Start Date: {event['start_date']}")
-            logger.info(f"Last Posted: {event['last_posted']}")
+            logger.info(f"Start Date: {from_epoch(event['start_ts'], event['source_tz'])}")
+            logger.info(f"Last Posted: {from_epoch(event['last_posted_ts'])}")
         
         # Preview next posts
         config = load_config(os.path.join(project_root, 'config', 'config.json'))
@@ -91,9 +109,9 @@ def reset_post_status(db_path):
             logger.info(f"Found {len(postable_events)} events to post:")
             
             for event in postable_events:
-                logger.info(f"\nTitle: {event['title']}")
-                logger.info(f"Start: {event['start_date']}")
-                logger.info(f"URL: {event['url']}")
+                logger.info(f"\nTitle: {event.title}")
+                logger.info(f"Start: {from_epoch(event.start_ts, event.source_tz)}")
+                logger.info(f"URL: {event.url}")
         
         return rows_affected
         
@@ -1,7 +1,14 @@
+import json
+import time
+import asyncio
+import base64
 import pytest
 from unittest.mock import patch, mock_open, MagicMock
-from src.bluesky.auth import authenticate, get_session, save_session, on_session_change
-from atproto_client import Client, Session, SessionEvent
+from src.bluesky.auth import (
+    authenticate, get_session, save_session, on_session_change, session_status, SessionPool,
+    SESSION_FRESH, SESSION_STALE, SESSION_EXPIRED
+)
+from atproto_client import Session, SessionEvent
 
 @pytest.fixture
 def mock_client():
@@ -98,4 +105,86 @@ def test_on_session_change_other_event(mock_session):
         # Use a proper event that doesn't trigger session saving
         on_session_change('expired', mock_session_instance)
     
-    mock_save_session.assert_not_called()
\ No newline at end of file
+    mock_save_session.assert_not_called()
+
+def make_jwt(exp):
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+    return f"{encode({'alg': 'HS256', 'typ': 'JWT'})}.{encode({'sub': 'did:plc:test', 'exp': exp})}.c2ln"
+
+def make_session_string(access_exp, refresh_exp):
+    return Session("testuser", "did:plc:test", make_jwt(access_exp), make_jwt(refresh_exp)).export()
+
+def test_session_status():
+    now = 1_700_000_000
+    assert session_status(make_session_string(now + 3600, now + 86400), now) == SESSION_FRESH
+    assert session_status(make_session_string(now + 60, now + 86400), now) == SESSION_STALE
+    assert session_status(make_session_string(now - 60, now - 1), now) == SESSION_EXPIRED
+    assert session_status("not a session") is None
+
+def test_authenticate_imports_fresh_session_without_requests(mock_client):
+    mock_client_instance = mock_client.return_value
+    session_string = make_session_string(int(time.time()) + 3600, int(time.time()) + 86400)
+
+    with patch('builtins.open', mock_open(read_data=session_string)) as mock_file:
+        authenticate("testuser", "testpassword")
+
+    mock_file.assert_called_once_with('session_testuser.txt', encoding='UTF-8')
+    mock_client_instance.login.assert_called_once_with(session_string=session_string, fetch_bsky_profile=False)
+
+def test_authenticate_logs_in_when_refresh_token_expired(mock_client):
+    mock_client_instance = mock_client.return_value
+    session_string = make_session_string(int(time.time()) - 7200, int(time.time()) - 60)
+
+    with patch('builtins.open', mock_open(read_data=session_string)):
+        authenticate("testuser", "testpassword")
+
+    mock_client_instance.login.assert_called_once_with("testuser", "testpassword")
+
+def test_session_pool_keeps_one_client_per_account():
+    clients = {}
+
+    def fake_authenticate(username, password):
+        client = MagicMock()
+        client.export_session_string.return_value = Session(
+            username, f"did:plc:{username}", make_jwt(0), make_jwt(0)
+        ).export()
+        clients.setdefault(username, []).append(client)
+        return client
+
+    pool = SessionPool()
+    with patch('src.bluesky.auth.authenticate', side_effect=fake_authenticate):
+        alice = pool.client("alice", "secret")
+        bob = pool.client("bob", "secret")
+        assert pool.client("alice", "secret") is alice
+
+    assert alice is not bob
+    assert {username: len(made) for username, made in clients.items()} == {"alice": 1, "bob": 1}
+    assert pool.get("did:plc:bob") is bob
+    assert pool.get("alice") is alice
+
+def test_session_pool_gives_each_event_loop_its_own_async_client():
+    made = []
+
+    async def fake_authenticate_async(username, password):
+        client = MagicMock()
+        client.export_session_string.return_value = Session(
+            username, f"did:plc:{username}", make_jwt(0), make_jwt(0)
+        ).export()
+        made.append(client)
+        return client
+
+    async def twice(pool):
+        first = await pool.async_client("alice", "secret")
+        assert await pool.async_client("alice", "secret") is first
+        assert pool.get("did:plc:alice", is_async=True) is first
+        return first
+
+    pool = SessionPool()
+    with patch('src.bluesky.auth.authenticate_async', side_effect=fake_authenticate_async):
+        first = asyncio.run(twice(pool))
+        # The first loop is closed; its client is not handed out again
+        assert pool.get("alice", is_async=True) is None
+        second = asyncio.run(twice(pool))
+
+    assert first is not second and made == [first, second]
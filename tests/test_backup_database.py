@@ -0,0 +1,216 @@
+import os
+import json
+import zlib
+import sqlite3
+import threading
+import pytest
+from datetime import datetime, timedelta
+from src.database.db_manager import connect_to_db, create_event_table, add_event
+from src.scripts import backup_database
+from src.scripts.backup_database import (
+    create_backup, cleanup_old_backups, start_backup_thread, store_backup, list_snapshots,
+    find_snapshot, restore_snapshot, prune_snapshots, MANIFEST_SUFFIX, MAX_BACKUPS
+)
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "events.db")
+    connection = connect_to_db(path)
+    create_event_table(connection)
+    start = datetime.now() + timedelta(days=3)
+    for i in range(200):
+        add_event(
+            connection, f"Event {i}", start, start, f"http://example.com/event/{i}",
+            "Description " * 20, "Location", "Address", "City", "Region",
+            "", "testuser.bsky.social", "TestConfig"
+        )
+    connection.close()
+    return path
+
+def count_events(path):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+    finally:
+        connection.close()
+
+def test_create_backup_writes_verified_copy_and_manifest(db_path, tmp_path):
+    backup_dir = str(tmp_path / "backups")
+    backup_file = create_backup(db_path, backup_dir, pages=4, step_sleep=0)
+
+    assert os.path.exists(backup_file)
+    assert count_events(backup_file) == 200
+    with open(backup_file + MANIFEST_SUFFIX) as f:
+        manifest = json.load(f)
+    assert manifest['integrity_check'] == 'ok'
+    assert manifest['backup_file'] == os.path.basename(backup_file)
+    assert manifest['size_bytes'] == os.path.getsize(backup_file)
+    assert manifest['steps'] > 1
+    assert not [f for f in os.listdir(backup_dir) if f.endswith('.partial')]
+
+def test_backup_is_consistent_with_concurrent_writer(db_path, tmp_path):
+    stop = threading.Event()
+    inserted = []
+
+    def writer():
+        connection = connect_to_db(db_path)
+        start = datetime.now() + timedelta(days=4)
+        i = 0
+        while not stop.is_set():
+            add_event(
+                connection, f"Concurrent {i}", start, start, f"http://example.com/concurrent/{i}",
+                "", "", "", "", "", "", "testuser.bsky.social", "TestConfig"
+            )
+            inserted.append(i)
+            i += 1
+        connection.close()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        backup_file = create_backup(db_path, str(tmp_path / "backups"), pages=1, step_sleep=0.001)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert inserted
+    connection = sqlite3.connect(backup_file)
+    assert connection.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+    assert connection.execute("SELECT COUNT(*) FROM events").fetchone()[0] >= 200
+    connection.close()
+    assert count_events(db_path) == 200 + len(inserted)
+
+def test_failed_backup_leaves_no_partial_file(db_path, tmp_path, monkeypatch):
+    backup_dir = str(tmp_path / "backups")
+
+    def broken_copy(source, destination_path, pages, step_sleep):
+        open(destination_path, 'w').close()
+        return {'page_count': 0, 'page_size': 0, 'schema_version': 0, 'steps': 0,
+                'integrity_check': 'corrupt'}
+
+    monkeypatch.setattr(backup_database, 'copy_database', broken_copy)
+    with pytest.raises(sqlite3.DatabaseError):
+        create_backup(db_path, backup_dir)
+    assert os.listdir(backup_dir) == []
+
+def test_start_backup_thread_runs_in_background(db_path, tmp_path):
+    store_dir = str(tmp_path / "store")
+    thread = start_backup_thread(db_path, store_dir)
+    thread.join()
+    assert len(list_snapshots(store_dir)) == 1
+
+def test_cleanup_old_backups_removes_manifests(db_path, tmp_path):
+    backup_dir = str(tmp_path / "backups")
+    backups = []
+    for i in range(MAX_BACKUPS + 2):
+        backup_file = create_backup(db_path, backup_dir, step_sleep=0)
+        os.utime(backup_file, (i, i))
+        backups.append(backup_file)
+
+    cleanup_old_backups(backup_dir)
+
+    remaining = sorted(os.listdir(backup_dir))
+    assert len([f for f in remaining if f.endswith('.db')]) == MAX_BACKUPS
+    assert len([f for f in remaining if f.endswith(MANIFEST_SUFFIX)]) == MAX_BACKUPS
+    assert not os.path.exists(backups[0] + MANIFEST_SUFFIX)
+
+def add_more_events(path, count=5):
+    connection = connect_to_db(path)
+    start = datetime.now() + timedelta(days=5)
+    for i in range(count):
+        add_event(
+            connection, f"Later {i}", start, start, f"http://example.com/later/{i}",
+            "", "", "", "", "", "", "testuser.bsky.social", "TestConfig"
+        )
+    connection.close()
+
+def test_store_backup_skips_unchanged_database(db_path, tmp_path):
+    store_dir = str(tmp_path / "store")
+    first = store_backup(db_path, store_dir)
+    assert first is not None
+    assert first['new_chunks'] == len(first['chunks'])
+    assert store_backup(db_path, store_dir) is None
+    assert len(list_snapshots(store_dir)) == 1
+
+def test_store_backup_does_not_copy_unchanged_files(db_path, tmp_path, monkeypatch):
+    store_dir = str(tmp_path / "store")
+    store_backup(db_path, store_dir)
+    copies = []
+    real_copy = backup_database.copy_database
+    monkeypatch.setattr(backup_database, "copy_database", lambda *args: copies.append(args) or real_copy(*args))
+
+    assert store_backup(db_path, store_dir) is None
+    assert copies == []
+
+    # A touched but identical file is copied once, then recognized again
+    os.utime(db_path, ns=(0, 0))
+    assert store_backup(db_path, store_dir) is None
+    assert store_backup(db_path, store_dir) is None
+    assert len(copies) == 1
+
+    add_more_events(db_path)
+    assert store_backup(db_path, store_dir) is not None
+    assert len(copies) == 2
+
+def test_store_backup_deduplicates_chunks(db_path, tmp_path):
+    store_dir = str(tmp_path / "store")
+    first = store_backup(db_path, store_dir, chunk_pages=1)
+    add_more_events(db_path)
+    second = store_backup(db_path, store_dir, chunk_pages=1)
+
+    assert second is not None
+    assert 0 < second['new_chunks'] < len(second['chunks'])
+    assert second['stored_bytes'] < second['size_bytes']
+    assert len(set(first['chunks']) & set(second['chunks'])) > 0
+
+def test_restore_at_returns_earlier_snapshot(db_path, tmp_path):
+    store_dir = str(tmp_path / "store")
+    first = store_backup(db_path, store_dir)
+    add_more_events(db_path)
+    second = store_backup(db_path, store_dir)
+    # Snapshots taken within the same second; make the first one older
+    snapshot_file = os.path.join(store_dir, 'snapshots', f"{first['id']}.json")
+    first['created_ts'] -= 3600
+    with open(snapshot_file, 'w') as f:
+        json.dump(first, f)
+
+    output = str(tmp_path / "restored.db")
+    restored = restore_snapshot(datetime.now() - timedelta(minutes=30), output, store_dir)
+    assert restored['id'] == first['id']
+    assert count_events(output) == 200
+
+    restored = restore_snapshot(None, output, store_dir)
+    assert restored['id'] == second['id']
+    assert count_events(output) == 205
+
+    with pytest.raises(ValueError):
+        find_snapshot(datetime.now() - timedelta(days=1), store_dir)
+
+def test_restore_detects_corrupt_chunk(db_path, tmp_path):
+    store_dir = str(tmp_path / "store")
+    manifest = store_backup(db_path, store_dir)
+    digest = manifest['chunks'][0]
+    with open(os.path.join(store_dir, 'chunks', digest[:2], f'{digest}.z'), 'wb') as f:
+        f.write(zlib.compress(b'garbage'))
+
+    output = str(tmp_path / "restored.db")
+    with pytest.raises(sqlite3.DatabaseError):
+        restore_snapshot(None, output, store_dir)
+    assert not [f for f in os.listdir(str(tmp_path)) if f.endswith('.partial')]
+
+def test_prune_snapshots_keeps_latest_and_collects_chunks(db_path, tmp_path):
+    store_dir = str(tmp_path / "store")
+    first = store_backup(db_path, store_dir, chunk_pages=1)
+    add_more_events(db_path)
+    second = store_backup(db_path, store_dir, chunk_pages=1)
+
+    removed_snapshots, removed_chunks = prune_snapshots(
+        store_dir, retention=timedelta(0), now=datetime.now() + timedelta(days=1)
+    )
+
+    assert removed_snapshots == 1
+    assert removed_chunks == len(set(first['chunks']) - set(second['chunks']))
+    assert [m['id'] for m in list_snapshots(store_dir)] == [second['id']]
+    output = str(tmp_path / "restored.db")
+    restore_snapshot(None, output, store_dir)
+    assert count_events(output) == 205
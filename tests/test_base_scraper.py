@@ -34,4 +34,12 @@ def test_log_method(capsys):
     scraper = DummyScraper({})
     scraper.log("Test message")
     captured = capsys.readouterr().out.strip()
-    assert captured == "[LOG] Test message"
\ No newline at end of file
+    assert captured == "[LOG] Test message"
+
+def test_image_url_reads_json_ld_image_forms():
+    scraper = DummyScraper({})
+    assert scraper.image_url({"image": "https://example.com/a.jpg"}) == "https://example.com/a.jpg"
+    assert scraper.image_url({"image": [{"@type": "ImageObject", "url": "https://example.com/b.jpg"}]}) == "https://example.com/b.jpg"
+    assert scraper.image_url({"image": []}) is None
+    assert scraper.image_url({"image": "/relative.jpg"}) is None
+    assert scraper.image_url({}) is None
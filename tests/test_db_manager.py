@@ -1,7 +1,15 @@
 import pytest
 import sqlite3
 from datetime import datetime, timedelta
-from src.database.db_manager import connect_to_db, create_event_table, create_publication_schedule_table, add_event, get_postable_events
+from src.database.db_manager import (
+    connect_to_db, create_event_table, create_publication_schedule_table, add_event, get_postable_events,
+    archive_past_events, get_archived_events, schedule_event_posts, claim_scheduled_post, release_scheduled_post,
+    mark_post_as_executed, get_events, get_event_by_id, unschedule_intervals, CLAIM_TIMEOUT
+)
+from src.database.records import Event
+from src.database.timestamps import to_epoch
+
+INTERVALS = [timedelta(days=30), timedelta(days=14), timedelta(days=5), timedelta(days=1)]
 
 @pytest.fixture(scope="module")
 def connection():
@@ -46,11 +54,14 @@ def test_get_postable_events_with_events(connection):
         "http://example.com/event3", "Description 3", "Location 3", "Address 3", "City 3", "Region 3",
         "hashtag3", "testuser.bsky.social", "TestConfig"
     )
+    schedule_event_posts(connection, event1_id, now + timedelta(days=40), INTERVALS)
+    schedule_event_posts(connection, event2_id, now + timedelta(days=10), INTERVALS)
+    schedule_event_posts(connection, event3_id, now + timedelta(days=1), INTERVALS)
     
     events = get_postable_events(connection, website_config)
     assert len(events) == 2
-    assert any(event['title'] == "Event 2" for event in events)
-    assert any(event['title'] == "Event 3" for event in events)
+    assert any(event.title == "Event 2" for event in events)
+    assert any(event.title == "Event 3" for event in events)
 
 def test_get_postable_events_past_event(connection):
     website_config = {
@@ -66,9 +77,10 @@ def test_get_postable_events_past_event(connection):
         "http://example.com/past_event", "Description Past", "Location Past", "Address Past", "City Past", "Region Past",
         "hashtag_past", "testuser.bsky.social", "TestConfig"
     )
+    schedule_event_posts(connection, event_id, now - timedelta(days=10), INTERVALS)
     
     events = get_postable_events(connection, website_config)
-    assert len(events) == 2  # Should still be 2 from the previous test, past event should be removed
+    assert len(events) == 2  # Should still be 2 from the previous test, past event is left out
 
 def test_get_postable_events_no_valid_intervals(connection):
     website_config = {
@@ -94,14 +106,311 @@ def test_get_postable_events_event_already_posted(connection):
         "http://example.com/posted_event", "Description Posted", "Location Posted", "Address Posted", "City Posted", "Region Posted",
         "hashtag_posted", "testuser.bsky.social", "TestConfig"
     )
+    schedule_event_posts(connection, event_id, now + timedelta(days=10), INTERVALS)
     
     cursor = connection.cursor()
     cursor.execute('''
         UPDATE events
-        SET last_posted = ?
+        SET last_posted_ts = ?
         WHERE id = ?
-    ''', ((now - timedelta(days=1)).isoformat(), event_id))
+    ''', (to_epoch(now - timedelta(days=1)), event_id))
     connection.commit()
     
     events = get_postable_events(connection, website_config)
-    assert len(events) == 2  # Should still be 2 from the previous test, posted event should not be included
\ No newline at end of file
+    assert len(events) == 2  # Should still be 2 from the previous test, posted event should not be included
+
+def test_connect_to_db_enables_wal_and_tuned_pragmas(tmp_path):
+    db_path = str(tmp_path / "db" / "events.db")
+    connection = connect_to_db(db_path)
+    assert connection.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert connection.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    assert connection.execute('PRAGMA busy_timeout').fetchone()[0] > 0
+    assert connection.execute('PRAGMA cache_size').fetchone()[0] < 0
+    connection.close()
+
+def test_read_only_connection_rejects_writes(tmp_path):
+    db_path = str(tmp_path / "events.db")
+    writer = connect_to_db(db_path)
+    create_event_table(writer)
+    writer.close()
+
+    reader = connect_to_db(db_path, read_only=True)
+    with pytest.raises(sqlite3.OperationalError):
+        reader.execute("DELETE FROM events")
+    reader.close()
+
+def test_reader_runs_while_writer_holds_transaction(tmp_path):
+    db_path = str(tmp_path / "events.db")
+    writer = connect_to_db(db_path)
+    create_event_table(writer)
+    now = datetime.now()
+    add_event(
+        writer, "Committed Event", now, now, "http://example.com/committed", "", "", "", "", "",
+        "", "testuser.bsky.social", "TestConfig"
+    )
+
+    # Leave a write transaction open, as main.py does while it ingests events
+    writer.execute("BEGIN IMMEDIATE")
+    writer.execute("UPDATE events SET published = 1")
+
+    reader = connect_to_db(db_path, read_only=True)
+    rows = reader.execute("SELECT title, published FROM events").fetchall()
+    assert [(row['title'], row['published']) for row in rows] == [("Committed Event", 0)]
+
+    writer.commit()
+    reader.close()
+    writer.close()
+
+@pytest.fixture
+def fresh_connection():
+    connection = sqlite3.connect(":memory:")
+    connection.row_factory = sqlite3.Row
+    create_event_table(connection)
+    create_publication_schedule_table(connection)
+    yield connection
+    connection.close()
+
+WEBSITE_CONFIG = {
+    "name": "TestSite",
+    "account_username": "testuser.bsky.social",
+    "update_intervals": ["30 days", "2 weeks", "5 days", "1 day"]
+}
+
+def add_scheduled_event(connection, title, start_date):
+    event_id = add_event(
+        connection, title, start_date, start_date, f"http://example.com/{title}", "", "", "", "", "",
+        "", "testuser.bsky.social", "TestConfig"
+    )
+    schedule_event_posts(connection, event_id, start_date, INTERVALS)
+    return event_id
+
+def test_get_postable_events_returns_latest_due_entry_per_event(fresh_connection):
+    now = datetime.now()
+    event_id = add_scheduled_event(fresh_connection, "Ten Days Out", now + timedelta(days=10))
+    add_scheduled_event(fresh_connection, "Far Event", now + timedelta(days=40))
+
+    events = get_postable_events(fresh_connection, WEBSITE_CONFIG)
+
+    assert [event.title for event in events] == ["Ten Days Out"]
+    latest_due = fresh_connection.execute(
+        "SELECT id FROM publication_schedule WHERE event_id = ? AND scheduled_ts <= ? ORDER BY scheduled_ts DESC",
+        (event_id, to_epoch(now))
+    ).fetchone()['id']
+    assert events[0].schedule_id == latest_due
+
+def test_completing_entry_supersedes_earlier_due_entries(fresh_connection):
+    now = datetime.now()
+    event_id = add_scheduled_event(fresh_connection, "Ten Days Out", now + timedelta(days=10))
+    event = get_postable_events(fresh_connection, WEBSITE_CONFIG)[0]
+
+    assert claim_scheduled_post(fresh_connection, event.schedule_id)
+    mark_post_as_executed(fresh_connection, event.schedule_id)
+
+    assert get_postable_events(fresh_connection, WEBSITE_CONFIG) == []
+    pending = fresh_connection.execute(
+        "SELECT COUNT(*) FROM publication_schedule WHERE event_id = ? AND is_posted = 0", (event_id,)
+    ).fetchone()[0]
+    assert pending == 2  # 5 days and 1 day are still ahead
+
+def test_claimed_entry_is_not_returned_or_claimed_twice(fresh_connection):
+    now = datetime.now()
+    add_scheduled_event(fresh_connection, "Tomorrow", now + timedelta(days=1))
+    event = get_postable_events(fresh_connection, WEBSITE_CONFIG)[0]
+
+    assert claim_scheduled_post(fresh_connection, event.schedule_id)
+    assert not claim_scheduled_post(fresh_connection, event.schedule_id)
+    assert get_postable_events(fresh_connection, WEBSITE_CONFIG) == []
+
+    release_scheduled_post(fresh_connection, event.schedule_id)
+    assert [e.schedule_id for e in get_postable_events(fresh_connection, WEBSITE_CONFIG)] == [event.schedule_id]
+
+def test_stale_claim_can_be_taken_over(fresh_connection):
+    now = datetime.now()
+    add_scheduled_event(fresh_connection, "Tomorrow", now + timedelta(days=1))
+    event = get_postable_events(fresh_connection, WEBSITE_CONFIG)[0]
+
+    assert claim_scheduled_post(fresh_connection, event.schedule_id, now - CLAIM_TIMEOUT - timedelta(minutes=1))
+    assert claim_scheduled_post(fresh_connection, event.schedule_id)
+
+def test_archive_past_events_moves_batches_and_is_scoped_to_account():
+    connection = sqlite3.connect(":memory:")
+    connection.row_factory = sqlite3.Row
+    create_event_table(connection)
+    create_publication_schedule_table(connection)
+    now = datetime.now()
+    past_ids = []
+    for i in range(3):
+        past_ids.append(add_event(
+            connection, f"Past {i}", now - timedelta(days=2 + i), now - timedelta(days=2 + i),
+            f"http://example.com/past{i}", "", "", "", "", "", "", "testuser.bsky.social", "TestConfig"
+        ))
+        schedule_event_posts(connection, past_ids[-1], now - timedelta(days=2 + i), [timedelta(days=1)])
+    mark_post_as_executed(connection, connection.execute(
+        "SELECT id FROM publication_schedule WHERE event_id = ?", (past_ids[0],)
+    ).fetchone()[0])
+    other_id = add_event(
+        connection, "Other Account Past", now - timedelta(days=3), now - timedelta(days=3),
+        "http://example.com/other", "", "", "", "", "", "", "other.bsky.social", "TestConfig"
+    )
+
+    statements = []
+    connection.set_trace_callback(statements.append)
+    archived = archive_past_events(connection, "testuser.bsky.social", now, batch_size=2)
+    connection.set_trace_callback(None)
+
+    assert archived == 3
+    assert sum(sql.strip() == "COMMIT" for sql in statements) == 2
+    remaining = [row['id'] for row in connection.execute("SELECT id FROM events")]
+    assert remaining == [other_id]
+    assert connection.execute("SELECT COUNT(*) FROM publication_schedule").fetchone()[0] == 0
+
+    archived_events = list(get_archived_events(connection, "testuser.bsky.social"))
+    assert [event.id for event in archived_events] == past_ids
+    assert archived_events[0].title == "Past 0"
+    history = connection.execute(
+        "SELECT event_id, is_posted FROM publication_schedule_archive ORDER BY event_id"
+    ).fetchall()
+    assert [tuple(row) for row in history] == [(past_ids[0], 1), (past_ids[1], 0), (past_ids[2], 0)]
+    connection.close()
+
+def test_archive_batches_are_not_limited_by_host_parameters():
+    connection = sqlite3.connect(":memory:")
+    connection.row_factory = sqlite3.Row
+    create_event_table(connection)
+    create_publication_schedule_table(connection)
+    # The default limit of SQLite before 3.32
+    connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    now = datetime.now()
+    start = to_epoch(now - timedelta(days=2))
+    connection.executemany('''
+        INSERT INTO events (title, start_ts, end_ts, source_tz, url, published, account_username, config_name)
+        VALUES (?, ?, ?, 'UTC', ?, 0, 'testuser.bsky.social', 'TestConfig')
+    ''', [(f"Past {i}", start, start, f"http://example.com/past{i}") for i in range(600)])
+    connection.commit()
+
+    assert archive_past_events(connection, "testuser.bsky.social", now, batch_size=600) == 600
+    assert connection.execute("SELECT COUNT(*) FROM events").fetchone()[0] == 0
+    assert connection.execute("SELECT COUNT(*) FROM events_archive").fetchone()[0] == 600
+    connection.close()
+
+def test_get_events_streams_in_batches(fresh_connection):
+    start = datetime.now() + timedelta(days=3)
+    ids = [add_scheduled_event(fresh_connection, f"Event {i}", start) for i in range(5)]
+    add_event(
+        fresh_connection, "Other", start, start, "http://example.com/other", "", "", "", "", "",
+        "", "other.bsky.social", "TestConfig"
+    )
+
+    statements = []
+    fresh_connection.set_trace_callback(statements.append)
+    events = get_events(fresh_connection, "testuser.bsky.social", batch_size=2)
+    assert statements == []  # Nothing is read until the generator is consumed
+    events = list(events)
+    fresh_connection.set_trace_callback(None)
+
+    assert all(isinstance(event, Event) for event in events)
+    assert [event.id for event in events] == ids
+    assert len([sql for sql in statements if sql.lstrip().startswith("SELECT")]) == 3
+    assert len(list(get_events(fresh_connection))) == 6
+
+def test_get_event_by_id_returns_record_without_pragma(fresh_connection):
+    start = datetime.now() + timedelta(days=3)
+    event_id = add_scheduled_event(fresh_connection, "Lookup", start)
+
+    statements = []
+    fresh_connection.set_trace_callback(statements.append)
+    event = get_event_by_id(fresh_connection, event_id)
+    fresh_connection.set_trace_callback(None)
+
+    assert event.title == "Lookup"
+    assert event.start_ts == to_epoch(start)
+    assert event.schedule_id is None
+    assert not [sql for sql in statements if "PRAGMA" in sql]
+    assert get_event_by_id(fresh_connection, event_id + 1) is None
+
+def scrape_event(connection, title, start_date, source_id="123456", description=""):
+    event_id = add_event(
+        connection, title, start_date, start_date, f"http://example.com/event/{title}/{source_id}/", description,
+        "", "", "", "", "", "testuser.bsky.social", "TestConfig", source_id=source_id
+    )
+    schedule_event_posts(connection, event_id, start_date, INTERVALS)
+    return event_id
+
+def test_rescheduled_event_is_updated_in_place(fresh_connection):
+    start = datetime.now() + timedelta(days=20)
+    event_id = scrape_event(fresh_connection, "Sawdust Days", start)
+
+    moved = start + timedelta(days=7)
+    assert scrape_event(fresh_connection, "Sawdust Days (new date)", moved) == event_id
+
+    event = get_event_by_id(fresh_connection, event_id)
+    assert event.title == "Sawdust Days (new date)"
+    assert event.start_ts == to_epoch(moved)
+    assert event.source_id == "123456"
+    assert fresh_connection.execute("SELECT COUNT(*) FROM events").fetchone()[0] == 1
+    schedule = fresh_connection.execute(
+        "SELECT scheduled_ts FROM publication_schedule WHERE event_id = ? ORDER BY scheduled_ts", (event_id,)
+    ).fetchall()
+    assert [row[0] for row in schedule] == [to_epoch(moved - interval) for interval in INTERVALS]
+
+def test_unchanged_rescrape_does_not_write(fresh_connection):
+    start = datetime.now() + timedelta(days=20)
+    event_id = scrape_event(fresh_connection, "Farmers Market", start)
+
+    changes = fresh_connection.total_changes
+    assert scrape_event(fresh_connection, "Farmers Market", start) == event_id
+    assert fresh_connection.total_changes == changes
+
+def test_posted_entries_are_not_replanned(fresh_connection):
+    start = datetime.now() + timedelta(days=20)
+    event_id = scrape_event(fresh_connection, "Jazz Night", start)
+    posted_id = fresh_connection.execute(
+        "SELECT id FROM publication_schedule WHERE event_id = ? ORDER BY scheduled_ts LIMIT 1", (event_id,)
+    ).fetchone()[0]
+    mark_post_as_executed(fresh_connection, posted_id)
+
+    scrape_event(fresh_connection, "Jazz Night", start + timedelta(days=1), description="Moved")
+
+    assert fresh_connection.execute(
+        "SELECT scheduled_ts FROM publication_schedule WHERE id = ?", (posted_id,)
+    ).fetchone()[0] == to_epoch(start - INTERVALS[0])
+    assert fresh_connection.execute(
+        "SELECT COUNT(*) FROM publication_schedule WHERE event_id = ?", (event_id,)
+    ).fetchone()[0] == len(INTERVALS)
+
+def test_existing_event_without_source_id_is_adopted(fresh_connection):
+    start = datetime.now() + timedelta(days=20)
+    legacy_id = add_event(
+        fresh_connection, "Fish Fry", start, start, "http://example.com/event/Fish Fry/654321/", "",
+        "", "", "", "", "", "testuser.bsky.social", "TestConfig"
+    )
+
+    assert scrape_event(fresh_connection, "Fish Fry", start, source_id="654321") == legacy_id
+    assert get_event_by_id(fresh_connection, legacy_id).source_id == "654321"
+    assert scrape_event(fresh_connection, "Fish Fry Friday", start, source_id="654321") == legacy_id
+
+def test_unschedule_intervals_deletes_only_pending_unclaimed_entries(fresh_connection):
+    now = datetime.now()
+    posted_id = add_scheduled_event(fresh_connection, "Ten Days Out", now + timedelta(days=10))
+    claimed_id = add_scheduled_event(fresh_connection, "Twenty Days Out", now + timedelta(days=20))
+    other_id = add_event(
+        fresh_connection, "Elsewhere", now + timedelta(days=10), now + timedelta(days=10), "http://example.com/other",
+        "", "", "", "", "", "", "testuser.bsky.social", "OtherConfig"
+    )
+    schedule_event_posts(fresh_connection, other_id, now + timedelta(days=10), INTERVALS)
+    fresh_connection.execute(
+        "UPDATE publication_schedule SET is_posted = 1 WHERE event_id = ? AND interval = ?",
+        (posted_id, str(timedelta(days=30)))
+    )
+    fresh_connection.execute(
+        "UPDATE publication_schedule SET claimed_ts = 1 WHERE event_id = ? AND interval = ?",
+        (claimed_id, str(timedelta(days=30)))
+    )
+
+    assert unschedule_intervals(fresh_connection, "testuser.bsky.social", "TestConfig", ["30 days", "2 weeks"]) == 2
+    remaining = {
+        (row[0], row[1]) for row in fresh_connection.execute("SELECT event_id, interval FROM publication_schedule")
+    }
+    assert (posted_id, str(timedelta(days=30))) in remaining and (claimed_id, str(timedelta(days=30))) in remaining
+    assert not {(posted_id, str(timedelta(days=14))), (claimed_id, str(timedelta(days=14)))} & remaining
+    assert len([row for row in remaining if row[0] == other_id]) == len(INTERVALS)
@@ -0,0 +1,95 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+from atproto_client import AsyncClient
+from src.database.db_manager import add_post_intent, complete_post_intent, get_post_uris, mark_posts_deleted
+from src.scripts.benchmark_posting import make_due_events
+from src.scripts.delete_posts import delete_posts
+from src.scripts.mock_pds import MockPDS
+from tests.test_mock_pds import ACCOUNT, connection, outbox_status
+
+def post(i):
+    return {'$type': 'app.bsky.feed.post', 'text': f'post {i}', 'createdAt': '2024-05-01T12:00:00.000Z'}
+
+def deleting(pds, **options):
+    async def run():
+        client = AsyncClient(pds.url)
+        await client.login(ACCOUNT, 'secret', fetch_bsky_profile=False)
+        hook = options.pop('hook', None)
+        if hook:
+            hook(client)
+        return await delete_posts(client, ACCOUNT, **options)
+    return asyncio.run(run())
+
+def test_posts_are_deleted_in_batches():
+    with MockPDS() as pds:
+        did = pds.did_for(ACCOUNT)
+        pds.add_records(did, [post(i) for i in range(450)])
+        pds.add_records(did, [{'text': 'kept'}], collection='app.bsky.feed.like')
+
+        assert deleting(pds, dry_run=True) == 450
+        assert len(pds.records(did)) == 450
+
+        assert deleting(pds, concurrency=2) == 450
+        assert pds.records(did) == {}
+        assert len(pds.records(did, 'app.bsky.feed.like')) == 1
+        assert pds.stats[('com.atproto.repo.applyWrites', 200)] == 3
+
+def test_only_posts_in_the_date_range_or_given_are_deleted():
+    with MockPDS() as pds:
+        did = pds.did_for(ACCOUNT)
+        pds.add_records(did, [post(i) for i in range(5)])
+        boundary = datetime.now(timezone.utc)
+        new = pds.add_records(did, [post(i) for i in range(5, 10)])
+
+        assert deleting(pds, until=boundary, batch_size=2) == 5
+        assert sorted(pds.records(did)) == sorted(uri.rsplit('/', 1)[-1] for uri in new)
+        assert deleting(pds, since=boundary, uris=set(new[:2])) == 2
+        assert len(pds.records(did)) == 3
+
+def test_interrupted_deletion_continues_from_the_saved_cursor(tmp_path):
+    cursor_path = str(tmp_path / 'cursor.txt')
+    with MockPDS() as pds:
+        did = pds.did_for(ACCOUNT)
+        pds.add_records(did, [post(i) for i in range(50)])
+        calls = []
+
+        def fail_third_batch(client):
+            apply_writes = client.com.atproto.repo.apply_writes
+
+            async def flaky(data):
+                calls.append(len(data['writes']))
+                if len(calls) == 3:
+                    raise RuntimeError('connection reset')
+                return await apply_writes(data)
+            client.com.atproto.repo.apply_writes = flaky
+
+        assert deleting(pds, batch_size=10, concurrency=1, cursor_path=cursor_path, hook=fail_third_batch) == 40
+        # Everything after the failed batch was deleted, but progress stops before it
+        remaining = sorted(pds.records(did), reverse=True)
+        assert len(remaining) == 10
+        with open(cursor_path) as f:
+            assert f.read() > remaining[0]
+
+        assert deleting(pds, batch_size=10, cursor_path=cursor_path) == 10
+        assert pds.records(did) == {}
+        assert not os.path.exists(cursor_path)
+
+def test_deleted_posts_are_marked_in_the_outbox(connection):
+    with MockPDS() as pds:
+        did = pds.did_for(ACCOUNT)
+        events = make_due_events(connection, [ACCOUNT], 3)
+        uris = pds.add_records(did, [post(i) for i in range(3)])
+        for event, uri in zip(events, uris):
+            rkey = uri.rsplit('/', 1)[-1]
+            complete_post_intent(connection, add_post_intent(connection, event, rkey), uri, 'cid')
+        pds.add_records(did, [post(3)])
+
+        stored = get_post_uris(connection, ACCOUNT, 'Benchmark')
+        assert stored == set(uris) and get_post_uris(connection, ACCOUNT, 'Elsewhere') == set()
+        on_deleted = lambda rkeys: mark_posts_deleted(connection, ACCOUNT, rkeys)
+        assert deleting(pds, uris=stored, on_deleted=on_deleted) == 3
+
+        assert outbox_status(connection) == ['deleted'] * 3
+        assert len(pds.records(did)) == 1
+        assert get_post_uris(connection, ACCOUNT) == set()
@@ -0,0 +1,138 @@
+import base64
+import asyncio
+import hashlib
+from atproto import models
+from src.bluesky.digest import DigestPost, digest_settings, digest_sites, split_digests, plan_digest, digest_records
+from src.bluesky.engine import PostingEngine
+from src.bluesky.outbox import record_cid, record_key
+from src.bluesky.templates import grapheme_length, MAX_GRAPHEMES
+from src.scripts.benchmark_posting import make_due_events, timed_client_factory
+from src.scripts.mock_pds import MockPDS
+from tests.test_mock_pds import ACCOUNT, ACCOUNTS, connection, outbox_status
+from tests.test_templates import make_event, byte_slice
+
+# CID of the empty DAG-CBOR map, as published by IPFS tooling
+EMPTY_MAP_CID = "bafyreigbtj4x7ip5legnfznufuopl4sg4knzc2cof6duas4b3q2fy6swua"
+
+def dag_cbor(value):
+    """Canonical DAG-CBOR of the text strings, lists and maps post records hold, written out by hand"""
+    def head(major, length):
+        if length < 24:
+            return bytes([major << 5 | length])
+        if length < 256:
+            return bytes([major << 5 | 24, length])
+        return bytes([major << 5 | 25]) + length.to_bytes(2, "big")
+    if isinstance(value, str):
+        data = value.encode("utf-8")
+        return head(3, len(data)) + data
+    if isinstance(value, list):
+        return head(4, len(value)) + b"".join(dag_cbor(item) for item in value)
+    # Map keys sort by their encoded length first, then bytewise
+    keys = sorted(value, key=lambda key: (len(key.encode("utf-8")), key.encode("utf-8")))
+    return head(5, len(keys)) + b"".join(dag_cbor(key) + dag_cbor(value[key]) for key in keys)
+
+def cid_v1(data):
+    """base32 CIDv1 of dag-cbor data with a sha2-256 multihash"""
+    cid = bytes([0x01, 0x71, 0x12, 0x20]) + hashlib.sha256(data).digest()
+    return "b" + base64.b32encode(cid).decode("ascii").lower().rstrip("=")
+
+def unposted(connection):
+    return connection.execute("SELECT COUNT(*) FROM publication_schedule WHERE is_posted = 0").fetchone()[0]
+
+def post_digests(connection, events, **settings):
+    with MockPDS() as pds:
+        digests = {"Benchmark": digest_settings({"digest": settings or True})}
+        engine = PostingEngine(connection, ACCOUNTS, client_factory=timed_client_factory(pds.url, []), digests=digests)
+        results = asyncio.run(engine.run(events))
+        did = pds.did_for(ACCOUNT)
+        return results, pds.records(did), pds.stats
+
+def test_digest_lists_every_event_once_with_a_link_each():
+    events = [
+        make_event(id=i, title=f"Concert number {i} in the park", url=f"https://example.com/{i}") for i in range(30)
+    ]
+    posts = plan_digest(events, digest_settings({"digest": {"heading": "{count} events this week"}}))
+
+    assert len(posts) > 1 and posts[0].text.startswith("30 events this week\n")
+    assert all(grapheme_length(post.text) <= MAX_GRAPHEMES for post in posts)
+    assert [event for post in posts for event in post.events] == events
+    for post in posts:
+        links = [(byte_slice(post.text, facet["index"]), facet["features"][0]["uri"]) for facet in post.facets]
+        assert links == [(event.title, event.url) for event in post.events]
+
+def test_only_sites_with_enough_due_events_are_digested():
+    digests = digest_sites({"websites": [
+        {"name": "Busy", "digest": {"min_events": 3}}, {"name": "Quiet", "digest": True}, {"name": "Plain"}
+    ]})
+    assert set(digests) == {"Busy", "Quiet"}
+    events = [make_event(id=i, config_name=site) for i, site in enumerate(["Busy", "Plain", "Busy", "Quiet", "Busy"])]
+
+    groups, singles = split_digests(events, digests)
+
+    assert [(settings.min_events, [event.id for event in site_events]) for settings, site_events in groups] == [
+        (3, [0, 2, 4])
+    ]
+    assert [event.id for event in singles] == [1, 3]
+
+def test_record_cids_match_known_dag_cbor_vectors():
+    assert cid_v1(dag_cbor({})) == record_cid({}) == EMPTY_MAP_CID
+    record = models.AppBskyFeedPost.Record(text="hi", created_at="2024-01-01T00:00:00.000Z", langs=["en"])
+    assert dag_cbor(models.get_model_as_dict(record)) == (
+        b"\xa4dtextbhie$typerapp.bsky.feed.postelangs\x81benicreatedAtx\x182024-01-01T00:00:00.000Z"
+    )
+    assert record_cid(record) == cid_v1(dag_cbor(models.get_model_as_dict(record))) == (
+        "bafyreigso55q5bq4xpcxt26rdsjfoi3q5uts33pwhllppwjmys4dwswjr4"
+    )
+
+    # Replies reference the CID of the record they answer as the PDS computes it
+    root, reply = digest_records([DigestPost("hi", [], []), DigestPost("there", [], [])], "did:plc:alice")
+    expected = cid_v1(dag_cbor(models.get_model_as_dict(root[1])))
+    assert root[2][1] == expected
+    assert reply[1].reply.parent.cid == reply[1].reply.root.cid == expected
+
+def test_digest_thread_is_created_in_one_call(connection):
+    events = make_due_events(connection, [ACCOUNT], 40)
+    results, records, stats = post_digests(connection, events)
+
+    assert results["posted"] == 40 and unposted(connection) == 0
+    assert stats[("com.atproto.repo.applyWrites", 200)] == 1 and stats[("com.atproto.repo.createRecord", 200)] == 0
+    thread = [records[rkey] for rkey in sorted(records)]
+    assert len(thread) > 1 and "reply" not in thread[0]
+    for parent, reply in zip(thread, thread[1:]):
+        # The CIDs computed before sending are those of the records the PDS stored
+        assert reply["reply"]["parent"]["cid"] == record_cid(parent)
+        assert reply["reply"]["root"]["cid"] == record_cid(thread[0])
+
+    rows = connection.execute("SELECT rkey, uri, cid FROM post_outbox WHERE status = 'posted'").fetchall()
+    assert len(rows) == 40 and {row[0] for row in rows} == set(records)
+    assert all(record_key(uri) == rkey and cid == record_cid(records[rkey]) for rkey, uri, cid in rows)
+
+def test_digest_without_thread_and_small_batches(connection):
+    events = make_due_events(connection, [ACCOUNT], 12)
+    results, records, stats = post_digests(connection, events[:10], thread=False, min_events=5)
+    assert results["posted"] == 10
+    assert len(records) > 1 and all("reply" not in value for value in records.values())
+
+    # Too few due events go out one post each
+    results, records, stats = post_digests(connection, events[10:], min_events=5)
+    assert results["posted"] == 2 and len(records) == 2
+    assert stats[("com.atproto.repo.createRecord", 200)] == 2 and stats[("com.atproto.repo.applyWrites", 200)] == 0
+
+def test_unanswered_digest_is_recovered_without_posting_twice(connection):
+    events = make_due_events(connection, [ACCOUNT], 6)
+    digests = {"Benchmark": digest_settings({"digest": True})}
+    with MockPDS(drop_rate=1.0) as pds:
+        factory = timed_client_factory(pds.url, [])
+        results = asyncio.run(PostingEngine(connection, ACCOUNTS, client_factory=factory, digests=digests).run(events))
+        assert results["failed"] == 6 and outbox_status(connection) == ["pending"] * 6
+
+        connection.execute("UPDATE post_outbox SET intent_ts = intent_ts - 3600")
+        connection.execute("UPDATE publication_schedule SET claimed_ts = claimed_ts - 3600")
+        connection.commit()
+        pds.drop_rate = 0.0
+        results = asyncio.run(PostingEngine(connection, ACCOUNTS, client_factory=factory, digests=digests).run(events))
+
+        assert results["posted"] == 0 and results["skipped"] == 6
+        assert outbox_status(connection) == ["posted"] * 6 and unposted(connection) == 0
+        assert pds.stats[("com.atproto.repo.applyWrites", 502)] == 1
+        assert len(pds.records(pds.did_for(ACCOUNT))) == 1
@@ -0,0 +1,145 @@
+import pytest
+import sqlite3
+from datetime import datetime, timedelta
+from src.database.db_manager import (
+    add_event, get_postable_events, get_event_by_id, schedule_event_posts, mark_event_posted, archive_past_events
+)
+from src.database.duplicates import normalize_tokens, similarity, find_duplicate, DUPLICATE_THRESHOLD
+from src.database.migrations import MIGRATIONS, migrate_database
+from src.database.timestamps import DEFAULT_SOURCE_TZ
+
+OSHKOSH = ("discoveroshkosh.bsky.social", "OshkoshEvents")
+WINNEBAGO = ("wisconsinevents.bsky.social", "WinnebagoEvents")
+CANONICAL_SOURCES = ["OshkoshEvents", "WinnebagoEvents"]
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:")
+    connection.row_factory = sqlite3.Row
+    migrate_database(connection)
+    yield connection
+    connection.close()
+
+def add(connection, title, start, source, url=None, location="", canonical_sources=None):
+    account_username, config_name = source
+    event_id = add_event(
+        connection, title, start, start + timedelta(hours=2), url or f"http://{config_name.lower()}.example.com/{title}",
+        "", location, "", "", "", "", account_username, config_name,
+        source_tz=DEFAULT_SOURCE_TZ, canonical_sources=canonical_sources
+    )
+    schedule_event_posts(connection, event_id, start, [timedelta(days=5)], source_tz=DEFAULT_SOURCE_TZ)
+    return event_id
+
+def website(source):
+    return {"name": source[1], "account_username": source[0], "update_intervals": ["5 days"]}
+
+def test_normalize_tokens():
+    assert normalize_tokens("The Oshkosh Farmers' Market & Café!") == ["oshkosh", "farmers", "market", "cafe"]
+    assert normalize_tokens(None) == []
+
+def test_similarity_uses_title_and_venue():
+    title = normalize_tokens("Winnebago County Fair")
+    assert similarity(title, [], normalize_tokens("County Fair - Winnebago"), []) == 1.0
+    assert similarity(title, ["sunnyview"], title, ["leach", "amphitheater"]) < 1.0
+    assert similarity(title, [], normalize_tokens("Jazz Night"), []) < DUPLICATE_THRESHOLD
+
+def test_cross_source_duplicate_is_marked_and_not_posted(connection):
+    start = datetime.now() + timedelta(days=3)
+    original = add(connection, "Winnebago County Fair", start, OSHKOSH, location="Sunnyview Expo Center")
+    duplicate = add(connection, "Winnebago County Fair 2025", start + timedelta(hours=1), WINNEBAGO, location="Sunnyview Exposition Center")
+
+    assert get_event_by_id(connection, original).duplicate_of is None
+    assert get_event_by_id(connection, duplicate).duplicate_of == original
+    assert [e.id for e in get_postable_events(connection, website(OSHKOSH))] == [original]
+    assert get_postable_events(connection, website(WINNEBAGO)) == []
+
+def test_similar_events_on_other_days_or_same_source_are_kept(connection):
+    start = datetime.now() + timedelta(days=3)
+    first = add(connection, "Farmers Market", start, OSHKOSH)
+    same_source = add(connection, "Farmers Market", start + timedelta(hours=4), OSHKOSH, url="http://oshkosh.example.com/afternoon")
+    other_day = add(connection, "Farmers Market", start + timedelta(days=1), WINNEBAGO)
+    different = add(connection, "Jazz Night", start, WINNEBAGO)
+
+    for event_id in (first, same_source, other_day, different):
+        assert get_event_by_id(connection, event_id).duplicate_of is None
+
+def test_canonical_source_takes_over_unposted_group(connection):
+    start = datetime.now() + timedelta(days=3)
+    winnebago = add(connection, "Sawdust Days", start, WINNEBAGO, canonical_sources=CANONICAL_SOURCES)
+    oshkosh = add(connection, "Sawdust Days!", start, OSHKOSH, canonical_sources=CANONICAL_SOURCES)
+
+    assert get_event_by_id(connection, oshkosh).duplicate_of is None
+    assert get_event_by_id(connection, winnebago).duplicate_of == oshkosh
+
+def test_posted_event_stays_canonical(connection):
+    start = datetime.now() + timedelta(days=3)
+    winnebago = add(connection, "Sawdust Days", start, WINNEBAGO, canonical_sources=CANONICAL_SOURCES)
+    mark_event_posted(connection, winnebago)
+    oshkosh = add(connection, "Sawdust Days", start, OSHKOSH, canonical_sources=CANONICAL_SOURCES)
+
+    assert get_event_by_id(connection, winnebago).duplicate_of is None
+    assert get_event_by_id(connection, oshkosh).duplicate_of == winnebago
+
+def test_deleting_canonical_event_releases_duplicates(connection):
+    start = datetime.now() + timedelta(days=3)
+    original = add(connection, "Sawdust Days", start, OSHKOSH)
+    duplicate = add(connection, "Sawdust Days", start, WINNEBAGO)
+
+    connection.execute("DELETE FROM publication_schedule WHERE event_id = ?", (original,))
+    connection.execute("DELETE FROM events WHERE id = ?", (original,))
+    connection.commit()
+
+    assert get_event_by_id(connection, duplicate).duplicate_of is None
+    assert connection.execute("SELECT COUNT(*) FROM event_index WHERE rowid = ?", (original,)).fetchone()[0] == 0
+
+def test_archiving_canonical_event_takes_its_duplicates_along(connection):
+    start = datetime(2025, 6, 1, 10, 0)
+    original = add(connection, "Winnebago County Fair", start, OSHKOSH)
+    # The other source lists it later in the day, so on its own it is not past yet
+    duplicate = add(connection, "Winnebago County Fair", start + timedelta(hours=10), WINNEBAGO)
+    assert get_event_by_id(connection, duplicate).duplicate_of == original
+
+    assert archive_past_events(connection, OSHKOSH[0], start + timedelta(hours=30)) == 2
+    assert connection.execute("SELECT COUNT(*) FROM events").fetchone()[0] == 0
+    archived = connection.execute("SELECT duplicate_of FROM events_archive WHERE id = ?", (duplicate,)).fetchone()
+    assert archived[0] == original
+
+def test_lookup_uses_full_text_index(connection):
+    start = datetime.now() + timedelta(days=3)
+    for i in range(200):
+        add(connection, f"Concert number {i}", start + timedelta(days=i % 20), OSHKOSH)
+    event_id = add(connection, "Concert number 7", start + timedelta(days=7), WINNEBAGO)
+
+    statements = []
+    connection.set_trace_callback(statements.append)
+    match = find_duplicate(connection, event_id)
+    connection.set_trace_callback(None)
+
+    assert match is not None
+    lookup = next(sql for sql in statements if "MATCH" in sql)
+    plan = " | ".join(row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {lookup}"))
+    assert "VIRTUAL TABLE INDEX" in plan
+    assert "SCAN e" not in plan
+
+def test_migration_indexes_and_marks_existing_events(monkeypatch):
+    connection = sqlite3.connect(":memory:")
+    connection.row_factory = sqlite3.Row
+    monkeypatch.setattr("src.database.migrations.MIGRATIONS", MIGRATIONS[:5])
+    migrate_database(connection)
+    start = 2000000000
+    for title, config_name in (("Sawdust Days", "OshkoshEvents"), ("Sawdust Days", "WinnebagoEvents")):
+        connection.execute('''
+            INSERT INTO events (title, start_ts, end_ts, source_tz, url, published, account_username, config_name)
+            VALUES (?, ?, ?, ?, ?, 0, 'user', ?)
+        ''', (title, start, start, DEFAULT_SOURCE_TZ, f"http://example.com/{config_name}", config_name))
+    connection.commit()
+
+    monkeypatch.undo()
+    # The migration runs its own copy of the detection rules, not the live ones
+    monkeypatch.setattr("src.database.duplicates.DUPLICATE_THRESHOLD", 2.0)
+    migrate_database(connection)
+
+    rows = connection.execute("SELECT id, duplicate_of FROM events ORDER BY id").fetchall()
+    assert [tuple(row) for row in rows] == [(1, None), (2, 1)]
+    assert connection.execute("SELECT COUNT(*) FROM event_index").fetchone()[0] == 2
+    connection.close()
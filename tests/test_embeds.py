@@ -0,0 +1,140 @@
+import io
+import asyncio
+import httpx
+import pytest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from atproto_client.models.blob_ref import BlobRef, IpldLink
+from src.bluesky import embeds
+from src.bluesky.embeds import prepare_thumbnail, link_card, MAX_THUMBNAIL_BYTES
+from src.bluesky.engine import PostingEngine
+from src.database.db_manager import connect_to_db, add_event, schedule_event_posts, get_postable_events
+from src.database.migrations import migrate_database
+
+IMAGE_URL = "https://example.com/event.jpg"
+WEBSITE_CONFIG = {"name": "TestSite", "account_username": "alice.bsky.social", "update_intervals": ["5 days", "1 day"]}
+
+class UploadingClient:
+    def __init__(self):
+        self.uploads = 0
+        self.posts = []
+        self.request = SimpleNamespace(_client=httpx.AsyncClient())
+        self.me = SimpleNamespace(did="did:plc:alice")
+        self.app = SimpleNamespace(bsky=SimpleNamespace(feed=SimpleNamespace(post=self)))
+
+    def blob(self, data):
+        self.uploads += 1
+        return SimpleNamespace(blob=BlobRef(mime_type="image/jpeg", size=len(data), ref=IpldLink(link=f"bafk{self.uploads}")))
+
+    async def upload_blob(self, data):
+        return self.blob(data)
+
+    async def create(self, repo, record, rkey=None):
+        self.posts.append(record.embed)
+        return SimpleNamespace(uri=f"at://{repo}/app.bsky.feed.post/{rkey}", cid="cid")
+
+@pytest.fixture
+def connection(tmp_path):
+    connection = connect_to_db(str(tmp_path / "events.db"))
+    migrate_database(connection)
+    yield connection
+    connection.close()
+
+def add_image_event(connection, account="alice.bsky.social", image_url=IMAGE_URL):
+    start = datetime.now() + timedelta(days=3)
+    event_id = add_event(
+        connection, "Concert", start, start, f"http://example.com/{account}/concert", "An evening concert", "", "", "", "", "",
+        account, "TestConfig", image_url=image_url
+    )
+    schedule_event_posts(connection, event_id, start, [timedelta(days=5), timedelta(days=1)])
+    return get_postable_events(connection, dict(WEBSITE_CONFIG, account_username=account))[0]
+
+def serve_image(monkeypatch, handler=None):
+    """Answer the engine's image downloads with handler, by default a small JPEG; returns the URLs fetched"""
+    monkeypatch.setattr(embeds, "Image", None)
+    downloads = []
+
+    def record(request):
+        downloads.append(str(request.url))
+        if handler:
+            return handler(request)
+        return httpx.Response(200, content=b"jpeg bytes", headers={"content-type": "image/jpeg"})
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(httpx, "AsyncClient", lambda **kwargs: real_client(transport=httpx.MockTransport(record), **kwargs))
+    return downloads
+
+def post(connection, client, events):
+    accounts = {event.account_username: {"username": event.account_username, "password": "secret"} for event in events}
+
+    async def factory(username, password):
+        return client
+
+    return asyncio.run(PostingEngine(connection, accounts, client_factory=factory).run(events))
+
+def test_small_images_pass_through_without_pillow(monkeypatch):
+    monkeypatch.setattr(embeds, "Image", None)
+    thumbnail = prepare_thumbnail(b"jpeg bytes", "image/jpeg; charset=binary")
+    assert thumbnail.mime_type == "image/jpeg" and thumbnail.data == b"jpeg bytes"
+    assert prepare_thumbnail(b"x" * (MAX_THUMBNAIL_BYTES + 1), "image/jpeg") is None
+    assert prepare_thumbnail(b"gif bytes", "image/gif") is None
+
+def test_large_images_are_resized_and_compressed():
+    Image = pytest.importorskip("PIL.Image")
+    original = io.BytesIO()
+    Image.effect_noise((3000, 2000), 100).convert("RGB").save(original, format="PNG")
+    thumbnail = prepare_thumbnail(original.getvalue(), "image/png")
+    assert thumbnail.mime_type == "image/jpeg"
+    assert len(thumbnail.data) <= MAX_THUMBNAIL_BYTES
+    assert max(Image.open(io.BytesIO(thumbnail.data)).size) == 1200
+
+def test_thumbnail_is_downloaded_once_and_uploaded_once_per_account(connection, monkeypatch):
+    downloads = serve_image(monkeypatch)
+    client = UploadingClient()
+    post(connection, client, [add_image_event(connection)])
+
+    # Another account, in a later run, has to upload its own copy of the bytes already downloaded
+    post(connection, client, [add_image_event(connection, account="bob.bsky.social")])
+    assert [embed.external.thumb.ref.link for embed in client.posts] == ["bafk1", "bafk2"]
+    assert (len(downloads), client.uploads) == (1, 2)
+
+def test_failed_download_posts_card_without_thumbnail(connection, monkeypatch):
+    def fail(request):
+        raise httpx.ConnectError("unreachable", request=request)
+    serve_image(monkeypatch, fail)
+    client = UploadingClient()
+    event = add_image_event(connection)
+
+    assert post(connection, client, [event])["posted"] == 1
+    assert client.posts[0].external.thumb is None and client.uploads == 0
+    card = link_card(event._replace(description="x" * 400))
+    assert card.external.uri == event.url and card.external.title == "Concert"
+    assert len(card.external.description) == 300 and card.external.thumb is None
+
+def test_engine_posts_link_cards_and_reuses_cached_blob(connection, monkeypatch):
+    downloads = serve_image(monkeypatch)
+    client = UploadingClient()
+    event = add_image_event(connection)
+    post(connection, client, [event])
+    # A later interval of the same event posts the same card again
+    connection.execute("UPDATE publication_schedule SET is_posted = 0")
+    connection.execute("UPDATE events SET last_posted_ts = NULL")
+    connection.commit()
+    post(connection, client, [event])
+
+    assert [embed.external.thumb.ref.link for embed in client.posts] == ["bafk1", "bafk1"]
+    assert (len(downloads), client.uploads) == (1, 1)
+
+def test_engine_downloads_an_image_once_for_all_accounts(connection, tmp_path, monkeypatch):
+    downloads = serve_image(monkeypatch)
+    client = UploadingClient()
+    events = [add_image_event(connection, account=name) for name in ("alice.bsky.social", "bob.bsky.social")]
+    results = post(connection, client, events)
+
+    assert results["posted"] == 2
+    assert (len(downloads), client.uploads) == (1, 2)
+    # The cache rows went out with the run's group commits
+    reader = connect_to_db(str(tmp_path / "events.db"), read_only=True)
+    assert reader.execute("SELECT data FROM thumbnails").fetchall()[0][0] == b"jpeg bytes"
+    assert reader.execute("SELECT COUNT(*) FROM thumbnail_blobs").fetchone()[0] == 2
+    reader.close()
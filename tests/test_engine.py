@@ -0,0 +1,210 @@
+import asyncio
+import time
+import httpx
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+from atproto_client.exceptions import RateLimitExceededError
+from atproto_client.request import Response
+from src.bluesky.engine import PostingEngine
+from src.bluesky.rate_limiter import RateLimiter, RateLimitDeferred
+from src.database.db_manager import (
+    connect_to_db, add_event, schedule_event_posts, get_postable_events, claim_scheduled_post
+)
+from src.database.migrations import migrate_database
+
+ACCOUNTS = {
+    "alice.bsky.social": {"username": "alice.bsky.social", "password": "secret"},
+    "bob.bsky.social": {"username": "bob.bsky.social", "password": "secret"}
+}
+
+class FakeClient:
+    def __init__(self, username, sent, delay=0.05, fail=(), limited=None, records=None):
+        self.username = username
+        self.sent = sent
+        self.delay = delay
+        self.fail = fail
+        self.limited = dict(limited or {})
+        self.records = records if records is not None else {}
+        self.calls = 0
+        self.me = SimpleNamespace(did=f"did:plc:{username[:3]}")
+        self.request = SimpleNamespace(_client=httpx.AsyncClient())
+        self.app = SimpleNamespace(bsky=SimpleNamespace(feed=SimpleNamespace(post=self)))
+        self.com = SimpleNamespace(atproto=SimpleNamespace(repo=self))
+
+    async def create(self, repo, record, rkey=None):
+        title = record.text.split(" (")[0]
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if title in self.limited:
+            headers = {"ratelimit-limit": "5000", "ratelimit-remaining": "0", "ratelimit-policy": "5000;w=3600",
+                       "ratelimit-reset": str(self.limited.pop(title))}
+            raise RateLimitExceededError(Response(False, 429, None, headers))
+        if title in self.fail:
+            raise RuntimeError("upstream error")
+        self.sent.append((self.username, title))
+        uri = f"at://{repo}/app.bsky.feed.post/{rkey}"
+        self.records[rkey] = SimpleNamespace(uri=uri, cid=f"cid-{rkey}", value=record)
+        return SimpleNamespace(uri=uri, cid=f"cid-{rkey}")
+
+    async def list_records(self, params):
+        records = [self.records[rkey] for rkey in sorted(self.records, reverse=True)]
+        return SimpleNamespace(records=records, cursor=None)
+
+def client_factory(sent, **kwargs):
+    async def factory(username, password):
+        return FakeClient(username, sent, **kwargs)
+    return factory
+
+def due_events(connection, username, count):
+    start = datetime.now() + timedelta(days=3)
+    for i in range(count):
+        event_id = add_event(
+            connection, f"{username[:3]} {i}", start + timedelta(minutes=i), start, f"http://example.com/{username}/{i}",
+            "", "", "", "", "", "", username, "TestConfig"
+        )
+        schedule_event_posts(connection, event_id, start + timedelta(minutes=i), [timedelta(days=5)])
+    website = {"name": "TestSite", "account_username": username, "update_intervals": ["5 days"]}
+    return get_postable_events(connection, website)
+
+def unposted(connection):
+    return connection.execute("SELECT COUNT(*) FROM publication_schedule WHERE is_posted = 0").fetchone()[0]
+
+def test_accounts_post_concurrently_in_order(tmp_path):
+    connection = connect_to_db(str(tmp_path / "events.db"))
+    migrate_database(connection)
+    events = due_events(connection, "alice.bsky.social", 4) + due_events(connection, "bob.bsky.social", 4)
+    sent = []
+
+    engine = PostingEngine(connection, ACCOUNTS, client_factory=client_factory(sent))
+    started = time.monotonic()
+    results = asyncio.run(engine.run(events))
+    elapsed = time.monotonic() - started
+
+    assert results == {"posted": 8, "failed": 0, "skipped": 0, "deferred": 0}
+    # Two accounts of four sequential posts each take about as long as one
+    assert elapsed < 8 * 0.05
+    for username in ACCOUNTS:
+        assert [title for user, title in sent if user == username] == [f"{username[:3]} {i}" for i in range(4)]
+    assert unposted(connection) == 0
+    assert connection.execute("SELECT COUNT(*) FROM events WHERE last_posted_ts IS NULL").fetchone()[0] == 0
+    connection.close()
+
+def test_in_flight_posts_complete_in_order(tmp_path):
+    connection = connect_to_db(str(tmp_path / "events.db"))
+    migrate_database(connection)
+    events = due_events(connection, "alice.bsky.social", 6)
+    sent = []
+
+    engine = PostingEngine(connection, ACCOUNTS, max_in_flight=3, client_factory=client_factory(sent))
+    started = time.monotonic()
+    asyncio.run(engine.run(events))
+
+    assert time.monotonic() - started < 6 * 0.05
+    assert unposted(connection) == 0
+    connection.close()
+
+def test_failed_post_releases_claim_and_run_continues(tmp_path):
+    connection = connect_to_db(str(tmp_path / "events.db"))
+    migrate_database(connection)
+    events = due_events(connection, "alice.bsky.social", 3)
+    sent = []
+
+    engine = PostingEngine(connection, ACCOUNTS, client_factory=client_factory(sent, delay=0, fail=("ali 1",)))
+    results = asyncio.run(engine.run(events))
+
+    assert results == {"posted": 2, "failed": 1, "skipped": 0, "deferred": 0}
+    assert [title for _, title in sent] == ["ali 0", "ali 2"]
+    released = connection.execute(
+        "SELECT is_posted, claimed_ts FROM publication_schedule WHERE id = ?", (events[1].schedule_id,)
+    ).fetchone()
+    assert tuple(released) == (0, None)
+    connection.close()
+
+def test_claimed_entries_and_unknown_accounts_are_skipped(tmp_path):
+    connection = connect_to_db(str(tmp_path / "events.db"))
+    migrate_database(connection)
+    events = due_events(connection, "alice.bsky.social", 2) + due_events(connection, "carol.bsky.social", 1)
+    assert claim_scheduled_post(connection, events[0].schedule_id)
+    sent = []
+
+    engine = PostingEngine(connection, ACCOUNTS, client_factory=client_factory(sent, delay=0))
+    results = asyncio.run(engine.run(events))
+
+    assert results == {"posted": 1, "failed": 0, "skipped": 2, "deferred": 0}
+    assert sent == [("alice.bsky.social", "ali 1")]
+    connection.close()
+
+def test_rate_limited_post_is_retried_after_reset(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.bluesky.engine.retry_delay", lambda attempt: 0)
+    connection = connect_to_db(str(tmp_path / "events.db"))
+    migrate_database(connection)
+    events = due_events(connection, "alice.bsky.social", 2)
+    sent = []
+
+    factory = client_factory(sent, delay=0, limited={"ali 0": int(time.time())})
+    results = asyncio.run(PostingEngine(connection, ACCOUNTS, client_factory=factory).run(events))
+
+    assert results["posted"] == 2
+    assert [title for _, title in sent] == ["ali 0", "ali 1"]
+    connection.close()
+
+def test_posts_past_the_reset_are_deferred_in_order(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.bluesky.engine.retry_delay", lambda attempt: 0)
+    connection = connect_to_db(str(tmp_path / "events.db"))
+    migrate_database(connection)
+    events = due_events(connection, "alice.bsky.social", 3) + due_events(connection, "bob.bsky.social", 1)
+    sent = []
+
+    factory = client_factory(sent, delay=0, limited={"ali 1": int(time.time()) + 3600})
+    engine = PostingEngine(connection, ACCOUNTS, client_factory=factory, limiter=RateLimiter(max_wait=60))
+    results = asyncio.run(engine.run(events))
+
+    assert results == {"posted": 2, "failed": 0, "skipped": 0, "deferred": 2}
+    assert sent == [("alice.bsky.social", "ali 0"), ("bob.bsky.social", "bob 0")]
+    claimed = connection.execute("SELECT COUNT(*) FROM publication_schedule WHERE claimed_ts IS NOT NULL").fetchone()[0]
+    assert claimed == 0 and unposted(connection) == 2
+    connection.close()
+
+def test_posts_are_paced_by_the_write_budget(tmp_path):
+    connection = connect_to_db(str(tmp_path / "events.db"))
+    migrate_database(connection)
+    events = due_events(connection, "alice.bsky.social", 4)
+    sent = []
+    # Two posts' worth of write points, refilled over 0.1s
+    limits = {"write": [(6, 0.1)], "session": [(30, 300)], "api": [(3000, 300)]}
+
+    engine = PostingEngine(connection, ACCOUNTS, client_factory=client_factory(sent, delay=0), limiter=RateLimiter(limits))
+    started = time.monotonic()
+    asyncio.run(engine.run(events))
+
+    assert time.monotonic() - started >= 0.1
+    assert len(sent) == 4
+    connection.close()
+
+class DeferAfterLimitLimiter(RateLimiter):
+    """Defers the write retried after a 429, and only that one"""
+
+    def observe(self, account, endpoint, headers, now=None):
+        self.limited = True
+
+    async def acquire(self, account, endpoint, cost=1):
+        if endpoint == "write" and getattr(self, "limited", False):
+            self.limited = False
+            raise RateLimitDeferred(endpoint, 3600)
+        await super().acquire(account, endpoint, cost)
+
+def test_post_after_a_deferred_one_is_not_sent(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.bluesky.engine.retry_delay", lambda attempt: 0)
+    connection = connect_to_db(str(tmp_path / "events.db"))
+    migrate_database(connection)
+    events = due_events(connection, "alice.bsky.social", 2)
+    sent = []
+
+    factory = client_factory(sent, delay=0.01, limited={"ali 0": int(time.time())})
+    engine = PostingEngine(connection, ACCOUNTS, client_factory=factory, limiter=DeferAfterLimitLimiter())
+    results = asyncio.run(engine.run(events))
+
+    assert results == {"posted": 0, "failed": 0, "skipped": 0, "deferred": 2}
+    assert sent == [] and unposted(connection) == 2
+    assert connection.execute("SELECT COUNT(*) FROM post_outbox").fetchone()[0] == 0
+    connection.close()
@@ -0,0 +1,100 @@
+import sqlite3
+from datetime import datetime, timedelta
+from src.database.db_manager import connect_to_db, add_event, schedule_event_posts
+from src.database.migrations import MIGRATIONS, migrate_database
+from src.scripts.maintain_database import prune_orphans, run_maintenance, database_size
+
+INTERVALS = [timedelta(days=5), timedelta(days=1)]
+
+def add_events(connection, count, description=""):
+    start = datetime.now() + timedelta(days=3)
+    ids = []
+    for i in range(count):
+        ids.append(add_event(
+            connection, f"Event {i}", start, start, f"http://example.com/{i}", description,
+            "", "", "", "", "", "testuser.bsky.social", "TestConfig"
+        ))
+        schedule_event_posts(connection, ids[-1], start, INTERVALS)
+    return ids
+
+def test_deleting_an_event_cascades_to_its_schedule(tmp_path):
+    connection = connect_to_db(str(tmp_path / "events.db"))
+    migrate_database(connection)
+    event_id = add_events(connection, 1)[0]
+
+    assert connection.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+    connection.execute("DELETE FROM events WHERE id = ?", (event_id,))
+    connection.commit()
+
+    assert connection.execute("SELECT COUNT(*) FROM publication_schedule").fetchone()[0] == 0
+    connection.close()
+
+def test_migration_keeps_orphans_for_batched_pruning(monkeypatch):
+    connection = sqlite3.connect(":memory:")
+    monkeypatch.setattr("src.database.migrations.MIGRATIONS", MIGRATIONS[:7])
+    migrate_database(connection)
+    ids = []
+    for i in range(5):
+        connection.execute('''
+            INSERT INTO events (title, start_ts, end_ts, source_tz, url, published, account_username, config_name)
+            VALUES (?, 2000000000, 2000000000, 'UTC', ?, 0, 'user', 'TestConfig')
+        ''', (f"Event {i}", f"http://example.com/{i}"))
+        ids.append(connection.execute("SELECT last_insert_rowid()").fetchone()[0])
+        connection.executemany(
+            "INSERT INTO publication_schedule (event_id, scheduled_ts, interval, is_posted) VALUES (?, 1900000000, ?, 0)",
+            [(ids[-1], "5 days"), (ids[-1], "1 day")]
+        )
+    # Orphans as left behind by the old purge, which ran without foreign keys
+    connection.execute("DELETE FROM events WHERE id IN (?, ?, ?)", ids[:3])
+    connection.commit()
+    monkeypatch.undo()
+    migrate_database(connection)
+
+    on_delete = [row[6] for row in connection.execute("PRAGMA foreign_key_list(publication_schedule)")]
+    assert on_delete == ["CASCADE"]
+    assert connection.execute("SELECT COUNT(*) FROM publication_schedule").fetchone()[0] == 10
+
+    assert prune_orphans(connection, batch_size=4) == 6
+    assert connection.execute("SELECT COUNT(*) FROM publication_schedule").fetchone()[0] == 4
+    connection.close()
+
+def test_run_maintenance_converts_and_reclaims_space(tmp_path):
+    path = str(tmp_path / "events.db")
+    # A database created before connect_to_db turned on incremental auto-vacuum
+    legacy = sqlite3.connect(path)
+    migrate_database(legacy)
+    legacy.close()
+
+    connection = connect_to_db(path)
+    assert connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    add_events(connection, 300, description="x" * 2000)
+    connection.execute("DELETE FROM events")
+    connection.commit()
+    size_before, free_before = database_size(connection)
+    assert free_before > 0
+
+    report = run_maintenance(connection, max_vacuum_pages=100000)
+
+    assert report['converted']
+    assert report['size_before'] == size_before
+    assert report['reclaimed_bytes'] > 0
+    assert report['free_pages'] == 0
+    assert connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    assert connection.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()[0] == 1
+    connection.close()
+
+def test_incremental_vacuum_is_bounded(tmp_path):
+    connection = connect_to_db(str(tmp_path / "events.db"))
+    migrate_database(connection)
+    assert connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    add_events(connection, 300, description="x" * 2000)
+    connection.execute("DELETE FROM events")
+    connection.commit()
+    assert database_size(connection)[1] > 10
+
+    report = run_maintenance(connection, max_vacuum_pages=10)
+
+    assert not report['converted']
+    assert report['pages_released'] == 10
+    assert report['free_pages'] > 0
+    connection.close()
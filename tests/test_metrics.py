@@ -0,0 +1,146 @@
+import asyncio
+from datetime import datetime, timedelta
+from atproto_client import AsyncClient
+from src.bluesky import auth
+from src.bluesky.engine import post_events
+from src.bluesky import metrics
+from src.bluesky.metrics import collect_metrics, prune_intervals, plan_intervals
+from src.database.db_manager import add_post_intent, complete_post_intent, get_interval_engagement
+from src.main import plan_update_intervals
+from src.scripts.benchmark_posting import make_due_events, timed_client_factory
+from src.scripts.mock_pds import MockPDS
+from tests.test_mock_pds import ACCOUNT, ACCOUNTS, connection
+
+def make_posts(connection, pds, count, posted_at=None):
+    """count events posted to the mock PDS and recorded in the outbox"""
+    events = make_due_events(connection, [ACCOUNT], count)
+    uris = pds.add_records(pds.did_for(ACCOUNT), [{"text": event.title} for event in events])
+    for event, uri in zip(events, uris):
+        intent_id = add_post_intent(connection, event, uri.rsplit("/", 1)[-1])
+        complete_post_intent(connection, intent_id, uri, "cid", posted_at)
+    return uris
+
+def collect(pds, connection, now=None):
+    async def run():
+        client = AsyncClient(pds.url)
+        await client.login(ACCOUNT, "secret", fetch_bsky_profile=False)
+        return await collect_metrics(client, connection, ACCOUNT, now=now)
+    return asyncio.run(run())
+
+def samples(connection):
+    return connection.execute("SELECT COUNT(*) FROM post_metrics").fetchone()[0]
+
+def test_engagement_is_fetched_in_batches_and_stored_when_it_changes(connection):
+    with MockPDS() as pds:
+        uris = make_posts(connection, pds, 30)
+        pds.engagement[uris[0]] = (5, 1, 2, 0)
+
+        assert collect(pds, connection) == 30
+        assert pds.stats[("app.bsky.feed.getPosts", 200)] == 2
+        # Checked posts wait for METRICS_INTERVAL
+        assert collect(pds, connection) == 0
+        assert pds.stats[("app.bsky.feed.getPosts", 200)] == 2
+
+        pds.engagement[uris[1]] = (1, 0, 0, 0)
+        assert collect(pds, connection, now=datetime.now() + timedelta(hours=7)) == 1
+        assert samples(connection) == 31
+        latest = connection.execute(
+            "SELECT likes, reposts, replies, quotes FROM post_metrics WHERE uri = ?", (uris[0],)
+        ).fetchall()
+        assert [tuple(row) for row in latest] == [(5, 1, 2, 0)]
+
+        # Posts older than METRICS_WINDOW are no longer checked
+        assert collect(pds, connection, now=datetime.now() + timedelta(days=15)) == 0
+        assert pds.stats[("app.bsky.feed.getPosts", 200)] == 4
+
+def test_collecting_all_accounts_skips_failing_ones(connection):
+    with MockPDS() as pds:
+        make_posts(connection, pds, 3)
+        accounts = dict(ACCOUNTS, **{"nobody.test": {"username": "nobody.test", "password": "secret"}})
+
+        async def factory(username, password):
+            if username == "nobody.test":
+                raise RuntimeError("login failed")
+            return await timed_client_factory(pds.url, [])(username, password)
+
+        post_events(connection, accounts, [], collect_metrics=True, client_factory=factory)
+        assert samples(connection) == 3
+
+def test_low_engagement_intervals_are_dropped(connection, monkeypatch):
+    with MockPDS() as pds:
+        uris = make_posts(connection, pds, 6)
+        # Half of the posts were made 30 days ahead, and hardly anyone engaged with them
+        connection.execute(
+            "UPDATE publication_schedule SET interval = ? WHERE id IN (SELECT schedule_id FROM post_outbox LIMIT 3)",
+            (str(timedelta(days=30)),)
+        )
+        connection.commit()
+        early = {row[0] for row in connection.execute(
+            "SELECT uri FROM post_outbox o JOIN publication_schedule s ON s.id = o.schedule_id WHERE s.interval = ?",
+            (str(timedelta(days=30)),)
+        )}
+        for uri in uris:
+            pds.engagement[uri] = (1, 0, 0, 0) if uri in early else (8, 2, 1, 1)
+        collect(pds, connection)
+
+    assert get_interval_engagement(connection, ACCOUNT, "Benchmark") == {"30 days": (3, 1.0), "5 days": (3, 12.0)}
+    assert get_interval_engagement(connection, ACCOUNT, "Elsewhere") == {}
+
+    website = {"name": "Benchmark", "account_username": ACCOUNT, "update_intervals": ["30 days", "5 days", "1 day"]}
+    monkeypatch.setattr(metrics, "MIN_MEASURED_POSTS", 3)
+    assert plan_intervals(connection, website) == website["update_intervals"]
+    assert plan_intervals(connection, dict(website, prune_intervals=True)) == ["5 days", "1 day"]
+    monkeypatch.setattr(metrics, "MIN_MEASURED_POSTS", 4)
+    assert plan_intervals(connection, dict(website, prune_intervals=True)) == website["update_intervals"]
+
+def test_pruned_intervals_lose_their_pending_posts(connection, monkeypatch):
+    with MockPDS() as pds:
+        uris = make_posts(connection, pds, 4)
+        connection.execute(
+            "UPDATE publication_schedule SET interval = ? WHERE id IN (SELECT schedule_id FROM post_outbox LIMIT 2)",
+            (str(timedelta(days=30)),)
+        )
+        for uri in uris:
+            pds.engagement[uri] = (0, 0, 0, 0)
+        pds.engagement[uris[-1]] = (9, 0, 0, 0)
+        collect(pds, connection)
+    # A later event still waiting for its 30 days post
+    make_due_events(connection, [ACCOUNT], 1)
+    connection.execute(
+        "UPDATE publication_schedule SET interval = ?, is_posted = 0 WHERE id = (SELECT MAX(id) FROM publication_schedule)",
+        (str(timedelta(days=30)),)
+    )
+    connection.commit()
+    monkeypatch.setattr(metrics, "MIN_MEASURED_POSTS", 2)
+    website = {
+        "name": "Benchmark", "account_username": ACCOUNT, "update_intervals": ["30 days", "5 days"], "prune_intervals": True
+    }
+    config = {"websites": [website]}
+
+    assert plan_update_intervals(connection, config, unschedule=False) == {"Benchmark": [timedelta(days=5)]}
+    pending = "SELECT COUNT(*) FROM publication_schedule WHERE is_posted = 0 AND interval = ?"
+    assert connection.execute(pending, (str(timedelta(days=30)),)).fetchone()[0] == 1
+
+    assert plan_update_intervals(connection, config) == {"Benchmark": [timedelta(days=5)]}
+    assert connection.execute(pending, (str(timedelta(days=30)),)).fetchone()[0] == 0
+    assert website["update_intervals"] == ["30 days", "5 days"]
+
+def test_prune_intervals_keeps_unmeasured_and_at_least_one_interval():
+    intervals = ["30 days", "2 weeks", "5 days"]
+    assert prune_intervals(intervals, {"30 days": (50, 0.5), "5 days": (50, 4.0)}, min_posts=20) == ["2 weeks", "5 days"]
+    assert prune_intervals(intervals, {"30 days": (50, 0.0), "5 days": (50, 0.0)}, min_posts=20) == intervals
+    assert prune_intervals(intervals, {"30 days": (5, 0.5), "5 days": (50, 4.0)}, min_posts=20) == intervals
+
+def test_posting_and_collecting_back_to_back_use_working_clients(connection, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with MockPDS(passwords={ACCOUNT: "secret"}) as pds:
+        monkeypatch.setattr(auth, "PDS_URL", pds.url)
+        events = make_due_events(connection, [ACCOUNT], 4)
+        assert post_events(connection, ACCOUNTS, events[:2], collect_metrics=True)["posted"] == 2
+        assert samples(connection) == 2
+
+        # A later run with its own event loop gets a new client for it
+        assert post_events(connection, ACCOUNTS, events[2:], collect_metrics=True)["posted"] == 2
+        assert samples(connection) == 4
+        assert pds.stats[("app.bsky.feed.getPosts", 200)] == 2
+        assert pds.stats[("com.atproto.server.createSession", 200)] == 1
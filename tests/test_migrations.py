@@ -0,0 +1,195 @@
+import pytest
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from src.database.db_manager import create_event_table, add_event, get_postable_events, schedule_event_posts, archive_past_events
+from src.database.migrations import MIGRATIONS, migrate_database, get_schema_version
+from src.database.timestamps import DEFAULT_SOURCE_TZ, to_epoch, now_epoch
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:")
+    connection.row_factory = sqlite3.Row
+    migrate_database(connection)
+    yield connection
+    connection.close()
+
+def query_plan(connection, sql, params=()):
+    rows = connection.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return " | ".join(row[3] for row in rows)
+
+def test_migrate_database_sets_user_version(connection):
+    assert get_schema_version(connection) == MIGRATIONS[-1][0]
+
+def test_migrate_database_is_idempotent(connection):
+    version = get_schema_version(connection)
+    assert migrate_database(connection) == version
+
+def test_migrate_database_upgrades_legacy_schema():
+    # A database created before hashtags/last_posted existed and before versioning
+    connection = sqlite3.connect(":memory:")
+    connection.execute('''
+        CREATE TABLE events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            url TEXT NOT NULL,
+            description TEXT,
+            location TEXT,
+            address TEXT,
+            city TEXT,
+            region TEXT,
+            published BOOLEAN NOT NULL,
+            account_username TEXT NOT NULL,
+            config_name TEXT NOT NULL,
+            UNIQUE(title, start_date, url)
+        )
+    ''')
+    connection.commit()
+
+    migrate_database(connection)
+
+    columns = [row[1] for row in connection.execute('PRAGMA table_info(events)')]
+    assert 'hashtags' in columns
+    assert 'last_posted_ts' in columns
+    connection.close()
+
+def test_create_event_table_runs_migrations():
+    connection = sqlite3.connect(":memory:")
+    create_event_table(connection)
+    assert get_schema_version(connection) == MIGRATIONS[-1][0]
+    connection.close()
+
+def test_failed_migration_rolls_back(connection, monkeypatch):
+    def broken_migration(conn):
+        conn.execute('CREATE TABLE should_not_exist (id INTEGER)')
+        raise RuntimeError("boom")
+
+    version = get_schema_version(connection)
+    monkeypatch.setattr(
+        "src.database.migrations.MIGRATIONS",
+        MIGRATIONS + [(version + 1, "broken", broken_migration)]
+    )
+    with pytest.raises(RuntimeError):
+        migrate_database(connection)
+
+    assert get_schema_version(connection) == version
+    tables = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    assert 'should_not_exist' not in tables
+
+def trace_get_postable_events(connection):
+    now = datetime.now()
+    event_id = add_event(
+        connection, "Event", now + timedelta(days=3), now + timedelta(days=3),
+        "http://example.com/event", "Description", "Location", "Address", "City", "Region",
+        "", "testuser.bsky.social", "TestConfig"
+    )
+    schedule_event_posts(connection, event_id, now + timedelta(days=3), [timedelta(days=5), timedelta(days=1)])
+
+    statements = []
+    connection.set_trace_callback(statements.append)
+    get_postable_events(connection, {
+        "name": "TestSite",
+        "account_username": "testuser.bsky.social",
+        "update_intervals": ["30 days", "2 weeks", "5 days", "1 day"]
+    })
+    connection.set_trace_callback(None)
+    return [sql.strip() for sql in statements]
+
+def test_archive_selects_batches_with_account_start_index(connection):
+    statements = []
+    connection.set_trace_callback(statements.append)
+    archive_past_events(connection, "testuser.bsky.social")
+    connection.set_trace_callback(None)
+
+    selects = [sql.strip() for sql in statements if "SELECT id FROM events" in sql]
+    assert selects
+    for sql in selects:
+        assert "idx_events_account_start" in query_plan(connection, sql)
+
+def test_get_postable_events_uses_due_index(connection):
+    statements = trace_get_postable_events(connection)
+    selects = [sql for sql in statements if sql.startswith("SELECT") and "FROM publication_schedule" in sql]
+    assert selects
+    for sql in selects:
+        assert "idx_publication_schedule_due" in query_plan(connection, sql)
+
+def test_due_schedule_query_uses_due_index(connection):
+    plan = query_plan(
+        connection,
+        "SELECT id, event_id FROM publication_schedule WHERE is_posted = 0 AND scheduled_ts <= ?",
+        (now_epoch(),)
+    )
+    assert "idx_publication_schedule_due" in plan
+
+def test_schedule_by_event_uses_event_index(connection):
+    plan = query_plan(
+        connection,
+        "SELECT id FROM publication_schedule WHERE event_id = ?",
+        (1,)
+    )
+    assert "idx_publication_schedule_event" in plan
+
+def migrate_to(connection, version):
+    for migration_version, description, migration in MIGRATIONS:
+        if migration_version <= version:
+            migration(connection)
+    connection.execute(f"PRAGMA user_version = {version}")
+    connection.commit()
+
+def test_backfill_schedules_existing_events_and_respects_last_posted():
+    connection = sqlite3.connect(":memory:")
+    connection.row_factory = sqlite3.Row
+    migrate_to(connection, 3)
+
+    now = datetime.now()
+    cursor = connection.execute('''
+        INSERT INTO events (title, start_date, end_date, url, published, account_username, config_name, last_posted)
+        VALUES (?, ?, ?, ?, 0, ?, ?, ?)
+    ''', (
+        "Existing Event", (now + timedelta(days=10)).isoformat(), (now + timedelta(days=10)).isoformat(),
+        "http://example.com/existing", "testuser.bsky.social", "TestConfig",
+        (now - timedelta(days=1)).isoformat()
+    ))
+    event_id = cursor.lastrowid
+    connection.commit()
+
+    migrate_database(connection)
+
+    rows = connection.execute(
+        "SELECT scheduled_ts, is_posted FROM publication_schedule WHERE event_id = ? ORDER BY scheduled_ts",
+        (event_id,)
+    ).fetchall()
+    assert len(rows) == 4
+    # 30 days and 2 weeks were covered by the last post, 5 days and 1 day are still pending
+    assert [row['is_posted'] for row in rows] == [1, 1, 0, 0]
+    connection.close()
+
+def test_epoch_migration_converts_iso_text_with_source_timezone():
+    connection = sqlite3.connect(":memory:")
+    connection.row_factory = sqlite3.Row
+    migrate_to(connection, 4)
+    connection.execute('''
+        INSERT INTO events (title, start_date, end_date, url, published, account_username, config_name, last_posted)
+        VALUES ('Concert', '2025-07-04T19:00:00', '2025-07-04T21:00:00', 'http://example.com/concert', 0,
+                'testuser.bsky.social', 'TestConfig', '2025-07-01T12:00:00')
+    ''')
+    connection.execute('''
+        INSERT INTO publication_schedule (event_id, scheduled_time, interval, is_posted)
+        VALUES (1, '2025-07-03T19:00:00', '1 day, 0:00:00', 0)
+    ''')
+    connection.commit()
+
+    migrate_database(connection)
+
+    event = connection.execute("SELECT * FROM events").fetchone()
+    # 19:00 CDT is 00:00 UTC the next day
+    assert event['start_ts'] == to_epoch(datetime(2025, 7, 5, 0, 0, tzinfo=timezone.utc))
+    assert event['source_tz'] == DEFAULT_SOURCE_TZ
+    assert event['last_posted_ts'] == to_epoch(datetime(2025, 7, 1, 12, 0))
+    schedule = connection.execute("SELECT * FROM publication_schedule").fetchone()
+    assert schedule['scheduled_ts'] == event['start_ts'] - 86400
+    assert "idx_events_account_start" in query_plan(
+        connection, "SELECT id FROM events WHERE account_username = ? AND start_ts < ?", ("x", 0)
+    )
+    connection.close()
@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+from src.bluesky import auth
+from src.bluesky.engine import PostingEngine
+from src.bluesky.rate_limiter import RateLimiter
+from src.database.db_manager import connect_to_db
+from src.database.migrations import migrate_database
+from src.scripts.benchmark_posting import make_due_events, timed_client_factory, run_benchmark
+from src.scripts.mock_pds import MockPDS
+
+ACCOUNT = "alice.test"
+ACCOUNTS = {ACCOUNT: {"username": ACCOUNT, "password": "secret"}}
+
+@pytest.fixture
+def connection(tmp_path):
+    connection = connect_to_db(str(tmp_path / "events.db"))
+    migrate_database(connection)
+    yield connection
+    connection.close()
+
+def outbox_status(connection):
+    return [row[0] for row in connection.execute("SELECT status FROM post_outbox ORDER BY id")]
+
+def test_authenticated_engine_posts_and_reuses_the_saved_session(connection, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with MockPDS(passwords={ACCOUNT: "secret"}) as pds:
+        monkeypatch.setattr(auth, "PDS_URL", pds.url)
+        events = make_due_events(connection, [ACCOUNT], 4)
+        for batch in (events[:2], events[2:]):
+            results = asyncio.run(PostingEngine(connection, ACCOUNTS, client_factory=auth.authenticate_async).run(batch))
+            assert results["posted"] == 2
+
+        assert pds.stats[("com.atproto.server.createSession", 200)] == 1
+        records = pds.records(pds.did_for(ACCOUNT))
+        assert len(records) == 4
+        uris = [row[0] for row in connection.execute("SELECT uri FROM post_outbox ORDER BY id")]
+        assert [uri.rsplit("/", 1)[-1] for uri in uris] == sorted(records)
+
+def test_short_lived_access_tokens_are_refreshed(connection):
+    with MockPDS(access_ttl=60) as pds:
+        events = make_due_events(connection, [ACCOUNT], 3)
+        results = asyncio.run(PostingEngine(
+            connection, ACCOUNTS, client_factory=timed_client_factory(pds.url, [])
+        ).run(events))
+        assert results["posted"] == 3
+        assert pds.stats[("com.atproto.server.refreshSession", 200)] >= 3
+        assert pds.stats[("com.atproto.server.createSession", 200)] == 1
+
+def test_exhausted_write_budget_defers_the_rest_of_the_queue(connection, monkeypatch):
+    monkeypatch.setattr("src.bluesky.engine.retry_delay", lambda attempt: 0)
+    with MockPDS(write_limit=(6, 3600)) as pds:
+        events = make_due_events(connection, [ACCOUNT], 5)
+        engine = PostingEngine(
+            connection, ACCOUNTS, client_factory=timed_client_factory(pds.url, []), limiter=RateLimiter(max_wait=5)
+        )
+        results = asyncio.run(engine.run(events))
+        assert (results["posted"], results["deferred"]) == (2, 3)
+        # The ratelimit-remaining header of the second post already stops the third
+        assert pds.stats[("com.atproto.repo.createRecord", 429)] == 0
+        assert outbox_status(connection) == ["posted", "posted"]
+
+def test_lost_responses_are_recovered_without_posting_twice(connection):
+    with MockPDS(drop_rate=1.0) as pds:
+        events = make_due_events(connection, [ACCOUNT], 3)
+        factory = timed_client_factory(pds.url, [])
+        results = asyncio.run(PostingEngine(connection, ACCOUNTS, client_factory=factory).run(events))
+        assert results["failed"] == 3
+        assert outbox_status(connection) == ["pending"] * 3
+
+        # The next run starts after the claims have expired, and the responses come through again
+        connection.execute("UPDATE post_outbox SET intent_ts = intent_ts - 3600")
+        connection.execute("UPDATE publication_schedule SET claimed_ts = claimed_ts - 3600")
+        connection.commit()
+        pds.drop_rate = 0.0
+        results = asyncio.run(PostingEngine(connection, ACCOUNTS, client_factory=factory).run(events))
+
+        assert results["posted"] == 0 and results["skipped"] == 3
+        assert outbox_status(connection) == ["posted"] * 3
+        assert len(pds.records(pds.did_for(ACCOUNT))) == 3
+        assert pds.stats[("com.atproto.repo.createRecord", 502)] == 3
+
+def test_benchmark_reports_throughput_and_latency(connection):
+    with MockPDS(latency=0.01) as pds:
+        report = run_benchmark(connection, pds, accounts=2, count=5, max_in_flight=2)
+    assert report["posts"] == 10 and report["requests"] == 10
+    assert report["posts_per_second"] > 0 and 10 <= report["p50_ms"] <= report["p99_ms"]
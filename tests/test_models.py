@@ -1,9 +1,11 @@
 import pytest
-from datetime import datetime
-from sqlalchemy import create_engine
+import sqlite3
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, text
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker
 from src.database.models import Base, Event, PublicationSchedule
+from src.database.migrations import migrate_database
 
 # Fixture to create an in-memory SQLite database and initialize tables.
 @pytest.fixture(scope="module")
@@ -29,8 +31,9 @@ def test_create_event(session):
     # Create an Event instance using datetime objects.
     event = Event(
         title="Test Event",
-        start_date=datetime.strptime("2023-01-01 10:00:00", "%Y-%m-%d %H:%M:%S"),
-        end_date=datetime.strptime("2023-01-01 11:00:00", "%Y-%m-%d %H:%M:%S"),
+        start_ts=datetime(2023, 1, 1, 10, 0, tzinfo=timezone.utc),
+        end_ts=datetime(2023, 1, 1, 11, 0, tzinfo=timezone.utc),
+        source_tz="UTC",
         url="http://example.com/event",
         description="This is a test event.",
         location="Test Location",
@@ -48,17 +51,18 @@ def test_create_event(session):
     result = session.query(Event).filter_by(title="Test Event").first()
     assert result is not None
     assert result.title == "Test Event"
-    assert result.start_date == datetime.strptime("2023-01-01 10:00:00", "%Y-%m-%d %H:%M:%S")
-    assert result.end_date == datetime.strptime("2023-01-01 11:00:00", "%Y-%m-%d %H:%M:%S")
+    assert result.start_ts == datetime(2023, 1, 1, 10, 0, tzinfo=timezone.utc)
+    assert result.end_ts == datetime(2023, 1, 1, 11, 0, tzinfo=timezone.utc)
     assert result.url == "http://example.com/event"
     assert result.published is False
 
 def test_event_unique_constraint(session):
-    # Create first event with unique key (title, start_date, url).
+    # Create first event with unique key (title, start_ts, url).
     event1 = Event(
         title="Unique Event",
-        start_date=datetime.strptime("2023-01-02 10:00:00", "%Y-%m-%d %H:%M:%S"),
-        end_date=datetime.strptime("2023-01-02 11:00:00", "%Y-%m-%d %H:%M:%S"),
+        start_ts=datetime(2023, 1, 2, 10, 0, tzinfo=timezone.utc),
+        end_ts=datetime(2023, 1, 2, 11, 0, tzinfo=timezone.utc),
+        source_tz="UTC",
         url="http://unique.com/event",
         description="First instance",
         location="Loc1",
@@ -72,11 +76,12 @@ def test_event_unique_constraint(session):
     session.add(event1)
     session.commit()
 
-    # Create a second event with the same title, start_date and url.
+    # Create a second event with the same title, start_ts and url.
     event2 = Event(
         title="Unique Event",  # Same title
-        start_date=datetime.strptime("2023-01-02 10:00:00", "%Y-%m-%d %H:%M:%S"),  # Same start_date
-        end_date=datetime.strptime("2023-01-02 12:00:00", "%Y-%m-%d %H:%M:%S"),
+        start_ts=datetime(2023, 1, 2, 10, 0, tzinfo=timezone.utc),  # Same start_ts
+        end_ts=datetime(2023, 1, 2, 12, 0, tzinfo=timezone.utc),
+        source_tz="UTC",
         url="http://unique.com/event",  # Same url
         description="Second instance",
         location="Loc2",
@@ -97,9 +102,9 @@ def test_publication_schedule(session):
     # Create a PublicationSchedule instance.
     schedule = PublicationSchedule(
         event_id=1,
-        scheduled_time=datetime.strptime("2023-01-05 10:00:00", "%Y-%m-%d %H:%M:%S"),
-        account_username="user@example.com",
-        is_executed=False
+        scheduled_ts=datetime(2023, 1, 5, 10, 0, tzinfo=timezone.utc),
+        interval="1 day, 0:00:00",
+        is_posted=False
     )
     session.add(schedule)
     session.commit()
@@ -108,6 +113,32 @@ def test_publication_schedule(session):
     result = session.query(PublicationSchedule).filter_by(event_id=1).first()
     assert result is not None
     assert result.event_id == 1
-    assert result.scheduled_time == datetime.strptime("2023-01-05 10:00:00", "%Y-%m-%d %H:%M:%S")
-    assert result.account_username == "user@example.com"
-    assert result.is_executed is False
\ No newline at end of file
+    assert result.scheduled_ts == datetime(2023, 1, 5, 10, 0, tzinfo=timezone.utc)
+    assert result.interval == "1 day, 0:00:00"
+    assert result.is_posted is False
+    assert result.claimed_ts is None
+
+def test_epoch_columns_store_integers(session):
+    event = Event(
+        title="Epoch Event",
+        start_ts=datetime(2023, 1, 3, 10, 0, tzinfo=timezone.utc),
+        end_ts=datetime(2023, 1, 3, 11, 0, tzinfo=timezone.utc),
+        source_tz="UTC",
+        url="http://example.com/epoch",
+        published=False,
+        account_username="user@example.com",
+        config_name="TestConfig"
+    )
+    session.add(event)
+    session.commit()
+
+    raw = session.execute(text("SELECT start_ts FROM events WHERE title = 'Epoch Event'")).scalar()
+    assert raw == 1672740000
+
+def test_models_mirror_the_migrated_schema():
+    connection = sqlite3.connect(":memory:")
+    migrate_database(connection)
+    for name, table in Base.metadata.tables.items():
+        columns = {row[1] for row in connection.execute(f"PRAGMA table_info({name})")}
+        assert columns == set(table.columns.keys()), name
+    connection.close()
@@ -45,4 +45,10 @@ def test_initialize_driver_failure(monkeypatch):
     # Wrap scraper instantiation in pytest.raises since __init__ calls initialize_driver.
     with pytest.raises(Exception) as exc_info:
         scraper = OshkoshScraper(config, test_run=True)
-    assert "Chrome driver error" in str(exc_info.value)
\ No newline at end of file
+    assert "Chrome driver error" in str(exc_info.value)
+
+def test_source_id_is_the_numeric_event_id(monkeypatch):
+    monkeypatch.setattr(webdriver, "Chrome", DummyDriver)
+    scraper = OshkoshScraper({"url": "https://www.visitoshkosh.com/events/"})
+    assert scraper.source_id("https://www.visitoshkosh.com/event/sawdust-days/123456/") == "123456"
+    assert scraper.source_id("https://www.visitoshkosh.com/event/no-id/") == "/event/no-id"
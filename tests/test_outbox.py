@@ -0,0 +1,95 @@
+import asyncio
+import httpx
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from src.bluesky.engine import PostingEngine
+from src.bluesky.outbox import next_tid, TID_ALPHABET
+from src.database.db_manager import connect_to_db, add_post_intent, claim_scheduled_post
+from src.database.migrations import migrate_database
+from tests.test_engine import ACCOUNTS, FakeClient, due_events, unposted
+
+def outbox(connection):
+    return [tuple(row) for row in connection.execute("SELECT rkey, status, uri, cid FROM post_outbox ORDER BY id")]
+
+def test_record_keys_are_unique_and_sortable():
+    keys = [next_tid() for _ in range(1000)]
+    assert sorted(keys) == keys and len(set(keys)) == 1000
+    assert all(len(key) == 13 and set(key) <= set(TID_ALPHABET) for key in keys)
+
+def test_posts_are_stored_with_uri_and_cid_in_few_commits(tmp_path):
+    connection = connect_to_db(str(tmp_path / "events.db"), profile=True)
+    migrate_database(connection)
+    events = due_events(connection, "alice.bsky.social", 10)
+    commits_before = connection.profiler.commits
+    sent, records = [], {}
+
+    async def factory(username, password):
+        return FakeClient(username, sent, delay=0.01, records=records)
+
+    engine = PostingEngine(connection, ACCOUNTS, max_in_flight=5, client_factory=factory)
+    assert asyncio.run(engine.run(events))["posted"] == 10
+    assert outbox(connection) == [(rkey, "posted", record.uri, record.cid) for rkey, record in sorted(records.items())]
+    assert unposted(connection) == 0
+    # Claims, intents and completions of ten posts, three commits each before
+    assert engine.commits < 20
+    # and no operation run by the writer commits on its own
+    assert connection.profiler.commits - commits_before == engine.commits
+    connection.close()
+
+def test_pending_intents_are_reconciled_before_posting(tmp_path):
+    connection = connect_to_db(str(tmp_path / "events.db"))
+    migrate_database(connection)
+    created, lost = due_events(connection, "alice.bsky.social", 2)
+    crashed_at = datetime.now() - timedelta(minutes=20)
+    records = {}
+    # A run crashed after creating the first post but before recording it,
+    # and before sending the second one
+    for event in (created, lost):
+        claim_scheduled_post(connection, event.schedule_id, crashed_at)
+    created_key, lost_key = next_tid(), next_tid()
+    add_post_intent(connection, created, created_key, crashed_at)
+    add_post_intent(connection, lost, lost_key, crashed_at)
+    records[created_key] = SimpleNamespace(uri=f"at://did:plc:ali/app.bsky.feed.post/{created_key}", cid="cid-created")
+    sent = []
+
+    async def factory(username, password):
+        return FakeClient(username, sent, delay=0, records=records)
+
+    results = asyncio.run(PostingEngine(connection, ACCOUNTS, client_factory=factory).run([created, lost]))
+
+    assert results["posted"] == 1 and results["skipped"] == 1
+    assert sent == [("alice.bsky.social", "ali 1")]
+    rows = outbox(connection)
+    assert rows[0] == (created_key, "posted", records[created_key].uri, "cid-created")
+    assert [row[1] for row in rows[1:]] == ["posted"] and lost_key not in [row[0] for row in rows]
+    assert unposted(connection) == 0
+    connection.close()
+
+class DroppingClient(FakeClient):
+    async def create(self, repo, record, rkey=None):
+        if record.text.startswith("ali 0"):
+            raise httpx.ReadTimeout("no response")
+        return await super().create(repo, record, rkey)
+
+def test_only_unanswered_posts_keep_their_intent(tmp_path):
+    connection = connect_to_db(str(tmp_path / "events.db"))
+    migrate_database(connection)
+    events = due_events(connection, "alice.bsky.social", 3)
+    sent = []
+
+    async def factory(username, password):
+        return DroppingClient(username, sent, delay=0, fail=("ali 1",))
+
+    results = asyncio.run(PostingEngine(connection, ACCOUNTS, client_factory=factory).run(events))
+
+    assert results["posted"] == 1 and results["failed"] == 2
+    # The timed out post may exist, so it stays claimed until a later run looks for it
+    assert [row[1] for row in outbox(connection)] == ["pending", "posted"]
+    claimed = connection.execute(
+        "SELECT claimed_ts IS NOT NULL FROM publication_schedule WHERE id = ?", (events[0].schedule_id,)
+    ).fetchone()[0]
+    released = connection.execute(
+        "SELECT claimed_ts IS NULL FROM publication_schedule WHERE id = ?", (events[1].schedule_id,)
+    ).fetchone()[0]
+    assert claimed and released
+    connection.close()
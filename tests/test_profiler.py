@@ -0,0 +1,72 @@
+import logging
+from datetime import datetime, timedelta
+from src.database.db_manager import connect_to_db, add_event, schedule_event_posts, get_postable_events
+from src.database.migrations import migrate_database
+from src.database.profiler import fingerprint, ProfiledConnection, log_profile
+
+WEBSITE_CONFIG = {
+    "name": "TestSite",
+    "account_username": "testuser.bsky.social",
+    "update_intervals": ["5 days", "1 day"]
+}
+
+def test_fingerprint_groups_literals_and_in_lists():
+    assert fingerprint("SELECT * FROM events\n  WHERE id = 42 AND title = 'It''s'") == \
+        "SELECT * FROM events WHERE id = ? AND title = ?"
+    assert fingerprint("DELETE FROM events WHERE id IN (?, ?, ?)") == fingerprint("DELETE FROM events WHERE id IN (?)")
+    assert fingerprint("SELECT * FROM idx_events_2") == "SELECT * FROM idx_events_2"
+
+def test_connect_to_db_profiles_only_when_asked(tmp_path, monkeypatch):
+    monkeypatch.delenv("DB_PROFILE", raising=False)
+    plain = connect_to_db(str(tmp_path / "plain.db"))
+    assert not isinstance(plain, ProfiledConnection)
+    plain.close()
+
+    monkeypatch.setenv("DB_PROFILE", "TRUE")
+    profiled = connect_to_db(str(tmp_path / "profiled.db"))
+    assert isinstance(profiled, ProfiledConnection)
+    profiled.close()
+
+def test_profiler_records_statements_rows_and_commits(tmp_path):
+    connection = connect_to_db(str(tmp_path / "events.db"), profile=True)
+    migrate_database(connection)
+    start = datetime.now() + timedelta(days=3)
+    for i in range(3):
+        event_id = add_event(
+            connection, f"Event {i}", start, start, f"http://example.com/{i}", "", "", "", "", "", "",
+            "testuser.bsky.social", "TestConfig"
+        )
+        schedule_event_posts(connection, event_id, start, [timedelta(days=5), timedelta(days=1)])
+    assert len(get_postable_events(connection, WEBSITE_CONFIG)) == 3
+
+    profiler = connection.profiler
+    summary = {row['sql']: row for row in profiler.summary()}
+    inserts = [row for sql, row in summary.items() if sql.startswith("INSERT INTO events (")]
+    assert len(inserts) == 1 and inserts[0]['count'] == 3
+    due = next(row for sql, row in summary.items() if "MAX(ps.scheduled_ts)" in sql)
+    assert due['rows'] == 3
+    assert due['count'] == 1 and due['p95_ms'] == due['total_ms'] > 0
+    assert profiler.commits >= 6
+    connection.close()
+
+def test_slow_statement_logs_query_plan(tmp_path, caplog):
+    connection = connect_to_db(str(tmp_path / "events.db"), profile=True)
+    migrate_database(connection)
+    connection.profiler.slow_ms = 0
+
+    with caplog.at_level(logging.WARNING, logger="src.database.profiler"):
+        connection.execute("SELECT id FROM events WHERE account_username = ? AND start_ts < ?", ("user", 0)).fetchall()
+        connection.execute("SELECT id FROM events WHERE account_username = ? AND start_ts < ?", ("user", 1)).fetchall()
+
+    slow = [record.message for record in caplog.records if "Slow statement" in record.message]
+    assert len(slow) == 1
+    assert "idx_events_account_start" in slow[0]
+    connection.close()
+
+def test_log_profile_prints_summary_table(tmp_path, caplog):
+    connection = connect_to_db(str(tmp_path / "events.db"), profile=True)
+    connection.execute("SELECT 1").fetchall()
+    with caplog.at_level(logging.INFO, logger="src.database.profiler"):
+        log_profile(connection)
+    assert "p95 ms" in caplog.text and "commits" in caplog.text
+    connection.close()
@@ -0,0 +1,62 @@
+import time
+import asyncio
+import httpx
+import pytest
+from types import SimpleNamespace
+from src.bluesky.rate_limiter import TokenBucket, RateLimiter, RateLimitDeferred, endpoint_for
+
+def test_bucket_reserves_in_order_and_refills():
+    bucket = TokenBucket(10, 10, now=0)
+    assert bucket.reserve(10, now=0) == 0
+    assert bucket.reserve(1, now=0) == pytest.approx(1.0)
+    # The second caller waits behind the first one's debt
+    assert bucket.reserve(1, now=0) == pytest.approx(2.0)
+    assert bucket.wait_time(1, now=5) == 0
+
+def test_bucket_follows_server_headers():
+    bucket = TokenBucket(5000, 3600, now=0)
+    bucket.update(limit=5000, remaining=3, now=0)
+    assert bucket.wait_time(3, now=0) == 0
+    bucket.update(remaining=0, reset_in=120, now=0)
+    assert bucket.wait_time(1, now=0) == pytest.approx(120)
+    assert bucket.wait_time(1, now=121) == 0
+
+def test_endpoint_for():
+    assert endpoint_for("com.atproto.repo.createRecord") == "write"
+    assert endpoint_for("com.atproto.server.createSession") == "session"
+    assert endpoint_for("app.bsky.feed.getTimeline") == "api"
+
+def test_acquire_defers_without_spending():
+    limiter = RateLimiter({"write": [(6, 3600)], "api": [(3000, 300)]}, max_wait=60)
+    asyncio.run(limiter.acquire("alice", "write", 6))
+    with pytest.raises(RateLimitDeferred):
+        asyncio.run(limiter.acquire("alice", "write", 3))
+    # Other accounts have their own write budget but share the per-IP one
+    asyncio.run(limiter.acquire("bob", "write", 6))
+    assert limiter.buckets[(None, "api")][0].tokens == pytest.approx(2998, abs=0.1)
+
+def test_watch_reads_headers_of_every_response():
+    def handler(request):
+        return httpx.Response(200, json={}, headers={
+            "ratelimit-limit": "5000", "ratelimit-remaining": "9", "ratelimit-policy": "5000;w=3600",
+            "ratelimit-reset": str(int(time.time()) + 3600)
+        })
+
+    async def post():
+        client = SimpleNamespace(request=SimpleNamespace(_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))))
+        limiter.watch(client, "alice")
+        await client.request._client.post("https://pds.example/xrpc/com.atproto.repo.createRecord")
+
+    limiter = RateLimiter()
+    asyncio.run(post())
+    hourly, daily = limiter.buckets[("alice", "write")]
+    assert hourly.tokens == pytest.approx(9, abs=0.1)
+    assert daily.tokens == pytest.approx(35000, abs=0.1)
+
+def test_watching_a_client_again_keeps_one_hook():
+    client = SimpleNamespace(request=SimpleNamespace(_client=httpx.AsyncClient()))
+    first, second = RateLimiter(), RateLimiter()
+    for limiter in (first, first, second):
+        limiter.watch(client, "alice")
+    hooks = client.request._client.event_hooks["response"]
+    assert len(hooks) == 1
@@ -0,0 +1,36 @@
+import sqlite3
+import pytest
+from src.database.records import EVENT_COLUMNS, event_factory, event_from_mapping
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:")
+    connection.execute(f"CREATE TABLE events ({EVENT_COLUMNS}, extra)")
+    connection.execute(
+        "INSERT INTO events VALUES (1, 'Title', 100, 200, 'UTC', 'http://example.com', 'Description', "
+        "'Location', 'Address', 'City', 'Region', '#tag', 0, 'user', 'Config', NULL, NULL, '123456', NULL, NULL, NULL, 'ignored')"
+    )
+    yield connection
+    connection.close()
+
+def test_event_factory_maps_columns_by_name(connection):
+    cursor = connection.execute("SELECT url, title, id, extra FROM events")
+    event = event_factory(cursor)(cursor.fetchone())
+    assert (event.id, event.title, event.url) == (1, 'Title', 'http://example.com')
+    assert event.start_ts is None
+    assert event.schedule_id is None
+
+def test_event_factory_is_cached_per_query_shape(connection):
+    first = connection.execute(f"SELECT {EVENT_COLUMNS} FROM events")
+    second = connection.execute(f"SELECT {EVENT_COLUMNS} FROM events")
+    assert event_factory(first) is event_factory(second)
+    assert event_factory(first)(first.fetchone()).hashtags == '#tag'
+
+def test_event_records_are_compact_and_immutable(connection):
+    cursor = connection.execute(f"SELECT {EVENT_COLUMNS} FROM events")
+    event = event_factory(cursor)(cursor.fetchone())
+    assert not hasattr(event, '__dict__')
+    with pytest.raises(AttributeError):
+        event.title = 'Changed'
+    assert event._replace(title='Changed').title == 'Changed'
+    assert event_from_mapping(event._asdict()) == event
@@ -0,0 +1,132 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from src.database.db_manager import INTERVAL_MAP, CLAIM_TIMEOUT
+from src.database.repository import SQLiteRepository, SQLAlchemyRepository, open_repository
+
+ACCOUNT = "testuser.bsky.social"
+INTERVALS = [INTERVAL_MAP["5 days"], INTERVAL_MAP["1 day"]]
+
+# Every backend must pass the same contract
+@pytest.fixture(params=["sqlite3", "sqlalchemy"])
+def repository(request, tmp_path):
+    path = str(tmp_path / "events.db")
+    database = f"sqlite:///{path}" if request.param == "sqlalchemy" else path
+    repository = open_repository(database)
+    yield repository
+    repository.close()
+
+def make_event(title, start, account=ACCOUNT, url=None):
+    return {
+        'title': title,
+        'start_date': start,
+        'end_date': start + timedelta(hours=2),
+        'source_tz': 'America/Chicago',
+        'url': url or f"http://example.com/{title.replace(' ', '-').lower()}",
+        'description': f"{title} description",
+        'location': 'Location',
+        'address': 'Address',
+        'city': 'City',
+        'region': 'Region',
+        'hashtags': '#test',
+        'account_username': account,
+        'config_name': 'TestConfig'
+    }
+
+def test_open_repository_selects_backend(tmp_path):
+    sqlite_repository = open_repository(str(tmp_path / "a.db"))
+    sqlalchemy_repository = open_repository(f"sqlite:///{tmp_path / 'b.db'}")
+    assert isinstance(sqlite_repository, SQLiteRepository)
+    assert isinstance(sqlalchemy_repository, SQLAlchemyRepository)
+    sqlite_repository.close()
+    sqlalchemy_repository.close()
+
+def test_add_events_skips_existing(repository):
+    start = datetime.now() + timedelta(days=10)
+    first = repository.add_events([make_event("Concert", start), make_event("Play", start)], INTERVALS)
+    second = repository.add_events([make_event("Concert", start), make_event("Fair", start)], INTERVALS)
+
+    assert len(first) == 2
+    assert len(second) == 1
+    assert repository.count_events() == 3
+    assert repository.count_events(ACCOUNT) == 3
+    assert repository.count_events("other.bsky.social") == 0
+
+def test_add_events_skips_existing_source_id(repository):
+    start = datetime.now() + timedelta(days=10)
+    first = dict(make_event("Concert", start), source_id="123456")
+    renamed = dict(make_event("Concert (moved)", start + timedelta(days=1)), source_id="123456")
+
+    assert len(repository.add_events([first], INTERVALS)) == 1
+    assert repository.add_events([renamed], INTERVALS) == []
+    assert repository.count_events() == 1
+
+def test_get_event_returns_epoch_columns_as_utc_datetimes(repository):
+    start = datetime(2030, 7, 4, 19, 0)
+    event_id = repository.add_events([make_event("Fireworks", start)])[0]
+
+    event = repository.get_event(event_id)
+    assert event.title == "Fireworks"
+    assert event.source_tz == 'America/Chicago'
+    # 19:00 CDT is 00:00 UTC the next day
+    assert event.start_ts == datetime(2030, 7, 5, 0, 0, tzinfo=timezone.utc)
+    assert event.last_posted_ts is None
+    assert repository.get_event(event_id + 100) is None
+
+def test_get_due_posts_returns_latest_due_entry_per_event(repository):
+    now = datetime.now(timezone.utc)
+    # Both intervals are due for the first event, only "5 days" for the second
+    repository.add_events([
+        make_event("Soon", now + timedelta(hours=12)),
+        make_event("Later", now + timedelta(days=3)),
+        make_event("Far", now + timedelta(days=20)),
+    ], INTERVALS)
+
+    due = repository.get_due_posts(ACCOUNT, now)
+
+    assert [event.title for event in due] == ["Soon", "Later"]
+    assert due[0].schedule_interval == str(INTERVAL_MAP["1 day"])
+    assert due[1].schedule_interval == str(INTERVAL_MAP["5 days"])
+    assert repository.get_due_posts("other.bsky.social", now) == []
+
+def test_claim_is_exclusive_until_released_or_stale(repository):
+    now = datetime.now(timezone.utc)
+    repository.add_events([make_event("Soon", now + timedelta(hours=12))], INTERVALS)
+    schedule_id = repository.get_due_posts(ACCOUNT, now)[0].schedule_id
+
+    assert repository.claim_post(schedule_id, now)
+    assert not repository.claim_post(schedule_id, now)
+    assert repository.get_due_posts(ACCOUNT, now) == []
+
+    repository.release_post(schedule_id)
+    assert [event.schedule_id for event in repository.get_due_posts(ACCOUNT, now)] == [schedule_id]
+
+    assert repository.claim_post(schedule_id, now)
+    later = now + CLAIM_TIMEOUT + timedelta(minutes=1)
+    assert repository.claim_post(schedule_id, later)
+
+def test_complete_post_marks_superseded_entries(repository):
+    now = datetime.now(timezone.utc)
+    event_id = repository.add_events([make_event("Soon", now + timedelta(hours=12))], INTERVALS)[0]
+    schedule_id = repository.get_due_posts(ACCOUNT, now)[0].schedule_id
+
+    assert repository.claim_post(schedule_id, now)
+    repository.complete_post(schedule_id, now)
+
+    assert repository.get_due_posts(ACCOUNT, now + timedelta(minutes=1)) == []
+    assert repository.get_event(event_id).last_posted_ts == now.replace(microsecond=0)
+    assert not repository.claim_post(schedule_id, now)
+
+def test_archive_past_events_moves_events_out_of_hot_tables(repository):
+    now = datetime.now(timezone.utc)
+    repository.add_events([
+        make_event("Yesterday", now - timedelta(days=2)),
+        make_event("Last week", now - timedelta(days=7)),
+        make_event("Tomorrow", now + timedelta(days=1)),
+        make_event("Other account", now - timedelta(days=2), account="other.bsky.social"),
+    ], INTERVALS)
+
+    assert repository.archive_past_events(ACCOUNT, now, batch_size=1) == 2
+    assert repository.count_events(ACCOUNT) == 1
+    assert repository.count_events(ACCOUNT, archived=True) == 2
+    assert repository.count_events("other.bsky.social") == 1
+    assert [event.title for event in repository.get_due_posts(ACCOUNT, now)] == ["Tomorrow"]
@@ -0,0 +1,97 @@
+import json
+import pytest
+from datetime import datetime, timedelta
+from src.bluesky.templates import (
+    PostTemplate, compile_template, graphemes, grapheme_length, truncate, post_content, MAX_GRAPHEMES, MAX_BYTES
+)
+from src.database.db_manager import connect_to_db, add_event, render_event_posts, get_events
+from src.database.migrations import migrate_database
+from src.database.records import Event
+
+FAMILY = "\U0001F468‍\U0001F469‍\U0001F467"
+FLAG = "\U0001F1FA\U0001F1F8"
+
+def make_event(**fields):
+    values = dict.fromkeys(Event._fields)
+    values.update(
+        id=1, title="Concert", start_ts=datetime(2024, 7, 4, 18, 0), source_tz="UTC",
+        url="https://example.com/concert", description="An evening concert", hashtags="#music #oshkosh"
+    )
+    values.update(fields)
+    return Event(**values)
+
+@pytest.fixture
+def connection(tmp_path):
+    connection = connect_to_db(str(tmp_path / "events.db"))
+    migrate_database(connection)
+    yield connection
+    connection.close()
+
+def byte_slice(text, index):
+    return text.encode("utf-8")[index["byteStart"]:index["byteEnd"]].decode("utf-8")
+
+def test_graphemes_count_user_perceived_characters():
+    assert grapheme_length(FAMILY) == 1
+    assert grapheme_length(FLAG + FLAG) == 2
+    assert grapheme_length("café") == 4
+    assert graphemes("a\r\nb") == ["a", "\r\n", "b"]
+    # A Hangul syllable spelled with conjoining jamo is one cluster
+    assert grapheme_length("\u1100\u1161\u11a8") == 1
+    assert truncate(FAMILY * 10, 5) == FAMILY * 2 + "..."
+
+def test_default_template_links_title_and_tags_hashtags():
+    post = compile_template().render(make_event(title="Café " + FLAG))
+    assert post.text == "Café " + FLAG + " (2024-07-04 18:00) An evening concert #music #oshkosh"
+    link, music, oshkosh = post.facets
+    # Facet offsets are UTF-8 byte offsets, not character offsets
+    assert byte_slice(post.text, link["index"]) == "Café " + FLAG
+    assert link["features"][0]["uri"] == "https://example.com/concert"
+    assert byte_slice(post.text, music["index"]) == "#music"
+    assert byte_slice(post.text, oshkosh["index"]) == "#oshkosh"
+    assert oshkosh["features"][0] == {"$type": "app.bsky.richtext.facet#tag", "tag": "oshkosh"}
+
+def test_long_description_is_cut_to_exactly_the_grapheme_limit():
+    post = compile_template().render(make_event(description=FLAG * 500))
+    assert grapheme_length(post.text) == MAX_GRAPHEMES
+    assert post.text.endswith("... #music #oshkosh")
+    assert json.loads(json.dumps(post.facets))[-1]["index"]["byteEnd"] == len(post.text.encode("utf-8"))
+
+def test_byte_limit_applies_to_combining_heavy_text():
+    # Each grapheme here is a letter with fifteen combining marks, 31 bytes
+    heavy = ("a" + "́" * 15) * 200
+    post = compile_template().render(make_event(description=heavy))
+    assert len(post.text.encode("utf-8")) <= MAX_BYTES
+    assert grapheme_length(post.text) <= MAX_GRAPHEMES
+
+def test_empty_fields_leave_no_double_spaces():
+    template = PostTemplate("{title} {location} at {start:%H:%M} {hashtags}")
+    assert template.render(make_event(location="", hashtags="")).text == "Concert at 18:00"
+
+def test_unknown_fields_are_rejected():
+    with pytest.raises(ValueError):
+        PostTemplate("{title} {price}")
+
+def test_post_content_prefers_the_rendered_text():
+    event = make_event(post_text="Stored text", post_facets="[]")
+    assert post_content(event) == ("Stored text", [])
+    text, facets = post_content(make_event())
+    assert text.startswith("Concert (2024-07-04 18:00)") and len(facets) == 3
+
+def test_only_new_changed_or_retemplated_events_are_rendered(connection):
+    start = datetime.now() + timedelta(days=3)
+    for title in ("Concert", "Parade"):
+        add_event(connection, title, start, start, f"http://example.com/{title}", "Fun", "", "", "", "", "#fun",
+                  "alice.bsky.social", "TestConfig")
+    template = compile_template()
+    assert render_event_posts(connection, "TestConfig", template) == 2
+    assert render_event_posts(connection, "TestConfig", template) == 0
+
+    # A changed event is rendered again
+    add_event(connection, "Parade", start, start, "http://example.com/Parade", "More fun", "", "", "", "", "#fun",
+              "alice.bsky.social", "TestConfig")
+    assert render_event_posts(connection, "TestConfig", template) == 1
+
+    # So is every event of a site whose template changed
+    assert render_event_posts(connection, "TestConfig", compile_template("{title} {hashtags}")) == 2
+    texts = sorted(event.post_text for event in get_events(connection))
+    assert texts == ["Concert #fun", "Parade #fun"]
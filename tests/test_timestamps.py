@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta, timezone
+from src.database.db_manager import connect_to_db, add_event, get_postable_events, schedule_event_posts
+from src.database.migrations import migrate_database
+from src.database.timestamps import localize, timezone_name, to_epoch, from_epoch, iso_to_epoch
+
+def test_localize_naive_uses_source_timezone():
+    dt = localize(datetime(2025, 1, 15, 19, 0), "America/Chicago")
+    assert dt.utcoffset() == timedelta(hours=-6)
+    assert timezone_name(dt) == "America/Chicago"
+
+def test_localize_keeps_aware_datetimes():
+    dt = datetime(2025, 1, 15, 19, 0, tzinfo=timezone.utc)
+    assert localize(dt, "America/Chicago") is dt
+
+def test_epoch_round_trip_in_source_timezone():
+    ts = to_epoch(datetime(2025, 7, 4, 19, 0), "America/Chicago")
+    assert ts == to_epoch(datetime(2025, 7, 5, 0, 0, tzinfo=timezone.utc))
+    assert from_epoch(ts, "America/Chicago").strftime('%Y-%m-%d %H:%M') == "2025-07-04 19:00"
+
+def test_iso_to_epoch_handles_empty_values():
+    assert iso_to_epoch(None) is None
+    assert iso_to_epoch("2025-07-04T19:00:00", "UTC") == to_epoch(datetime(2025, 7, 4, 19, 0, tzinfo=timezone.utc))
+
+def test_connections_read_epoch_columns_as_aware_datetimes(tmp_path):
+    connection = connect_to_db(str(tmp_path / "events.db"))
+    migrate_database(connection)
+    start = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(hours=6)
+    event_id = add_event(
+        connection, "Event", start, start, "http://example.com/event", "", "", "", "", "",
+        "", "testuser.bsky.social", "TestConfig"
+    )
+    schedule_event_posts(connection, event_id, start, [timedelta(days=1)])
+
+    events = get_postable_events(connection, {
+        "name": "TestSite",
+        "account_username": "testuser.bsky.social",
+        "update_intervals": ["1 day"]
+    })
+
+    assert events[0].start_ts == start
+    assert events[0].source_tz == "UTC"
+    connection.close()